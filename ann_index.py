@@ -0,0 +1,281 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from search_engine import VectorSearchEngine, normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# hnswlib ships with chroma-hnswlib, which setup_vectordb.py already pulls in
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - optional dependency
+    hnswlib = None
+
+INDEX_META_FILE = "index_meta.json"
+
+
+class ExactIndex(VectorSearchEngine):
+    """Brute-force backend; the reference every approximate index is measured against."""
+
+    backend = "exact"
+
+    def set_search_params(self, **params):
+        pass
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.matrix)
+        _write_meta(path, self.backend, len(self), self.dimension, {})
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(os.path.join(path, "vectors.npy")), normalized=True)
+
+
+class HNSWIndex:
+    """Hierarchical navigable small world graph over inner product of unit vectors."""
+
+    backend = "hnsw"
+
+    def __init__(self, embeddings=None, M=16, ef_construction=200, ef_search=64, normalized=False):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for the HNSW backend (pip install chroma-hnswlib)")
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        # ef is a setting of the shared index, so changing it must not race other threads' queries
+        self._ef_lock = threading.Lock()
+        if embeddings is not None:
+            self.build(embeddings if normalized else normalize_rows(embeddings))
+
+    def build(self, matrix):
+        count, dimension = matrix.shape
+        self.index = hnswlib.Index(space="ip", dim=dimension)
+        self.index.init_index(max_elements=max(count, 1), ef_construction=self.ef_construction, M=self.M)
+        self.index.add_items(matrix, np.arange(count))
+        self.index.set_ef(self.ef_search)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    @property
+    def dimension(self):
+        return self.index.dim
+
+    def set_search_params(self, ef_search=None, **params):
+        if ef_search is not None:
+            with self._ef_lock:
+                self.ef_search = ef_search
+                self.index.set_ef(ef_search)
+
+    def search(self, query_embedding, top_k=5):
+        indices, scores = self.search_batch(query_embedding, top_k)
+        return indices[0], scores[0]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        queries = normalize_rows(query_embeddings)
+        top_k = min(top_k, len(self))
+        if top_k == 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if self.ef_search >= top_k:
+            labels, distances = self.index.knn_query(queries, k=top_k)
+        else:
+            # ef must be at least k or hnswlib refuses the query. A raised ef only widens the search of
+            # other queries running meanwhile, and raises are serialized so none is undone mid-query
+            with self._ef_lock:
+                self.index.set_ef(top_k)
+                try:
+                    labels, distances = self.index.knn_query(queries, k=top_k)
+                finally:
+                    self.index.set_ef(self.ef_search)
+        # hnswlib reports inner-product distance as 1 - similarity
+        return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.index.save_index(os.path.join(path, "hnsw.bin"))
+        _write_meta(path, self.backend, len(self), self.dimension, {
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+        })
+
+    @classmethod
+    def load(cls, path, ef_search=None):
+        meta = read_meta(path)
+        params = meta["params"]
+        instance = cls(M=params["M"], ef_construction=params["ef_construction"],
+                       ef_search=ef_search or params["ef_search"])
+        instance.index = hnswlib.Index(space="ip", dim=meta["dimension"])
+        instance.index.load_index(os.path.join(path, "hnsw.bin"), max_elements=meta["count"])
+        instance.index.set_ef(instance.ef_search)
+        return instance
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse quantizer, scanning only the nprobe closest lists."""
+
+    backend = "ivf"
+
+    def __init__(self, embeddings=None, nlist=None, nprobe=8, train_iterations=20, seed=0, normalized=False):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        if embeddings is not None:
+            self.build(embeddings if normalized else normalize_rows(embeddings))
+
+    def build(self, matrix):
+        count = matrix.shape[0]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(count)))
+        self.nlist = min(nlist, max(count, 1))
+        self.centroids = self._train_centroids(matrix)
+        assignments = np.argmax(matrix @ self.centroids.T, axis=1) if count else np.empty(0, dtype=np.int64)
+        # Store vectors grouped by list so each probe is one contiguous slice
+        self.ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        self.vectors = np.ascontiguousarray(matrix[self.ids])
+        self.offsets = np.searchsorted(assignments[self.ids], np.arange(self.nlist + 1)).astype(np.int64)
+
+    def _train_centroids(self, matrix):
+        rng = np.random.default_rng(self.seed)
+        if matrix.shape[0] == 0:
+            return np.zeros((1, matrix.shape[1]), dtype=np.float32)
+        sample = matrix[rng.choice(matrix.shape[0], size=min(matrix.shape[0], 256 * self.nlist), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=self.nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(self.nlist):
+                members = sample[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.sum(axis=0)
+        # Spherical k-means: centroids live on the unit sphere like the data
+        return normalize_rows(centroids)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dimension(self):
+        return self.vectors.shape[1]
+
+    def set_search_params(self, nprobe=None, **params):
+        if nprobe is not None:
+            self.nprobe = nprobe
+
+    def search(self, query_embedding, top_k=5):
+        query = normalize_rows(query_embedding)[0]
+        nprobe = min(self.nprobe, self.nlist)
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        slices = [np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes]
+        rows = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        scores = self.vectors[rows] @ query
+        best = top_k_indices(scores, top_k)
+        return self.ids[rows[best]], scores[best]
+
+    # A query whose probed lists hold fewer than top_k vectors has its row padded with index -1
+    # and score -inf, so the other queries in the batch keep all their results
+    def search_batch(self, query_embeddings, top_k=5):
+        results = [self.search(query, top_k) for query in normalize_rows(query_embeddings)]
+        width = max((len(indices) for indices, _ in results), default=0)
+        indices = np.full((len(results), width), -1, dtype=np.int64)
+        scores = np.full((len(results), width), -np.inf, dtype=np.float32)
+        for row, (row_indices, row_scores) in enumerate(results):
+            indices[row, :len(row_indices)] = row_indices
+            scores[row, :len(row_scores)] = row_scores
+        return indices, scores
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "ivf.npz"), centroids=self.centroids, ids=self.ids,
+                 vectors=self.vectors, offsets=self.offsets)
+        _write_meta(path, self.backend, len(self), self.dimension, {
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+        })
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        params = read_meta(path)["params"]
+        instance = cls(nlist=params["nlist"], nprobe=nprobe or params["nprobe"])
+        with np.load(os.path.join(path, "ivf.npz")) as data:
+            instance.centroids = data["centroids"]
+            instance.ids = data["ids"]
+            instance.vectors = data["vectors"]
+            instance.offsets = data["offsets"]
+        return instance
+
+
+BACKENDS = {
+    ExactIndex.backend: ExactIndex,
+    HNSWIndex.backend: HNSWIndex,
+    IVFIndex.backend: IVFIndex,
+}
+
+
+# Cheap content hash so an index built from a different corpus of the same size is not reused
+def corpus_fingerprint(embeddings):
+    return hashlib.sha1(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _write_meta(path, backend, count, dimension, params):
+    with open(os.path.join(path, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"backend": backend, "count": count, "dimension": dimension, "params": params}, f, indent=2)
+
+
+def _stamp_fingerprint(path, fingerprint):
+    meta = read_meta(path)
+    meta["fingerprint"] = fingerprint
+    with open(os.path.join(path, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_meta(path):
+    with open(os.path.join(path, INDEX_META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Build a fresh index for the given backend name
+def build_index(backend, embeddings, **params):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+    return BACKENDS[backend](embeddings, **params)
+
+
+# Load a persisted index if it matches the corpus, otherwise build and persist a new one
+def load_or_build_index(backend, embeddings, index_dir=None, search_params=None, **build_params):
+    search_params = {k: v for k, v in (search_params or {}).items() if v is not None}
+    path = os.path.join(index_dir, backend) if index_dir else None
+    count, dimension = np.shape(embeddings)
+    # The exact backend is never persisted, so it needs no fingerprint
+    if backend == ExactIndex.backend:
+        path = None
+    fingerprint = corpus_fingerprint(embeddings) if path else None
+
+    if path and os.path.exists(os.path.join(path, INDEX_META_FILE)):
+        try:
+            meta = read_meta(path)
+            if meta.get("fingerprint") == fingerprint and meta["dimension"] == dimension:
+                index = BACKENDS[backend].load(path)
+                index.set_search_params(**search_params)
+                logger.info(f"Loaded persisted {backend} index with {count} vectors")
+                return index
+            logger.info(f"Persisted {backend} index does not match the current corpus, rebuilding")
+        except Exception as e:
+            logger.error(f"Error loading {backend} index: {str(e)}")
+
+    index = build_index(backend, embeddings, **build_params)
+    index.set_search_params(**search_params)
+    if path:
+        try:
+            index.save(path)
+            _stamp_fingerprint(path, fingerprint)
+            logger.info(f"Built and persisted {backend} index with {count} vectors")
+        except Exception as e:
+            logger.error(f"Error persisting {backend} index: {str(e)}")
+    return index
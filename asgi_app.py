@@ -0,0 +1,404 @@
+"""Asyncio serving mode for the assistant.
+
+Run with:  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+The chat routes are served natively on the event loop: the Anthropic call goes
+through AsyncAnthropic on one pooled HTTP connection pool, encoding, retrieval
+and chat store access run in thread pools, and at most LLM_MAX_IN_FLIGHT
+requests call the model at once, with a bounded wait queue. A request that
+cannot get a slot within LLM_QUEUE_TIMEOUT is answered 503. Every other route
+is the Flask app mounted as WSGI.
+"""
+import os
+import time
+import asyncio
+import logging
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import anthropic
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import nau_assistant_final as assistant
+from coalescing import AsyncSingleFlight, coalescing_key
+from resilience import async_hedged_call
+from metrics import CallbackMetric
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "32"))
+LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class InFlightLimiter:
+    """Caps concurrent model requests; callers beyond the cap wait in a bounded queue with a timeout."""
+
+    def __init__(self, max_in_flight, max_waiting, wait_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait_seconds = 0.0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise ServerBusy("Too many requests are waiting for the model")
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise ServerBusy("Timed out waiting for a free model slot")
+        finally:
+            self.waiting -= 1
+            self.total_wait_seconds += time.perf_counter() - start
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self):
+        admitted = self.completed + self.in_flight
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": 1000 * self.total_wait_seconds / admitted if admitted else 0.0,
+        }
+
+
+limiter = InFlightLimiter(LLM_MAX_IN_FLIGHT, LLM_MAX_WAITING, LLM_QUEUE_TIMEOUT)
+answer_flight = AsyncSingleFlight()
+assistant.coalescing_flights["async"] = answer_flight
+
+CallbackMetric("nau_llm_limiter_in_flight", "Model calls holding a limiter slot", lambda: limiter.in_flight)
+CallbackMetric("nau_llm_limiter_waiting", "Requests queued for a limiter slot", lambda: limiter.waiting)
+CallbackMetric("nau_llm_limiter_rejected_total", "Requests refused because the limiter queue was full",
+               lambda: limiter.rejected, kind="counter")
+CallbackMetric("nau_llm_limiter_timed_out_total", "Requests that gave up waiting for a limiter slot",
+               lambda: limiter.timed_out, kind="counter")
+CallbackMetric("nau_llm_limiter_wait_seconds_total", "Time spent waiting for limiter slots",
+               lambda: limiter.total_wait_seconds, kind="counter")
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="encode")
+http_client = None
+async_client = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global http_client, async_client
+    # One pooled connection set shared by every request on this worker
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+    async_client = anthropic.AsyncAnthropic(api_key=assistant.ANTHROPIC_API_KEY, base_url=assistant.ANTHROPIC_BASE_URL,
+                                           http_client=http_client, max_retries=0, timeout=assistant.LLM_LATENCY_BUDGET)
+    assistant.start_background_init()
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        cpu_executor.shutdown(wait=False)
+
+
+# Chat store calls can wait on SQLite (or on its writer, for a chat with queued writes), so like every
+# other blocking call they run in a thread rather than on the event loop
+async def busy_response(chat_id, message):
+    await run_in_threadpool(assistant.chat_store.pop_last, chat_id)
+    return JSONResponse({"error": message}, status_code=503, headers={"Retry-After": "5"})
+
+
+# Validate, record the user message and try the FAQ fast path; returns (chat_id, query, response)
+async def start_turn(request):
+    data = await request.json()
+    if not data.get('query'):
+        return None, None, JSONResponse({"error": "Query is required"}, status_code=400)
+    chat_id, query, follow_up_to, _ = await run_in_threadpool(assistant.begin_chat_turn, data)
+    response_data = await run_in_threadpool(assistant.answer_without_model, chat_id, query, follow_up_to)
+    if response_data:
+        return chat_id, query, response_data
+    if not assistant.ready.is_set():
+        return chat_id, query, await busy_response(chat_id, "The assistant is still starting up. Please try again in a few seconds.")
+    return chat_id, query, None
+
+
+# One model call, with its outcome recorded by the shared circuit breaker
+async def call_model(turn):
+    start = time.monotonic()
+    try:
+        message = await async_client.messages.create(
+            model=assistant.ANTHROPIC_MODEL,
+            max_tokens=assistant.MAX_ANSWER_TOKENS,
+            temperature=0,
+            system=turn["system_prompt"],
+            messages=[
+                {"role": "user", "content": turn["user_prompt"]}
+            ]
+        )
+    except Exception:
+        assistant.llm_breaker.record_failure()
+        assistant.LLM_CALLS.inc(mode="create", outcome="error")
+        raise
+    except BaseException:
+        # Cancelled at the deadline or after losing the hedge race
+        assistant.llm_breaker.abandon(time.monotonic() - start)
+        raise
+    assistant.llm_breaker.record_success(time.monotonic() - start)
+    assistant.STAGE_SECONDS.observe(time.monotonic() - start, stage="model")
+    assistant.LLM_CALLS.inc(mode="create", outcome="success")
+    return message
+
+
+# Call the model for a prepared turn within the latency budget; returns (answer, sources, from_api), or
+# raises ServerBusy when no limiter slot frees up in time
+async def generate_answer(turn):
+    if not assistant.llm_breaker.allow():
+        return assistant.fallback_answer(turn, "circuit breaker open")
+    try:
+        # The slot is taken before the latency budget starts, so a queue wait ends in ServerBusy rather than
+        # in the budget's timeout, and it is held by the request's hedged attempts together
+        async with limiter.slot():
+            logger.info("Calling Anthropic API (async)...")
+            message = await async_hedged_call(
+                lambda: call_model(turn), assistant.LLM_LATENCY_BUDGET, hedge_delay=assistant.LLM_HEDGE_DELAY,
+                max_attempts=assistant.LLM_MAX_ATTEMPTS, breaker=assistant.llm_breaker)
+    except ServerBusy:
+        # No call was made, so the probe (if this was one) goes to the next request
+        assistant.llm_breaker.abandon()
+        raise
+    except TimeoutError:
+        return assistant.fallback_answer(turn, f"no response within {assistant.LLM_LATENCY_BUDGET:.0f}s")
+    except Exception as api_error:
+        logger.error(f"Anthropic API error: {str(api_error)}")
+        return assistant.fallback_answer(turn, "API error")
+    assistant.log_usage(message.usage)
+    return message.content[0].text, turn["sources"], True
+
+
+async def chat(request):
+    try:
+        chat_id, query, early = await start_turn(request)
+        if isinstance(early, dict):
+            return JSONResponse(early)
+        if early is not None:
+            return early
+
+        # Encoding and retrieval are CPU-bound; keep them off the event loop
+        loop = asyncio.get_running_loop()
+        turn = await loop.run_in_executor(cpu_executor, assistant.prepare_model_turn, query, chat_id)
+
+        if turn["cached"]:
+            answer = turn["cached"]["answer"]
+            sources = turn["cached"]["sources"]
+            from_api = False
+            shared = False
+            logger.info(f"Using cached answer (similarity {turn['cached']['similarity']:.3f})")
+        else:
+            key = coalescing_key(query, turn["answer_context"])
+            try:
+                try:
+                    (answer, sources, from_api), shared = await answer_flight.do(
+                        key, lambda: generate_answer(turn), timeout=assistant.COALESCE_WAIT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning("Timed out waiting for an identical in-flight request, calling the API directly")
+                    (answer, sources, from_api), shared = await generate_answer(turn), False
+            except ServerBusy as e:
+                logger.warning(f"Rejecting chat request: {str(e)}")
+                return await busy_response(chat_id, "The assistant is busy right now. Please try again in a few seconds.")
+            if shared:
+                # Only the leader stores the answer in the cache
+                from_api = False
+                logger.info("Shared the answer of an identical in-flight request")
+
+        return JSONResponse(await run_in_threadpool(assistant.finish_model_turn, chat_id, query, turn, answer,
+                                                    sources, from_api, shared=shared))
+    except Exception as e:
+        logger.exception(f"Error processing query: {str(e)}")
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+
+
+async def chat_stream(request):
+    try:
+        chat_id, query, early = await start_turn(request)
+        if isinstance(early, dict):
+            async def predefined_events():
+                yield assistant.sse_event("sources", {"sources": early["sources"], "chat_id": chat_id})
+                yield assistant.sse_event("delta", {"text": early["answer"]})
+                yield assistant.sse_event("done", early)
+            return sse_response(predefined_events())
+        if early is not None:
+            return early
+
+        loop = asyncio.get_running_loop()
+        turn = await loop.run_in_executor(cpu_executor, assistant.prepare_model_turn, query, chat_id)
+    except Exception as e:
+        logger.exception(f"Error processing query: {str(e)}")
+        return JSONResponse({"error": f"Server error: {str(e)}"}, status_code=500)
+
+    async def events():
+        yield assistant.sse_event("sources", {"sources": turn["sources"], "chat_id": chat_id})
+
+        if turn["cached"]:
+            cached = turn["cached"]
+            yield assistant.sse_event("delta", {"text": cached["answer"]})
+            yield assistant.sse_event("done", await run_in_threadpool(
+                assistant.finish_model_turn, chat_id, query, turn, cached["answer"], cached["sources"], from_api=False))
+            return
+
+        # Join an identical request that is already streaming; its answer arrives in one piece
+        key = coalescing_key(query, turn["answer_context"])
+        future, leader = answer_flight.acquire(key)
+        if not leader:
+            try:
+                answer, sources, _ = await answer_flight.wait(future, assistant.COALESCE_WAIT_TIMEOUT)
+                logger.info("Shared the answer of an identical in-flight request")
+                yield assistant.sse_event("delta", {"text": answer})
+                yield assistant.sse_event("done", await run_in_threadpool(
+                    assistant.finish_model_turn, chat_id, query, turn, answer, sources, from_api=False, shared=True))
+                return
+            except Exception as e:
+                logger.warning(f"Coalesced request failed ({str(e) or type(e).__name__}), streaming directly")
+
+        parts = []
+        result = None
+        try:
+            if not assistant.llm_breaker.allow():
+                result = assistant.fallback_answer(turn, "circuit breaker open")
+                yield assistant.sse_event("delta", {"text": result[0]})
+            else:
+                # The slot is held for the whole stream, since the upstream call is in flight until it ends
+                async with limiter.slot():
+                    start = time.monotonic()
+                    first_token_seconds = None
+                    try:
+                        async with async_client.messages.stream(
+                            model=assistant.ANTHROPIC_MODEL,
+                            max_tokens=assistant.MAX_ANSWER_TOKENS,
+                            temperature=0,
+                            system=turn["system_prompt"],
+                            messages=[
+                                {"role": "user", "content": turn["user_prompt"]}
+                            ]
+                        ) as stream:
+                            async for text in stream.text_stream:
+                                if first_token_seconds is None:
+                                    first_token_seconds = time.monotonic() - start
+                                    assistant.STAGE_SECONDS.observe(first_token_seconds, stage="model_first_token")
+                                parts.append(text)
+                                yield assistant.sse_event("delta", {"text": text})
+                            assistant.log_usage((await stream.get_final_message()).usage)
+                    except Exception:
+                        assistant.llm_breaker.record_failure()
+                        assistant.LLM_CALLS.inc(mode="stream", outcome="error")
+                        raise
+                    except BaseException:
+                        # The client went away mid-stream; judged by time to first token, like a finished stream
+                        assistant.llm_breaker.abandon(
+                            first_token_seconds if first_token_seconds is not None else time.monotonic() - start)
+                        raise
+                    assistant.llm_breaker.record_success(first_token_seconds or 0.0)
+                    assistant.STAGE_SECONDS.observe(time.monotonic() - start, stage="model")
+                    assistant.LLM_CALLS.inc(mode="stream", outcome="success")
+                result = "".join(parts), turn["sources"], True
+        except ServerBusy as e:
+            assistant.llm_breaker.abandon()
+            logger.warning(f"Answering extractively: {str(e)}")
+            result = assistant.fallback_answer(turn, str(e))
+            yield assistant.sse_event("delta", {"text": result[0]})
+        except Exception as api_error:
+            logger.error(f"Anthropic API error while streaming: {str(api_error)}")
+            if parts:
+                result = "".join(parts), turn["sources"], False
+            else:
+                result = assistant.fallback_answer(turn, "API error")
+                yield assistant.sse_event("delta", {"text": result[0]})
+        finally:
+            if leader:
+                # Release followers even when this client disconnected mid-stream
+                answer_flight.complete(key, future, result=result,
+                                       error=None if result else RuntimeError("Leading stream ended early"))
+
+        answer, sources, from_api = result
+        yield assistant.sse_event("done", await run_in_threadpool(
+            assistant.finish_model_turn, chat_id, query, turn, answer, sources, from_api))
+
+    return sse_response(events())
+
+
+def sse_response(events):
+    return StreamingResponse(events, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# Request latency for the native routes; mounted Flask routes are timed by the Flask app itself
+def timed(route, handler):
+    async def endpoint(request):
+        start = time.perf_counter()
+        response = await handler(request)
+        assistant.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method,
+                                               status=response.status_code)
+        return response
+    return endpoint
+
+
+async def concurrency_metrics(request):
+    return JSONResponse(dict(limiter.stats(), cpu_workers=CPU_WORKERS, http_max_connections=HTTP_MAX_CONNECTIONS,
+                             coalescing=answer_flight.stats(), breaker=assistant.llm_breaker.stats()))
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', timed('/api/chat', chat), methods=['POST']),
+        Route('/api/chat/stream', timed('/api/chat/stream', chat_stream), methods=['POST']),
+        Route('/api/admin/concurrency', concurrency_metrics, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(assistant.app)),
+    ],
+    # Compresses the native chat routes; the Flask routes arrive already encoded and event streams are skipped
+    middleware=[Middleware(GZipMiddleware, minimum_size=assistant.COMPRESS_MIN_SIZE, compresslevel=6)],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    logger.info("Starting North American University AI Assistant (async)")
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
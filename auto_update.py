@@ -34,6 +34,7 @@ def run_scraper():
         if result.returncode == 0:
             logger.info("Scraper ran successfully")
             logger.info(f"Output: {result.stdout}")
+            precompute_answers()
         else:
             logger.error(f"Scraper failed with return code {result.returncode}")
             logger.error(f"Error: {result.stderr}")
@@ -43,6 +44,25 @@ def run_scraper():
     
     logger.info(f"Completed scheduled update at {datetime.now()}")
 
+def precompute_answers():
+    """Regenerate the precomputed answers against the refreshed knowledge base"""
+    try:
+        precompute_path = os.path.join(script_dir, "precompute_answers.py")
+        log_path = os.path.join(script_dir, "assistant.log")
+        result = subprocess.run([sys.executable, precompute_path, "--log", log_path],
+                                cwd=script_dir,
+                                capture_output=True,
+                                text=True)
+        
+        if result.returncode == 0:
+            logger.info("Precomputed answers regenerated")
+        else:
+            logger.error(f"Answer precomputation failed with return code {result.returncode}")
+            logger.error(f"Error: {result.stderr}")
+    
+    except Exception as e:
+        logger.error(f"Error precomputing answers: {str(e)}")
+
 def main():
     logger.info("Starting auto-update scheduler")
     
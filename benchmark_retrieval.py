@@ -0,0 +1,101 @@
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+
+from ann_index import build_index, hnswlib
+from embedding_store import open_store
+from quantization import build_quantized_index
+from search_engine import normalize_rows
+
+# Define paths
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+STORE_PREFIX = "na_edu"
+
+
+# Perturbed corpus rows stand in for real queries: they land near, but not on, indexed vectors
+def make_queries(matrix, count, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.choice(matrix.shape[0], size=count, replace=matrix.shape[0] < count)]
+    return normalize_rows(rows + rng.normal(scale=noise, size=rows.shape).astype(np.float32))
+
+
+def recall_at_k(approx, exact):
+    hits = sum(len(set(a).intersection(e)) for a, e in zip(approx, exact))
+    return hits / max(exact.size, 1)
+
+
+# Time single-query searches the way the request path issues them
+def measure(index, queries, top_k):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        indices, _ = index.search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(indices)
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of ANN backends against exact search")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory of the embedding store the app serves")
+    parser.add_argument("--prefix", default=STORE_PREFIX)
+    parser.add_argument("--embeddings", help="Benchmark a legacy embeddings pickle instead of the store")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--replicate", type=int, default=1,
+                        help="Tile the corpus with jitter to simulate a larger crawl")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[0, 2, 8, 32],
+                        help="Candidates re-scored with float vectors per result (0 = codes only)")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        with open(args.embeddings, "rb") as f:
+            matrix = normalize_rows(pickle.load(f))
+    else:
+        _, vectors, _ = open_store(args.data_dir, args.prefix)
+        matrix = normalize_rows(vectors)
+    if args.replicate > 1:
+        rng = np.random.default_rng(1)
+        copies = [matrix] + [matrix + rng.normal(scale=0.02, size=matrix.shape).astype(np.float32)
+                             for _ in range(args.replicate - 1)]
+        matrix = normalize_rows(np.vstack(copies))
+    queries = make_queries(matrix, args.queries, args.noise)
+    print(f"Corpus: {matrix.shape[0]} vectors x {matrix.shape[1]} dims, {len(queries)} queries, k={args.top_k}")
+
+    exact = build_index("exact", matrix, normalized=True)
+    exact_results, p50, p99 = measure(exact, queries, args.top_k)
+    exact_results = np.array(exact_results)
+    print(f"{'backend':<8} {'params':<16} {'build s':>8} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8} {'index MB':>9}")
+    print(f"{'exact':<8} {'-':<16} {'-':>8} {1.0:>8.3f} {p50:>8.3f} {p99:>8.3f} {matrix.nbytes / 1e6:>9.2f}")
+
+    configs = [("ivf", "nprobe", args.nprobe), ("int8", "rerank_factor", args.rerank_factor),
+               ("binary", "rerank_factor", args.rerank_factor)]
+    if hnswlib is not None:
+        configs.insert(0, ("hnsw", "ef_search", args.ef_search))
+    else:
+        print("hnswlib not installed, skipping HNSW")
+
+    for backend, param, values in configs:
+        start = time.perf_counter()
+        if backend in ("int8", "binary"):
+            index = build_quantized_index(backend, matrix, float_loader=lambda: matrix, normalized=True)
+            memory = f"{index.memory_bytes() / 1e6:>9.2f}"
+        else:
+            index = build_index(backend, matrix, normalized=True)
+            memory = f"{'-':>9}"
+        build_seconds = time.perf_counter() - start
+        for value in values:
+            index.set_search_params(**{param: value})
+            results, p50, p99 = measure(index, queries, args.top_k)
+            recall = recall_at_k(results, exact_results)
+            print(f"{backend:<8} {f'{param}={value}':<16} {build_seconds:>8.2f} {recall:>8.3f} {p50:>8.3f} {p99:>8.3f} {memory}")
+
+
+if __name__ == "__main__":
+    main()
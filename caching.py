@@ -0,0 +1,223 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# Collapse case and whitespace so trivially different spellings share a cache entry
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', query.lower()).strip()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry time-to-live and hit/miss/eviction counters."""
+
+    def __init__(self, max_size=1024, ttl=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires_at = self.clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class QueryEmbeddingCache:
+    """Memoizes encoder output per normalized query string in front of SentenceTransformer.encode."""
+
+    def __init__(self, encode, max_size=2048, ttl=3600):
+        self.encode = encode
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get_embedding(self, query):
+        key = normalize_query(query)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            # all-MiniLM-L6-v2 is uncased, so encoding the normalized key gives the same vector
+            embedding = self.encode([key])[0]
+            # Cached arrays are shared between requests, so make them read-only
+            embedding.setflags(write=False)
+            self.cache.put(key, embedding)
+        return embedding
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# Order-independent fingerprint of the retrieved context an answer was generated from
+def context_hash(relevant_chunks):
+    digests = sorted(hashlib.sha1(chunk["content"].encode("utf-8")).hexdigest() for chunk in relevant_chunks)
+    return hashlib.sha1("".join(digests).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """Reuses model answers for paraphrased questions that retrieved the same context.
+
+    An entry matches when its query embedding has cosine similarity of at least
+    `threshold` with the new query and it was produced from the same set of chunks
+    under the same knowledge-base version. Versions are increasing numbers (the
+    snapshot generation), so requests still finishing on an older snapshot during
+    a swap neither hit nor clear the cache.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, threshold=0.95, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._by_context = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_context.get(entry["context_hash"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[entry["context_hash"]]
+
+    # Drop everything when the knowledge base moves to a newer version; False for an older one
+    def _check_version(self, version):
+        if self.version is None or version > self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self.version = version
+        return version == self.version
+
+    def lookup(self, query_embedding, context, version):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            now = self.clock()
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_context.get(context, ())):
+                entry = self._entries[entry_id]
+                if entry["expires_at"] <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(entry["embedding"] @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            entry = self._entries[best_id]
+            return {"answer": entry["answer"], "sources": list(entry["sources"]), "similarity": best_score}
+
+    def store(self, query_embedding, context, version, answer, sources):
+        if self.max_size <= 0:
+            return
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            if not self._check_version(version):
+                return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "embedding": embedding,
+                "context_hash": context,
+                "answer": answer,
+                "sources": list(sources),
+                "expires_at": self.clock() + self.ttl if self.ttl else float("inf"),
+            }
+            self._by_context.setdefault(context, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,644 @@
+import os
+import json
+import base64
+import bisect
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 50
+
+
+# Sidebar text for a chat: its first user message, shortened
+def chat_preview(first_message):
+    return first_message[:PREVIEW_CHARS] + "..." if len(first_message) > PREVIEW_CHARS else first_message
+
+
+# Opaque /api/chats page cursor: the recency key of the last chat on the previous page
+def encode_cursor(timestamp, chat_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp, chat_id]).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, chat_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(timestamp), str(chat_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class _Chat:
+    __slots__ = ("messages", "version", "pending", "last_active", "follow_ups", "preview", "updated_at")
+
+    def __init__(self, messages, version=0, last_active=None):
+        self.messages = messages
+        self.version = version
+        self.pending = 0
+        self.last_active = last_active or time.time()
+        # follow_up_id -> the follow-up question, so a reply to it is matched without scanning the chat
+        self.follow_ups = {message["follow_up_id"]: message for message in messages if message.get("follow_up_id")}
+        self.preview = None
+        self.updated_at = None
+
+    def add(self, message):
+        self.messages.append(message)
+        if message.get("follow_up_id"):
+            self.follow_ups[message["follow_up_id"]] = message
+
+    def pop(self):
+        message = self.messages.pop()
+        if message.get("follow_up_id"):
+            self.follow_ups.pop(message["follow_up_id"], None)
+        return message
+
+
+class MemoryChatStore:
+    """Chat histories in process memory, bounded by an LRU on chats and an idle TTL.
+
+    Nothing survives a restart and each worker has its own chats; use it where
+    the filesystem is read-only or for local development. The sidebar listing
+    is served from a sorted (updated_at, chat_id) index kept up to date on
+    every write, so a page costs the same however many chats there are.
+    """
+
+    def __init__(self, max_chats=10000, ttl=None, clock=time.time):
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self.clock = clock
+        self._chats = OrderedDict()
+        # Chats with a preview as sorted (updated_at, chat_id); the newest is last
+        self._index = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, chat_id, create=False):
+        chat = self._chats.get(chat_id)
+        if chat is not None and self.ttl and self.clock() - chat.last_active > self.ttl:
+            self._drop(chat_id)
+            self.expirations += 1
+            chat = None
+        if chat is None:
+            self.misses += 1
+            if not create:
+                return None
+            chat = self._chats[chat_id] = _Chat([])
+            while len(self._chats) > self.max_chats:
+                self._drop(next(iter(self._chats)))
+                self.evictions += 1
+        else:
+            self.hits += 1
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    def _drop(self, chat_id):
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None:
+            self._unindex(chat_id, chat)
+
+    def _unindex(self, chat_id, chat):
+        if chat.preview is None:
+            return
+        position = bisect.bisect_left(self._index, (chat.updated_at, chat_id))
+        if position < len(self._index) and self._index[position] == (chat.updated_at, chat_id):
+            del self._index[position]
+
+    # Move a chat to its new place in the index after its preview or last timestamp changed
+    def _reindex(self, chat_id, chat, preview, updated_at):
+        self._unindex(chat_id, chat)
+        chat.preview, chat.updated_at = preview, updated_at
+        if preview is not None:
+            bisect.insort(self._index, (updated_at, chat_id))
+
+    def create_chat(self, chat_id):
+        with self._lock:
+            self._get(chat_id, create=True)
+
+    def append(self, chat_id, message):
+        with self._lock:
+            chat = self._get(chat_id, create=True)
+            chat.add(message)
+            chat.last_active = self.clock()
+            preview = chat.preview
+            if preview is None and message.get("role") == "user":
+                preview = chat_preview(message.get("content", ""))
+            timestamp = message.get("timestamp") or chat.last_active
+            self._reindex(chat_id, chat, preview, max(timestamp, chat.updated_at or timestamp))
+
+    # Remove the newest message (a user message whose request was turned away)
+    def pop_last(self, chat_id):
+        with self._lock:
+            chat = self._get(chat_id)
+            if chat is not None and chat.messages:
+                chat.pop()
+                first_user = next((msg for msg in chat.messages if msg.get("role") == "user"), None)
+                self._reindex(chat_id, chat, chat_preview(first_user["content"]) if first_user else None,
+                              chat.messages[-1].get("timestamp", chat.updated_at) if chat.messages else chat.updated_at)
+
+    # Copy of a chat's messages, or None for an unknown chat
+    def messages(self, chat_id):
+        with self._lock:
+            chat = self._get(chat_id)
+            return list(chat.messages) if chat is not None else None
+
+    # A chat's messages from position `start` on, with its message count; (None, 0) for an unknown chat
+    def messages_since(self, chat_id, start):
+        with self._lock:
+            chat = self._get(chat_id)
+            return (chat.messages[start:], len(chat.messages)) if chat is not None else (None, 0)
+
+    # The follow-up question with `follow_up_id` in a chat, or None
+    def follow_up(self, chat_id, follow_up_id):
+        with self._lock:
+            chat = self._get(chat_id)
+            return chat.follow_ups.get(follow_up_id) if chat is not None else None
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._drop(chat_id)
+
+    # One page of chats with at least one user message, newest first, as {"id", "preview", "timestamp"};
+    # returns (page, cursor of the next page or None)
+    def list_chats(self, limit=None, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        with self._lock:
+            # The least recently updated chats are at the front; drop the ones that have expired
+            while self.ttl and self._index and \
+                    self.clock() - self._chats[self._index[0][1]].last_active > self.ttl:
+                self._drop(self._index[0][1])
+                self.expirations += 1
+            end = bisect.bisect_left(self._index, position) if position else len(self._index)
+            start = max(0, end - limit) if limit else 0
+            page = self._index[start:end]
+            summaries = [{"id": chat_id, "preview": self._chats[chat_id].preview, "timestamp": updated_at}
+                         for updated_at, chat_id in reversed(page)]
+        return summaries, encode_cursor(*page[0]) if start > 0 and page else None
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "size": len(self._chats),
+                "max_size": self.max_chats,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    preview TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chats_by_recency ON chats (updated_at, chat_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    role TEXT,
+    timestamp REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (chat_id, id);
+"""
+
+_FLUSH = object()
+_STOP = object()
+
+
+class SQLiteChatStore:
+    """Chat histories in an SQLite database in WAL mode, with a bounded in-memory tier.
+
+    Recently used chats are kept in an LRU of `max_hot_chats`; everything else
+    lives only on disk, so memory stays flat however many chats accumulate.
+    Writes update the hot tier immediately and are queued for a writer thread
+    that commits them in batches every `flush_interval` seconds. Each chat row
+    carries a version that every write bumps; a read compares it with the
+    cached copy and reloads when another worker process changed the chat, so
+    workers sharing the file see each other's messages once they are flushed.
+    Chats idle for longer than `ttl` seconds are deleted by the writer thread.
+    The chats table doubles as the sidebar index: every write maintains the
+    chat's preview and last timestamp, and pages are read from an index on
+    (updated_at, chat_id), so listing never touches the messages.
+    """
+
+    def __init__(self, path, max_hot_chats=1000, ttl=None, flush_interval=0.05, max_batch=500,
+                 sweep_interval=600, clock=time.time):
+        self.path = path
+        self.max_hot_chats = max_hot_chats
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._hot = OrderedDict()
+        self._pending_chats = {}
+        # Chats deleted locally whose delete is not committed yet
+        self._deleting = set()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._local = None
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.expired = 0
+        self.batches = 0
+        self.writes = 0
+        self.write_errors = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    # The writer thread and connections are per process and started on first use, so a store
+    # created before a fork (gunicorn preload_app) works in every worker
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._local = threading.local()
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, name="chat-store-writer", daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL is durable across process crashes; only an OS crash can lose the last commits
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # One connection per reading thread; WAL lets them read while the writer commits
+    def _reader(self):
+        self._ensure_started()
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _load(self, chat_id):
+        connection = self._reader()
+        row = connection.execute("SELECT version FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        bodies = connection.execute("SELECT body FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)).fetchall()
+        return _Chat([json.loads(body) for body, in bodies], version=row[0])
+
+    def _db_version(self, chat_id):
+        row = self._reader().execute("SELECT version FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _remember(self, chat_id, chat):
+        self._hot[chat_id] = chat
+        self._hot.move_to_end(chat_id)
+        while len(self._hot) > self.max_hot_chats:
+            self._hot.popitem(last=False)
+            self.evictions += 1
+
+    # The hot copy of a chat, loaded from (or checked against) the database as needed
+    def _get(self, chat_id, create=False):
+        with self._lock:
+            chat = self._hot.get(chat_id)
+            if chat is not None:
+                self._hot.move_to_end(chat_id)
+                if chat.pending:
+                    # Unflushed local writes are newer than anything on disk
+                    self.hits += 1
+                    return chat
+            pending = chat_id in self._pending_chats
+        if pending:
+            # An evicted chat may still have writes in the queue; they must land before it is read back
+            self.flush()
+        if chat is not None:
+            if self._db_version(chat_id) == chat.version:
+                with self._lock:
+                    self.hits += 1
+                return chat
+            # Changed by another worker (or by a write whose outcome is unknown): read it back
+            with self._lock:
+                self.reloads += 1
+        loaded = self._load(chat_id)
+        with self._lock:
+            current = self._hot.get(chat_id)
+            if current is not None and current is not chat:
+                # Another thread reloaded or created it meanwhile
+                return current
+            if chat is None:
+                self.misses += 1
+            if loaded is None:
+                if not create:
+                    self._hot.pop(chat_id, None)
+                    return None
+                # Not on disk yet; the first queued write creates the row
+                loaded = _Chat([], version=-1)
+            self._remember(chat_id, loaded)
+            return loaded
+
+    def _enqueue(self, chat_id, chat, op):
+        self._ensure_started()
+        chat.pending += 1
+        self._pending_chats[chat_id] = self._pending_chats.get(chat_id, 0) + 1
+        self._queue.put(op)
+
+    def create_chat(self, chat_id):
+        now = self.clock()
+        with self._lock:
+            chat = self._hot.get(chat_id)
+            if chat is None:
+                chat = _Chat([], version=-1)
+                self._remember(chat_id, chat)
+            self._enqueue(chat_id, chat, ("create", chat_id, now))
+
+    def append(self, chat_id, message):
+        chat = self._get(chat_id, create=True)
+        body = json.dumps(message, ensure_ascii=False)
+        with self._lock:
+            # The chat may have been reloaded by another thread; append to the copy now in the tier
+            chat = self._hot.get(chat_id, chat)
+            chat.add(message)
+            chat.last_active = self.clock()
+            self._remember(chat_id, chat)
+            self._enqueue(chat_id, chat, ("append", chat_id, message.get("role"), message.get("timestamp"), body,
+                                          self.clock()))
+
+    # Remove the newest message (a user message whose request was turned away)
+    def pop_last(self, chat_id):
+        chat = self._get(chat_id)
+        if chat is None:
+            return
+        with self._lock:
+            chat = self._hot.get(chat_id, chat)
+            if chat.messages:
+                chat.pop()
+                self._enqueue(chat_id, chat, ("pop", chat_id))
+
+    # Copy of a chat's messages, or None for an unknown chat
+    def messages(self, chat_id):
+        chat = self._get(chat_id)
+        if chat is None:
+            return None
+        with self._lock:
+            return list(chat.messages)
+
+    # A chat's messages from position `start` on, with its message count; (None, 0) for an unknown chat
+    def messages_since(self, chat_id, start):
+        chat = self._get(chat_id)
+        if chat is None:
+            return None, 0
+        with self._lock:
+            return chat.messages[start:], len(chat.messages)
+
+    # The follow-up question with `follow_up_id` in a chat, or None
+    def follow_up(self, chat_id, follow_up_id):
+        chat = self._get(chat_id)
+        if chat is None:
+            return None
+        with self._lock:
+            return chat.follow_ups.get(follow_up_id)
+
+    def delete(self, chat_id):
+        with self._lock:
+            chat = self._hot.pop(chat_id, None) or _Chat([])
+            self._deleting.add(chat_id)
+            self._enqueue(chat_id, chat, ("delete", chat_id))
+
+    # Sidebar rows as this process sees them for chats with uncommitted writes: chat_id -> (updated_at,
+    # preview), or None for a chat being deleted. Chats without writes in flight are read from the table.
+    # Returns None when a chat with queued writes has left the in-memory tier, so only the table knows it
+    def _unflushed_rows(self):
+        rows = {}
+        with self._lock:
+            for chat_id in self._pending_chats:
+                chat = self._hot.get(chat_id)
+                if chat is not None and chat.pending:
+                    first_user = next((msg for msg in chat.messages if msg.get("role") == "user"), None)
+                    timestamps = [msg["timestamp"] for msg in chat.messages if msg.get("timestamp") is not None]
+                    rows[chat_id] = (max(timestamps), first_user["content"]) \
+                        if first_user is not None and timestamps else None
+                elif chat_id in self._deleting:
+                    rows[chat_id] = None
+                else:
+                    return None
+        return rows
+
+    # One page of chats with at least one user message, newest first, as {"id", "preview", "timestamp"};
+    # returns (page, cursor of the next page or None). Committed rows are merged with this process's
+    # uncommitted writes, so a listing never waits for the writer
+    def list_chats(self, limit=None, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        unflushed = self._unflushed_rows()
+        if unflushed is None:
+            # Rare: it takes more chats written within one flush interval than the tier holds
+            self.flush()
+            unflushed = self._unflushed_rows() or {}
+        sql = "SELECT chat_id, preview, updated_at FROM chats WHERE preview IS NOT NULL"
+        params = []
+        if position:
+            sql += " AND (updated_at, chat_id) < (?, ?)"
+            params.extend(position)
+        sql += " ORDER BY updated_at DESC, chat_id DESC"
+        if limit:
+            # One extra row tells whether there is a next page; the table rows of chats with uncommitted
+            # writes are replaced below, so read past as many of them as there are
+            sql += " LIMIT ?"
+            params.append(limit + 1 + len(unflushed))
+        rows = [(updated_at, chat_id, preview) for chat_id, preview, updated_at in self._reader().execute(sql, params)
+                if chat_id not in unflushed]
+        rows.extend((row[0], chat_id, row[1]) for chat_id, row in unflushed.items()
+                    if row is not None and (position is None or (row[0], chat_id) < position))
+        rows.sort(reverse=True)
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+        return [{"id": chat_id, "preview": chat_preview(preview), "timestamp": updated_at}
+                for updated_at, chat_id, preview in rows], next_cursor
+
+    # Block until every write queued so far is committed; returns False on timeout
+    def flush(self, timeout=10):
+        self._ensure_started()
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        self._queue.put((_STOP, None))
+        self._writer.join(timeout=10)
+
+    def _write_loop(self):
+        connection = self._connect()
+        last_sweep = self.clock()
+        running = True
+        while running:
+            try:
+                ops = [self._queue.get(timeout=self.sweep_interval)]
+            except queue.Empty:
+                ops = []
+            # Gather whatever else arrives within the flush interval into the same transaction
+            deadline = time.monotonic() + self.flush_interval
+            while ops and len(ops) < self.max_batch and ops[-1][0] not in (_FLUSH, _STOP):
+                remaining = deadline - time.monotonic()
+                try:
+                    ops.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = [op[1] for op in ops if op[0] is _FLUSH]
+            running = not any(op[0] is _STOP for op in ops)
+            writes = [op for op in ops if op[0] not in (_FLUSH, _STOP)]
+            if writes:
+                self._commit(connection, writes)
+            if self.ttl and self.clock() - last_sweep >= self.sweep_interval:
+                last_sweep = self.clock()
+                self._expire(connection)
+            for waiter in waiters:
+                waiter.set()
+        connection.close()
+
+    def _commit(self, connection, ops):
+        counts = {}
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for op in ops:
+                kind, chat_id = op[0], op[1]
+                counts[chat_id] = counts.get(chat_id, 0) + 1
+                if kind == "create":
+                    connection.execute("INSERT OR IGNORE INTO chats (chat_id, created_at, updated_at) VALUES (?, ?, ?)",
+                                       (chat_id, op[2], op[2]))
+                elif kind == "append":
+                    _, _, role, timestamp, body, now = op
+                    connection.execute("INSERT OR IGNORE INTO chats (chat_id, created_at, updated_at) VALUES (?, ?, ?)",
+                                       (chat_id, now, timestamp if timestamp is not None else now))
+                    connection.execute("INSERT INTO messages (chat_id, role, timestamp, body) VALUES (?, ?, ?, ?)",
+                                       (chat_id, role, timestamp, body))
+                    preview = json.loads(body).get("content", "") if role == "user" else None
+                    connection.execute(
+                        "UPDATE chats SET updated_at = MAX(updated_at, COALESCE(?, updated_at)), "
+                        "preview = COALESCE(preview, ?) WHERE chat_id = ?",
+                        (timestamp, preview[:PREVIEW_CHARS + 1] if preview is not None else None, chat_id))
+                elif kind == "pop":
+                    connection.execute("DELETE FROM messages WHERE id = "
+                                       "(SELECT MAX(id) FROM messages WHERE chat_id = ?)", (chat_id,))
+                    connection.execute(
+                        "UPDATE chats SET updated_at = COALESCE((SELECT MAX(timestamp) FROM messages WHERE chat_id = ?), "
+                        "updated_at), preview = (SELECT substr(json_extract(body, '$.content'), 1, ?) FROM messages "
+                        "WHERE chat_id = ? AND role = 'user' ORDER BY id LIMIT 1) WHERE chat_id = ?",
+                        (chat_id, PREVIEW_CHARS + 1, chat_id, chat_id))
+                elif kind == "delete":
+                    connection.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                    connection.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+                    continue
+                connection.execute("UPDATE chats SET version = version + 1 WHERE chat_id = ?", (chat_id,))
+            versions = {chat_id: self._version_in(connection, chat_id) for chat_id in counts}
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            self.write_errors += 1
+            logger.error(f"Chat store write of {len(ops)} operations failed: {str(e)}")
+            versions = {chat_id: None for chat_id in counts}
+        self.batches += 1
+        self.writes += len(ops)
+
+        with self._lock:
+            for chat_id, count in counts.items():
+                left = self._pending_chats.get(chat_id, 0) - count
+                if left > 0:
+                    self._pending_chats[chat_id] = left
+                else:
+                    self._pending_chats.pop(chat_id, None)
+                    self._deleting.discard(chat_id)
+                chat = self._hot.get(chat_id)
+                if chat is None:
+                    continue
+                chat.pending = max(0, chat.pending - count)
+                version = versions[chat_id]
+                # Every write bumped the version once; any other difference is another worker's write,
+                # and a copy that no longer matches the database is re-read on its next use
+                if version is not None and (chat.version == -1 or version == chat.version + count):
+                    chat.version = version
+                else:
+                    chat.version = -2
+
+    @staticmethod
+    def _version_in(connection, chat_id):
+        row = connection.execute("SELECT version FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _expire(self, connection):
+        cutoff = self.clock() - self.ttl
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            expired = [chat_id for chat_id, in connection.execute(
+                "SELECT chat_id FROM chats WHERE updated_at < ?", (cutoff,)).fetchall()]
+            connection.executemany("DELETE FROM messages WHERE chat_id = ?", [(chat_id,) for chat_id in expired])
+            connection.execute("DELETE FROM chats WHERE updated_at < ?", (cutoff,))
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            logger.error(f"Chat store expiry failed: {str(e)}")
+            return
+        if expired:
+            with self._lock:
+                for chat_id in expired:
+                    if chat_id not in self._pending_chats:
+                        self._hot.pop(chat_id, None)
+            self.expired += len(expired)
+            logger.info(f"Expired {len(expired)} chats idle for more than {self.ttl / 86400:.1f} days")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "size": len(self._hot),
+                "max_size": self.max_hot_chats,
+                "pending_writes": self._queue.qsize() if self._pid == os.getpid() else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "batches": self.batches,
+                "writes": self.writes,
+                "write_errors": self.write_errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def build_chat_store(backend, path=None, max_hot_chats=1000, ttl=None, **params):
+    if backend == "sqlite":
+        return SQLiteChatStore(path, max_hot_chats=max_hot_chats, ttl=ttl, **params)
+    if backend == "memory":
+        return MemoryChatStore(max_chats=max_hot_chats, ttl=ttl)
+    raise ValueError(f"Unknown chat store backend: {backend}")
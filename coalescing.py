@@ -0,0 +1,165 @@
+import asyncio
+import threading
+
+from caching import normalize_query
+
+
+# Requests with the same question over the same retrieved context would get the same answer
+def coalescing_key(query, answer_context):
+    return normalize_query(query), answer_context
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a coalesced request")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Lets concurrent identical requests share one in-flight call (thread version).
+
+    The first caller for a key becomes the leader and does the work; callers
+    that arrive before it finishes wait for the leader's result instead of
+    repeating it. Nothing is kept once the call completes, so results are
+    never stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    # Returns (call, is_leader); the leader must call complete() exactly once
+    def acquire(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def complete(self, key, call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if error is not None:
+                self.errors += 1
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    # Run fn once per key among concurrent callers; returns (result, shared)
+    def do(self, key, fn, timeout=None):
+        call, leader = self.acquire(key)
+        if not leader:
+            return call.wait(timeout), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.complete(key, call, error=e)
+            raise
+        self.complete(key, call, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+            waiting = sum(call.followers for call in self._calls.values())
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": in_flight,
+            "waiting_followers": waiting,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "coalesced_ratio": self.coalesced / total if total else 0.0,
+        }
+
+
+class AsyncSingleFlight:
+    """Asyncio version of SingleFlight for the ASGI routes.
+
+    The leader's work runs as its own task, so a leader whose client disconnects
+    does not cancel the call its followers are waiting on.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._followers = {}
+
+    # Returns (future, is_leader); the leader must call complete() exactly once
+    def acquire(self, key):
+        future = self._tasks.get(key)
+        if future is not None:
+            self._followers[key] += 1
+            self.coalesced += 1
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._tasks[key] = future
+        self._followers[key] = 0
+        self.leaders += 1
+        return future, True
+
+    def complete(self, key, future, result=None, error=None):
+        if self._tasks.get(key) is future:
+            del self._tasks[key]
+            del self._followers[key]
+        if future.done():
+            return
+        if error is not None:
+            self.errors += 1
+            future.set_exception(error)
+            # Followers may all have gone away; don't warn about an unretrieved exception
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def wait(self, future, timeout=None):
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def do(self, key, coroutine_fn, timeout=None):
+        future, leader = self.acquire(key)
+        if not leader:
+            return await self.wait(future, timeout), True
+        task = asyncio.ensure_future(coroutine_fn())
+
+        def finished(task):
+            if task.cancelled():
+                self.complete(key, future, error=asyncio.CancelledError())
+            elif task.exception() is not None:
+                self.complete(key, future, error=task.exception())
+            else:
+                self.complete(key, future, result=task.result())
+        task.add_done_callback(finished)
+        return await asyncio.shield(future), False
+
+    def stats(self):
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._tasks),
+            "waiting_followers": sum(self._followers.values()),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "coalesced_ratio": self.coalesced / total if total else 0.0,
+        }
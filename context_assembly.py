@@ -0,0 +1,144 @@
+import os
+import re
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token counts default to the usual ~4 characters per token estimate; Claude's tokenizer is not
+# public, so any encoding is an estimate too. use_tiktoken() opts in to a tiktoken encoding, which is
+# only ever read from a pre-seeded TIKTOKEN_CACHE_DIR: fetching it on a cold cache is a blocking
+# download that would hang startup on hosts without outbound access.
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Where tiktoken downloads its encodings from; its cache file is named after the SHA1 of this URL
+TIKTOKEN_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+_encoding_name = None
+_encoding = None
+_encoding_failed = False
+
+
+# Count tokens with the named tiktoken encoding (e.g. "cl100k_base") from now on; None restores the estimate
+def use_tiktoken(encoding_name):
+    global _encoding_name, _encoding, _encoding_failed
+    _encoding_name, _encoding, _encoding_failed = encoding_name or None, None, False
+
+
+def _cached_encoding(name):
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR")
+    if not cache_dir:
+        return False
+    key = hashlib.sha1(TIKTOKEN_BLOB_URL.format(name=name).encode("utf-8")).hexdigest()
+    return os.path.exists(os.path.join(cache_dir, key))
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and _encoding_name is not None:
+        _encoding_failed = True
+        if tiktoken is None:
+            logger.warning("tiktoken is not installed, estimating tokens from length")
+        elif not _cached_encoding(_encoding_name):
+            logger.warning(f"tiktoken encoding {_encoding_name} is not in TIKTOKEN_CACHE_DIR, "
+                           f"estimating tokens from length")
+        else:
+            try:
+                _encoding = tiktoken.get_encoding(_encoding_name)
+                _encoding_failed = False
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens from length: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+# Longest prefix of whole sentences that fits in max_tokens ("" if not even the first one fits)
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept = []
+    used = 0
+    for sentence in split_sentences(text):
+        # +1 for the space that joins it to the previous sentence
+        cost = count_tokens(sentence) + (1 if kept else 0)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+# Like truncate_to_tokens, but falls back to whole words when even the first sentence is too long
+def clip_to_tokens(text, max_tokens):
+    clipped = truncate_to_tokens(text, max_tokens)
+    if clipped or not text.strip():
+        return clipped
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+class ContextAssembler:
+    """Packs retrieved chunks, best first, into a fixed token budget.
+
+    Whole chunks are added while they fit. The first chunk that does not fit is
+    cut at a sentence boundary if at least `min_chunk_tokens` of room is left;
+    nothing after it is added, so the context keeps the ranking order.
+    """
+
+    def __init__(self, token_budget=2000, min_chunk_tokens=40, separator="\n\n"):
+        self.token_budget = token_budget
+        self.min_chunk_tokens = min_chunk_tokens
+        self.separator = separator
+        self._separator_tokens = None
+
+    # Counted on first use, so building an assembler never loads a tokenizer
+    @property
+    def separator_tokens(self):
+        if self._separator_tokens is None:
+            self._separator_tokens = count_tokens(self.separator)
+        return self._separator_tokens
+
+    # Returns (context text, chunks actually used, token count of the context)
+    def assemble(self, chunks):
+        parts = []
+        used_chunks = []
+        used_tokens = 0
+        for chunk in chunks:
+            overhead = self.separator_tokens if parts else 0
+            remaining = self.token_budget - used_tokens - overhead
+            tokens = count_tokens(chunk["content"])
+            if tokens <= remaining:
+                parts.append(chunk["content"])
+                used_chunks.append(chunk)
+                used_tokens += overhead + tokens
+                continue
+            if remaining >= self.min_chunk_tokens:
+                truncated = truncate_to_tokens(chunk["content"], remaining)
+                if truncated:
+                    parts.append(truncated)
+                    used_chunks.append(dict(chunk, truncated=True))
+                    used_tokens += overhead + count_tokens(truncated)
+            break
+        return self.separator.join(parts), used_chunks, used_tokens
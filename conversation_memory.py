@@ -0,0 +1,151 @@
+import re
+import threading
+from collections import OrderedDict, deque
+
+from context_assembly import count_tokens, split_sentences, clip_to_tokens
+
+# Phrases that only make sense as a continuation of the previous question
+FOLLOW_UP_CUES = re.compile(
+    r"^\s*(what|how)\s+about\b|^\s*(and|also|but|or|same)\b|"
+    r"\b(it|its|they|them|their|that|those|these)\b",
+    re.IGNORECASE
+)
+
+
+SUMMARY_HEADER = "Earlier in this conversation:"
+EXCHANGE_SEPARATOR = "\n\n"
+
+
+# One summary line per exchange: the question and the opening of the answer, each clipped
+def summarize_exchange(question, answer, max_tokens=60):
+    half = max_tokens // 2
+    first_sentence = split_sentences(answer)[0] if answer.strip() else ""
+    question = clip_to_tokens(question, half)
+    first_sentence = clip_to_tokens(first_sentence, half)
+    return f"Student asked: {question} Assistant: {first_sentence}"
+
+
+class _ChatMemory:
+    __slots__ = ("recent", "recent_tokens", "summary", "summary_tokens", "topic", "synced")
+
+    def __init__(self):
+        self.recent = deque()
+        self.recent_tokens = 0
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.topic = None
+        self.synced = 0
+
+
+class ConversationMemory:
+    """Per-chat conversation context with a hard token budget.
+
+    The latest exchanges are kept verbatim up to `window_tokens`. Exchanges that
+    fall out of the window are folded into a running summary, one short line
+    each, capped at `summary_tokens` by dropping the oldest lines. All of this
+    happens when an exchange is recorded, so building a prompt only reads
+    what is already there and never grows with the length of the chat.
+    """
+
+    def __init__(self, window_tokens=600, summary_tokens=200, max_turn_tokens=250, max_chats=10000,
+                 summarize=summarize_exchange):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        # One exchange must always fit the window, or the budget would not be hard
+        self.max_turn_tokens = min(max_turn_tokens, window_tokens // 2)
+        self.max_chats = max_chats
+        self.summarize = summarize
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self._separator_tokens = None
+        self._header_tokens = None
+
+    # Counted on first use, so building the memory never loads a tokenizer
+    @property
+    def separator_tokens(self):
+        if self._separator_tokens is None:
+            self._separator_tokens = count_tokens(EXCHANGE_SEPARATOR)
+        return self._separator_tokens
+
+    @property
+    def header_tokens(self):
+        if self._header_tokens is None:
+            self._header_tokens = count_tokens(SUMMARY_HEADER) + self.separator_tokens
+        return self._header_tokens
+
+    def _chat(self, chat_id, create=False):
+        memory = self._chats.get(chat_id)
+        if memory is None and create:
+            memory = self._chats[chat_id] = _ChatMemory()
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        if memory is not None:
+            self._chats.move_to_end(chat_id)
+        return memory
+
+    # Record a finished question/answer pair; `topic` is the standalone form of the question
+    def add_exchange(self, chat_id, question, answer, topic=None):
+        text = (f"Student: {clip_to_tokens(question, self.max_turn_tokens)}\n"
+                f"Assistant: {clip_to_tokens(answer, self.max_turn_tokens)}")
+        # Token counts include the formatting and separators, so the rendered context honours the budget
+        tokens = count_tokens(text) + self.separator_tokens
+        with self._lock:
+            memory = self._chat(chat_id, create=True)
+            memory.recent.append((question, answer, text, tokens))
+            memory.recent_tokens += tokens
+            memory.topic = topic or question
+            while memory.recent_tokens > self.window_tokens and len(memory.recent) > 1:
+                old_question, old_answer, _, old_tokens = memory.recent.popleft()
+                memory.recent_tokens -= old_tokens
+                line = f"- {self.summarize(old_question, old_answer)}"
+                line_tokens = count_tokens(line) + 1
+                memory.summary.append((line, line_tokens))
+                memory.summary_tokens += line_tokens
+                while memory.summary_tokens > self.summary_tokens - self.header_tokens and memory.summary:
+                    memory.summary_tokens -= memory.summary.popleft()[1]
+
+    # How many of a chat's stored messages have been folded in (0 if it is unknown or was evicted)
+    def synced_messages(self, chat_id):
+        with self._lock:
+            memory = self._chats.get(chat_id)
+            return memory.synced if memory is not None else 0
+
+    def mark_synced(self, chat_id, count):
+        with self._lock:
+            memory = self._chat(chat_id, create=True)
+            memory.synced = count
+
+    def forget(self, chat_id):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    # Conversation text for the prompt ("" for a new chat); at most summary_tokens + window_tokens
+    def prompt_context(self, chat_id):
+        with self._lock:
+            memory = self._chat(chat_id)
+            if memory is None:
+                return ""
+            summary = [line for line, _ in memory.summary]
+            recent = [text for _, _, text, _ in memory.recent]
+        parts = []
+        if summary:
+            parts.append(SUMMARY_HEADER + "\n" + "\n".join(summary))
+        parts.extend(recent)
+        return EXCHANGE_SEPARATOR.join(parts)
+
+    # Make a follow-up like "what about for graduate students?" stand alone for retrieval
+    def rewrite_query(self, chat_id, query):
+        with self._lock:
+            memory = self._chat(chat_id)
+            topic = memory.topic if memory is not None else None
+        if not topic or not FOLLOW_UP_CUES.search(query):
+            return query
+        return f"{clip_to_tokens(topic, self.max_turn_tokens // 2)} {query}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chats": len(self._chats),
+                "window_tokens": self.window_tokens,
+                "summary_tokens": self.summary_tokens,
+            }
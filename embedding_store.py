@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+
+from search_engine import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+
+# File layout of a store, all sharing one prefix inside the data directory:
+#   <prefix>_store.json    header (format version, count, dimension, model, content hash)
+#   <prefix>_vectors.npy   float32 [count, dimension], unit-normalized, opened with mmap
+#   <prefix>_chunks.bin    chunk metadata, one UTF-8 JSON document per chunk, back to back
+#   <prefix>_chunks.idx    uint64 [count + 1] byte offsets into the .bin sidecar
+STORE_SUFFIXES = ("_store.json", "_vectors.npy", "_chunks.bin", "_chunks.idx")
+
+
+class StoreError(ValueError):
+    pass
+
+
+def store_paths(data_dir, prefix):
+    header, vectors, chunks, offsets = (os.path.join(data_dir, prefix + suffix) for suffix in STORE_SUFFIXES)
+    return {"header": header, "vectors": vectors, "chunks": chunks, "offsets": offsets}
+
+
+def store_exists(data_dir, prefix):
+    return os.path.exists(store_paths(data_dir, prefix)["header"])
+
+
+class ChunkStore:
+    """Read-only sequence of chunk dicts decoded on demand from a memory-mapped sidecar."""
+
+    def __init__(self, chunks_path, offsets_path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        if os.path.getsize(chunks_path) == 0:
+            self.data = b""
+        else:
+            self.data = np.memmap(chunks_path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return json.loads(bytes(self.data[start:end]).decode("utf-8"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _content_hash(vectors, chunk_bytes):
+    digest = hashlib.sha256()
+    # Hash the buffers in place so verifying a mapped store never copies it onto the heap
+    digest.update(np.ascontiguousarray(vectors).reshape(-1).view(np.uint8))
+    digest.update(chunk_bytes)
+    return digest.hexdigest()
+
+
+def _replace_atomically(path, write):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Write chunks and embeddings as a store; the header goes last so readers never see a half-written store
+def write_store(data_dir, prefix, chunks, embeddings, model_name):
+    paths = store_paths(data_dir, prefix)
+    vectors = normalize_rows(embeddings) if len(chunks) else np.zeros((0, np.shape(embeddings)[-1]), np.float32)
+    if vectors.shape[0] != len(chunks):
+        raise StoreError(f"{len(chunks)} chunks but {vectors.shape[0]} embeddings")
+
+    encoded = [json.dumps(chunk, ensure_ascii=False).encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    chunk_bytes = b"".join(encoded)
+
+    _replace_atomically(paths["vectors"], lambda f: np.save(f, vectors))
+    _replace_atomically(paths["chunks"], lambda f: f.write(chunk_bytes))
+    _replace_atomically(paths["offsets"], lambda f: np.save(f, offsets))
+
+    header = {
+        "format_version": STORE_FORMAT_VERSION,
+        "count": int(vectors.shape[0]),
+        "dimension": int(vectors.shape[1]),
+        "dtype": "float32",
+        "normalized": True,
+        "model_name": model_name,
+        "content_hash": _content_hash(vectors, chunk_bytes),
+        "created_at": time.time(),
+    }
+    _replace_atomically(paths["header"], lambda f: f.write(json.dumps(header, indent=2).encode("utf-8")))
+    logger.info(f"Wrote embedding store with {header['count']} chunks to {paths['header']}")
+    return header
+
+
+def read_header(data_dir, prefix):
+    with open(store_paths(data_dir, prefix)["header"], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Open a store without copying it into process memory; raises StoreError on any mismatch
+def open_store(data_dir, prefix, model_name=None, verify=True):
+    paths = store_paths(data_dir, prefix)
+    try:
+        header = read_header(data_dir, prefix)
+    except (OSError, ValueError) as e:
+        raise StoreError(f"Unreadable store header: {str(e)}")
+
+    if header.get("format_version") != STORE_FORMAT_VERSION:
+        raise StoreError(f"Unsupported store format version: {header.get('format_version')}")
+    if model_name and header.get("model_name") != model_name:
+        raise StoreError(f"Store was built with {header.get('model_name')}, expected {model_name}")
+
+    try:
+        vectors = np.load(paths["vectors"], mmap_mode="r")
+        chunks = ChunkStore(paths["chunks"], paths["offsets"])
+    except (OSError, ValueError) as e:
+        raise StoreError(f"Unreadable store files: {str(e)}")
+
+    if vectors.dtype != np.float32 or vectors.shape != (header["count"], header["dimension"]):
+        raise StoreError(f"Vector file shape {vectors.shape} does not match header")
+    if len(chunks) != header["count"] or int(chunks.offsets[-1]) != len(chunks.data):
+        raise StoreError("Chunk sidecar does not match header")
+    if verify and _content_hash(vectors, chunks.data) != header["content_hash"]:
+        raise StoreError("Content hash mismatch, store is corrupt or partially written")
+
+    return chunks, vectors, header
@@ -9,6 +9,8 @@ import logging
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import pickle
+from embedding_store import write_store
+from metrics import Registry, Counter, Gauge, Histogram, read_textfile_value, write_textfile
 
 # Set up logging
 logging.basicConfig(
@@ -26,6 +28,23 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 CHUNKS_PATH = os.path.join(DATA_DIR, "na_edu_chunks.json")
 EMBEDDINGS_PATH = os.path.join(DATA_DIR, "na_edu_embeddings.pkl")
+STORE_PREFIX = "na_edu"
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Metrics of the last run, served by the assistant's /metrics endpoint
+METRICS_PATH = os.path.join(DATA_DIR, "scraper.prom")
+
+# Metrics for this run, plus the last success time carried over from earlier runs; written to
+# METRICS_PATH when the run ends
+scraper_metrics = Registry()
+PAGE_FETCH_SECONDS = Histogram("nau_scraper_page_fetch_seconds", "Time to fetch one page",
+                               buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10), registry=scraper_metrics)
+PAGES = Counter("nau_scraper_pages_total", "Pages visited in the last run, by outcome", ["outcome"],
+                registry=scraper_metrics)
+STAGE_SECONDS = Gauge("nau_scraper_stage_seconds", "Duration of each stage of the last run", ["stage"],
+                      registry=scraper_metrics)
+CHUNKS = Gauge("nau_scraper_chunks", "Chunks produced by the last run", registry=scraper_metrics)
+LAST_SUCCESS = Gauge("nau_scraper_last_success_timestamp_seconds", "Unix time the last successful run finished",
+                     registry=scraper_metrics)
 
 # Important pages to scrape (add more URLs as needed)
 IMPORTANT_PAGES = [
@@ -153,10 +172,13 @@ def scrape_website():
         visited.add(url)
         
         try:
-            response = requests.get(url, timeout=10)
+            with PAGE_FETCH_SECONDS.time():
+                response = requests.get(url, timeout=10)
             if response.status_code != 200:
                 logger.warning(f"Failed to fetch important page {url}: Status code {response.status_code}")
+                PAGES.inc(outcome="http_error")
                 continue
+            PAGES.inc(outcome="fetched")
             
             soup = BeautifulSoup(response.text, 'html.parser')
             page_data = extract_text_from_page(url, soup)
@@ -177,6 +199,7 @@ def scrape_website():
         
         except Exception as e:
             logger.error(f"Error scraping {url}: {str(e)}")
+            PAGES.inc(outcome="error")
     
     # Now process other pages
     remaining_pages = all_pages - visited
@@ -193,10 +216,13 @@ def scrape_website():
         visited.add(url)
         
         try:
-            response = requests.get(url, timeout=10)
+            with PAGE_FETCH_SECONDS.time():
+                response = requests.get(url, timeout=10)
             if response.status_code != 200:
                 logger.warning(f"Failed to fetch {url}: Status code {response.status_code}")
+                PAGES.inc(outcome="http_error")
                 continue
+            PAGES.inc(outcome="fetched")
             
             soup = BeautifulSoup(response.text, 'html.parser')
             page_data = extract_text_from_page(url, soup)
@@ -209,6 +235,7 @@ def scrape_website():
         
         except Exception as e:
             logger.error(f"Error scraping {url}: {str(e)}")
+            PAGES.inc(outcome="error")
     
     logger.info(f"Scraped {len(extracted_data)} pages successfully")
     return extracted_data
@@ -260,39 +287,65 @@ def process_data(extracted_data):
 
 # Create embeddings
 def create_embeddings(chunks):
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
     texts = [chunk["content"] for chunk in chunks]
     embeddings = model.encode(texts)
     return embeddings
 
+# Record how long a stage of the run took
+def record_stage(stage, start):
+    STAGE_SECONDS.set(time.perf_counter() - start, stage=stage)
+
 # Main function
 def main():
     logger.info("Starting web scraping process")
     
-    # Scrape the website
-    extracted_data = scrape_website()
-    
-    # Save raw data for reference
-    with open(os.path.join(DATA_DIR, "na_edu_raw_data.json"), 'w', encoding='utf-8') as f:
-        json.dump(extracted_data, f, indent=2, ensure_ascii=False)
-    
-    # Process data into chunks
-    chunks = process_data(extracted_data)
-    logger.info(f"Created {len(chunks)} chunks from {len(extracted_data)} pages")
-    
-    # Save chunks
-    with open(CHUNKS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
-    
-    # Create embeddings
-    logger.info("Creating embeddings")
-    embeddings = create_embeddings(chunks)
-    
-    # Save embeddings
-    with open(EMBEDDINGS_PATH, 'wb') as f:
-        pickle.dump(embeddings, f)
+    # Start from the previous success time, so a failed run keeps reporting it
+    previous_success = read_textfile_value(METRICS_PATH, LAST_SUCCESS.name)
+    if previous_success is not None:
+        LAST_SUCCESS.set(previous_success)
     
-    logger.info("Web scraping and processing completed successfully")
+    try:
+        # Scrape the website
+        start = time.perf_counter()
+        extracted_data = scrape_website()
+        record_stage("scrape", start)
+        
+        # Save raw data for reference
+        with open(os.path.join(DATA_DIR, "na_edu_raw_data.json"), 'w', encoding='utf-8') as f:
+            json.dump(extracted_data, f, indent=2, ensure_ascii=False)
+        
+        # Process data into chunks
+        start = time.perf_counter()
+        chunks = process_data(extracted_data)
+        record_stage("chunk", start)
+        CHUNKS.set(len(chunks))
+        logger.info(f"Created {len(chunks)} chunks from {len(extracted_data)} pages")
+        
+        # Save chunks
+        with open(CHUNKS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, indent=2, ensure_ascii=False)
+        
+        # Create embeddings
+        logger.info("Creating embeddings")
+        start = time.perf_counter()
+        embeddings = create_embeddings(chunks)
+        record_stage("embed", start)
+        
+        # Save embeddings
+        with open(EMBEDDINGS_PATH, 'wb') as f:
+            pickle.dump(embeddings, f)
+        
+        # Write the memory-mapped store the assistant loads at startup
+        start = time.perf_counter()
+        write_store(DATA_DIR, STORE_PREFIX, chunks, embeddings, EMBEDDING_MODEL_NAME)
+        record_stage("store", start)
+        
+        LAST_SUCCESS.set(time.time())
+        logger.info("Web scraping and processing completed successfully")
+    finally:
+        # A failed run still reports how far it got, with the last success time of an earlier run
+        write_textfile(scraper_metrics, METRICS_PATH)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""FAQ fast path: canned answers matched by phrase, kept in data/faq.json.
+
+    python faq.py data/faq.json      # validate a file before deploying it
+
+The file holds {"format": 1, "entries": [...]}; each entry has a "key", the
+"patterns" that select it, the "answer" and its "sources", and optionally a
+"follow_up" question with the replies to it. A query matches an entry when one
+of its patterns occurs in the query (both lowercased, punctuation removed);
+when several entries match, the one listed first wins. The server checks the
+file for changes every few seconds and swaps in the new catalog without a
+restart.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), "data", "faq.json")
+FAQ_FORMAT = 1
+
+# Reply shapes process_follow_up_response understands, by the fields each needs
+FOLLOW_UP_KINDS = (("yes_response", "no_response"), ("undergraduate_response", "graduate_response"),
+                   ("custom_response",))
+
+_NO_MATCH = sys.maxsize
+
+
+class FAQError(ValueError):
+    pass
+
+
+# The form queries and patterns are compared in: lowercase, without punctuation
+def normalize_faq_text(text):
+    return re.sub(r'[^\w\s]', '', text.lower().strip())
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton over every FAQ pattern.
+
+    `first_match` reads the query once and returns the lowest priority among the
+    patterns occurring in it, so its cost follows the length of the query rather
+    than the number of patterns. Each state stores the best priority of the
+    patterns ending there, including those reached through its failure links.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._best = [_NO_MATCH]
+        for pattern, priority in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._best.append(_NO_MATCH)
+                state = next_state
+            self._best[state] = min(self._best[state], priority)
+
+        # Breadth-first, so a state's failure target is complete before the state inherits from it
+        self._fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._best[next_state] = min(self._best[next_state], self._best[self._fail[next_state]])
+
+    def __len__(self):
+        return len(self._goto)
+
+    # Priority of the best pattern found in `text`, or None
+    def first_match(self, text):
+        goto, fail, best_at = self._goto, self._fail, self._best
+        state, best = 0, _NO_MATCH
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if best_at[state] < best:
+                best = best_at[state]
+                if best == 0:
+                    break
+        return best if best != _NO_MATCH else None
+
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() != ""
+
+
+def _follow_up_problems(follow_up):
+    if not isinstance(follow_up, dict):
+        return ["follow_up must be an object"]
+    problems = [] if _is_text(follow_up.get("question")) else ["follow_up needs a question"]
+    kinds = [fields for fields in FOLLOW_UP_KINDS if any(field in follow_up for field in fields)]
+    if len(kinds) != 1:
+        return problems + [f"follow_up needs exactly one of {' / '.join('+'.join(fields) for fields in FOLLOW_UP_KINDS)}"]
+    if kinds[0] == ("custom_response",):
+        responses = follow_up["custom_response"]
+        if not isinstance(responses, dict) or not responses or \
+                not all(_is_text(keyword) and _is_text(answer) for keyword, answer in responses.items()):
+            problems.append("custom_response must map reply keywords to answers")
+        if "default_response" in follow_up and not _is_text(follow_up["default_response"]):
+            problems.append("default_response must be text")
+    else:
+        problems.extend(f"{field} must be text" for field in kinds[0] if not _is_text(follow_up.get(field)))
+    return problems
+
+
+# Check a parsed FAQ file and return its entries; raises FAQError listing every problem found
+def validate_faq(payload):
+    if not isinstance(payload, dict) or payload.get("format") != FAQ_FORMAT:
+        raise FAQError(f"expected an object with \"format\": {FAQ_FORMAT}")
+    entries = payload.get("entries")
+    if not isinstance(entries, list):
+        raise FAQError("\"entries\" must be a list")
+    problems = []
+    keys = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            problems.append(f"entry {index}: must be an object")
+            continue
+        name = f"entry {index} ({entry.get('key')!r})"
+        if not _is_text(entry.get("key")):
+            problems.append(f"{name}: key must be text")
+        elif entry["key"] in keys:
+            problems.append(f"{name}: duplicate key")
+        keys.add(entry.get("key"))
+        patterns = entry.get("patterns")
+        if not isinstance(patterns, list) or not patterns or \
+                not all(isinstance(pattern, str) and normalize_faq_text(pattern) for pattern in patterns):
+            problems.append(f"{name}: patterns must be a non-empty list of phrases")
+        if not _is_text(entry.get("answer")):
+            problems.append(f"{name}: answer must be text")
+        sources = entry.get("sources")
+        if not isinstance(sources, list) or not all(_is_text(source) for source in sources):
+            problems.append(f"{name}: sources must be a list of URLs")
+        if "follow_up" in entry:
+            problems.extend(f"{name}: {problem}" for problem in _follow_up_problems(entry["follow_up"]))
+    if problems:
+        raise FAQError("; ".join(problems))
+    return entries
+
+
+def load_faq(path=FAQ_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            payload = json.load(f)
+        except ValueError as e:
+            raise FAQError(f"not valid JSON: {str(e)}") from e
+    return validate_faq(payload)
+
+
+class FAQCatalog:
+    """The FAQ file compiled into one matcher, reloaded when the file changes.
+
+    A file that fails validation is rejected as a whole and the catalog already
+    loaded keeps serving, so a bad edit cannot take the fast path down.
+    """
+
+    def __init__(self, path=FAQ_PATH, check_interval=5.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        # Entries and matcher are swapped together so a lookup never pairs one file's matcher with another's entries
+        self._catalog = ([], PatternMatcher([]))
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.last_error = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._catalog[0])
+
+    # Load the file if it changed; returns True if a new catalog was loaded. An invalid or
+    # missing file keeps the current catalog, or raises FAQError when `strict` (at startup)
+    def refresh(self, strict=False):
+        with self._lock:
+            self._checked_at = self.clock()
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature == self._signature:
+                    return False
+                self._signature = signature
+                entries = load_faq(self.path)
+            except (OSError, FAQError) as e:
+                error = f"{self.path}: {str(e)}"
+                if strict:
+                    raise FAQError(error) from e
+                if error != self.last_error:
+                    logger.error(f"Keeping the current FAQ ({len(self)} entries); {error}")
+                self.last_error = error
+                return False
+            matcher = PatternMatcher((normalize_faq_text(pattern), priority)
+                                     for priority, entry in enumerate(entries) for pattern in entry["patterns"])
+            self._catalog = (entries, matcher)
+            self.last_error = None
+            self.loaded_at = time.time()
+            self.reloads += 1
+        logger.info(f"Loaded {len(entries)} FAQ entries ({len(matcher)} matcher states) from {self.path}")
+        return True
+
+    # The first entry with a pattern contained in the query, or None
+    def lookup(self, query):
+        if self._checked_at is None or self.clock() - self._checked_at >= self.check_interval:
+            self.refresh()
+        entries, matcher = self._catalog
+        priority = matcher.first_match(normalize_faq_text(query))
+        if priority is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entries[priority]
+
+    def stats(self):
+        entries, matcher = self._catalog
+        return {
+            "path": self.path,
+            "entries": len(entries),
+            "patterns": sum(len(entry["patterns"]) for entry in entries),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate an FAQ file")
+    parser.add_argument("path", nargs="?", default=FAQ_PATH)
+    args = parser.parse_args()
+    try:
+        entries = load_faq(args.path)
+    except (OSError, FAQError) as e:
+        raise SystemExit(f"{args.path} is invalid: {str(e)}")
+    patterns = sum(len(entry["patterns"]) for entry in entries)
+    print(f"{args.path}: {len(entries)} entries, {patterns} patterns, "
+          f"{sum('follow_up' in entry for entry in entries)} with follow-up questions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Gunicorn settings for serving the assistant on every core of a host; see wsgi.py.
+
+    gunicorn -c gunicorn.conf.py
+    WEB_CONCURRENCY=8 TORCH_THREADS=1 SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+
+The app is preloaded, so the model weights and the knowledge base are loaded
+once in the master and shared by the workers. A knowledge base refresh is
+loaded by each worker on its own (every worker watches the data files), so
+until the next restart the new snapshot is private to each worker.
+
+Memory with 4 workers, after 10s of load_test.py at 150 req/s (MiB, from
+/proc/<pid>/smaps_rollup; uss = pages only that process maps):
+
+                          master uss   worker uss   total pss
+    PRELOAD_APP=true          20          36           287
+    PRELOAD_APP=false         12         140           594
+
+This was measured with the current knowledge base and a stand-in encoder that
+holds the 91 MB of all-MiniLM-L6-v2 weights, not with torch itself. torch's
+runtime (its libraries, per-thread scratch buffers) is not in these numbers,
+and its allocations during encoding are private to each worker. Measure on
+the target host: every worker reports its own figures as
+nau_process_memory_bytes{kind="rss"|"pss"|"uss"} on /metrics.
+"""
+import gc
+import os
+import sys
+
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+wsgi_app = "wsgi:application"
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# PRELOAD_APP=false loads everything in each worker instead (a full copy per worker)
+preload_app = os.getenv("PRELOAD_APP", "true").lower() != "false"
+
+if SERVER_MODE == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = "gthread"
+    # Chat requests mostly wait on the model API, so each worker serves several at once
+    threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Recycling workers now and then restores the pages they have copied from the master (0 disables it)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Each worker gets an equal share of the cores for torch. The master only loads the model and runs
+# one warmup encode, single-threaded, so no OpenMP thread pool exists when it forks (a pool
+# inherited across fork can deadlock the child)
+torch_threads = int(os.getenv("TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // workers))))
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Collections in the master would leave holes in the pages the workers are about to share;
+# wsgi.py freezes what was loaded and each worker re-enables the collector
+gc.disable()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(torch_threads)
+
+    # Without preload the worker imports wsgi.py after this hook and loads everything itself
+    if server.cfg.preload_app:
+        import nau_assistant_final as assistant
+        assistant.start_background_init()
@@ -0,0 +1,167 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import get_content_type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Versioned asset URLs change whenever the content does, so they can be cached for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else is kept but revalidated with its ETag on each use
+REVALIDATE = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+# Local src/href references in a page, rewritten to versioned URLs
+ASSET_REFERENCE = re.compile(r'(?P<attribute>\b(?:src|href)=")(?P<path>[^":?#]+)"')
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def is_compressible(mimetype):
+    return mimetype is not None and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+# Best encoding the request accepts (Accept-Encoding, honouring q-values), or None for identity
+def negotiate_encoding(request):
+    return request.accept_encodings.best_match(["br", "gzip"] if brotli is not None else ["gzip"])
+
+
+def compress(data, encoding, level=None):
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if level is None else level)
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+# Compress a finished response for the client if it is worth it. Streams (SSE) are left alone, since
+# buffering them would hold back every event, as are bodies under `min_size`, where the framing and CPU
+# cost more than the bytes saved
+def compress_response(response, request, min_size):
+    if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers \
+            or not 200 <= response.status_code < 300 or response.status_code in (204, 206) \
+            or not is_compressible(response.mimetype):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < min_size:
+        return response
+    encoding = negotiate_encoding(request)
+    data = response.get_data()
+    if encoding is None or len(data) < min_size:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong ETag names exact bytes, so each encoding needs its own
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+# Make a per-user JSON response revalidatable: a weak ETag over the body and any headers that are part of
+# the result (e.g. a paging cursor), answered with 304 Not Modified when the client already has it
+def conditional_response(response, request, *extra):
+    digest = hashlib.blake2b(response.get_data(), digest_size=8)
+    for value in extra:
+        digest.update(b"\0" + (value or "").encode("utf-8"))
+    response.set_etag(digest.hexdigest(), weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+class _Asset:
+    __slots__ = ("body", "version", "mimetype", "signature", "variants")
+
+    def __init__(self, body, mimetype, signature):
+        self.body = body
+        self.version = content_hash(body)
+        self.mimetype = mimetype
+        self.signature = signature
+        self.variants = {None: body}
+
+
+class StaticAssets:
+    """Files from a static directory, served with content-hash ETags and cached compressed variants.
+
+    HTML pages are rewritten to reference local assets as `path?v=<hash>`; a
+    request carrying the current hash is cacheable for a year, since the next
+    deploy changes the URL, and anything else is revalidated with its ETag (a
+    304 without a body when unchanged). Files are read and compressed once and
+    re-read when their modification time or size changes.
+    """
+
+    def __init__(self, directory, min_size=1024):
+        self.directory = directory
+        self.min_size = min_size
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        full_path = safe_join(self.directory, path)
+        if full_path is None or not os.path.isfile(full_path):
+            return None
+        stat = os.stat(full_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(path)
+        if asset is not None and asset.signature == signature:
+            return asset
+        with open(full_path, "rb") as f:
+            body = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if mimetype == "text/html":
+            page = ASSET_REFERENCE.sub(lambda match: self._versioned(path, match), body.decode("utf-8"))
+            body = page.encode("utf-8")
+        asset = _Asset(body, mimetype, signature)
+        with self._lock:
+            self._assets[path] = asset
+        return asset
+
+    def _versioned(self, page, match):
+        target = os.path.normpath(os.path.join(os.path.dirname(page), match.group("path"))).replace(os.sep, "/")
+        # Links to other pages stay as they are: pages are revalidated anyway, and two pages may link each other
+        if target.startswith("..") or mimetypes.guess_type(target)[0] == "text/html":
+            return match.group(0)
+        asset = self._load(target)
+        if asset is None:
+            return match.group(0)
+        return f'{match.group("attribute")}{match.group("path")}?v={asset.version}"'
+
+    def _variant(self, asset, encoding):
+        body = asset.variants.get(encoding)
+        if body is None:
+            # Static files are compressed once at the highest level and reused
+            body = compress(asset.body, encoding, level=11 if encoding == "br" else 9)
+            with self._lock:
+                asset.variants[encoding] = body
+        return body
+
+    def response(self, path, request):
+        asset = self._load(path)
+        if asset is None:
+            raise NotFound()
+        compressible = is_compressible(asset.mimetype)
+        encoding = negotiate_encoding(request) if compressible and len(asset.body) >= self.min_size else None
+        etag = f"{asset.version}-{encoding}" if encoding else asset.version
+        headers = {"Cache-Control": IMMUTABLE if request.args.get("v") == asset.version else REVALIDATE}
+        if compressible:
+            headers["Vary"] = "Accept-Encoding"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304, headers=headers)
+        else:
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            response = Response(self._variant(asset, encoding), headers=headers,
+                                content_type=get_content_type(asset.mimetype, "utf-8"))
+        response.set_etag(etag)
+        return response
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseSnapshot:
+    """Immutable bundle of everything retrieval needs for one version of the knowledge base."""
+
+    __slots__ = ("version", "chunks", "embeddings", "search_engine", "lexical_index", "duplicates", "loaded_at",
+                 "generation")
+
+    def __init__(self, version, chunks, embeddings, search_engine, lexical_index=None, duplicates=None,
+                 loaded_at=None):
+        self.version = version
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.search_engine = search_engine
+        self.lexical_index = lexical_index
+        self.duplicates = duplicates
+        self.loaded_at = loaded_at or time.time()
+        # Set by the reloader on activation; grows with every swap, unlike the content-hash version
+        self.generation = 0
+
+
+class KnowledgeBaseReloader:
+    """Holds the active snapshot and replaces it with freshly built ones in the background.
+
+    Requests read `current` once and keep using that snapshot, so a swap never
+    affects a request already in flight. Rebinding the attribute is atomic, and
+    building happens on a worker thread, so a reload never blocks the chat routes.
+    """
+
+    def __init__(self, build_snapshot, watch_paths=(), watch_interval=30):
+        self.build_snapshot = build_snapshot
+        self.watch_paths = list(watch_paths)
+        self.watch_interval = watch_interval
+        self.current = None
+        self.reload_count = 0
+        self.last_error = None
+        self.last_reload_started = None
+        self.last_reload_seconds = None
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self._mtimes = self._read_mtimes()
+
+    # Register a callback invoked with the new snapshot after every swap
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def load(self):
+        if self._reload_lock.acquire(blocking=False):
+            self._reload(reason="startup")
+        else:
+            # Wait for the reload already running instead of returning before it produced a snapshot
+            with self._reload_lock:
+                pass
+        return self.current
+
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    # Start a background reload; returns False if one is already running
+    def reload_async(self, reason="manual"):
+        # The lock is taken here and released by the worker when the build finishes
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        thread = threading.Thread(target=self._reload, kwargs={"reason": reason},
+                                  name="kb-reload", daemon=True)
+        thread.start()
+        return True
+
+    def _reload(self, reason):
+        try:
+            self.last_reload_started = time.time()
+            start = time.perf_counter()
+            logger.info(f"Building knowledge base snapshot ({reason})")
+            snapshot = self.build_snapshot()
+            # Read after the build, so files the build itself rewrites (a legacy store migration)
+            # do not look changed to the watcher
+            self._mtimes = self._read_mtimes()
+            self.last_reload_seconds = time.perf_counter() - start
+            self.last_error = None
+            if self.current is not None and snapshot.version == self.current.version:
+                logger.info(f"Knowledge base unchanged at version {str(snapshot.version)[:12]}")
+                return
+            self.reload_count += 1
+            snapshot.generation = self.reload_count
+            self.current = snapshot
+            logger.info(f"Activated knowledge base version {str(snapshot.version)[:12]} "
+                        f"with {len(snapshot.chunks)} chunks in {self.last_reload_seconds:.2f}s")
+            for callback in self._listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    logger.error(f"Knowledge base listener failed: {str(e)}")
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Knowledge base reload failed, keeping the current snapshot: {str(e)}")
+        finally:
+            self._reload_lock.release()
+
+    def _read_mtimes(self):
+        mtimes = {}
+        for path in self.watch_paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    # Poll the artifact files and reload when any of them changes
+    def start_watching(self):
+        if self._watcher is not None or not self.watch_paths or self.watch_interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="kb-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            if self._read_mtimes() != self._mtimes:
+                self.reload_async(reason="artifacts changed")
+
+    def status(self):
+        snapshot = self.current
+        return {
+            "version": snapshot.version if snapshot else None,
+            "chunks": len(snapshot.chunks) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "reloading": self.reloading,
+            "reload_count": self.reload_count,
+            "last_reload_started": self.last_reload_started,
+            "last_reload_seconds": self.last_reload_seconds,
+            "last_error": self.last_error,
+        }
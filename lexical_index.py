@@ -0,0 +1,219 @@
+import re
+import math
+import hashlib
+from array import array
+from collections import Counter
+import numpy as np
+
+from search_engine import top_k_indices
+
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d[\d,]*(?:\.\d+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by do does for from has have how i if in is it its me my of on or our
+so that the their them there these this to was we what when where which who why will with you your
+""".split())
+
+
+# Lowercase word and number tokens; "$13,500" -> "13500", "CS 1301" / "CS1301" -> "cs", "1301", "cs1301".
+# Single letters (the "s" of "what's") carry no meaning and are dropped like stopwords
+def tokenize(text):
+    raw = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token[0].isdigit():
+            token = token.replace(",", "").rstrip(".")
+        raw.append(token)
+
+    tokens = [token for token in raw if token not in STOPWORDS and (len(token) > 1 or token.isdigit())]
+    for current, following in zip(raw, raw[1:]):
+        # Course codes are a short subject prefix followed by a 3-4 digit number
+        if current.isalpha() and 2 <= len(current) <= 4 and following.isdigit() and 3 <= len(following) <= 4:
+            tokens.append(current + following)
+    return tokens
+
+
+def document_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class LexicalIndex:
+    """BM25 inverted index with compact postings and incremental add/remove.
+
+    Postings are parallel `array('i')` buffers of internal document ids and term
+    frequencies, read with zero-copy numpy views at query time. Removing a
+    document only tombstones it; postings are rewritten from the forward index
+    once enough of them are dead.
+    """
+
+    def __init__(self, k1=1.5, b=0.75, compact_ratio=0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.term_ids = {}
+        self.postings_docs = []
+        self.postings_tfs = []
+        self.df = array("i")
+        self.doc_len = array("i")
+        self.alive = bytearray()
+        self.positions = array("i")
+        self.doc_keys = []
+        self.doc_terms = []
+        self.key_to_id = {}
+        self.live_count = 0
+        self.total_len = 0
+
+    @classmethod
+    def from_chunks(cls, chunks, **params):
+        index = cls(**params)
+        for position, chunk in enumerate(chunks):
+            index.add(document_key(chunk["content"]), chunk["content"], position)
+        return index
+
+    def __len__(self):
+        return self.live_count
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.postings_docs)
+            self.term_ids[term] = term_id
+            self.postings_docs.append(array("i"))
+            self.postings_tfs.append(array("i"))
+            self.df.append(0)
+        return term_id
+
+    def add(self, key, text, position):
+        if key in self.key_to_id:
+            self.remove(key)
+        counts = Counter(tokenize(text))
+        doc_id = len(self.doc_len)
+        term_ids = array("i")
+        tfs = array("i")
+        for term, tf in counts.items():
+            term_id = self._term_id(term)
+            self.postings_docs[term_id].append(doc_id)
+            self.postings_tfs[term_id].append(tf)
+            self.df[term_id] += 1
+            term_ids.append(term_id)
+            tfs.append(tf)
+        length = sum(counts.values())
+        self.doc_len.append(length)
+        self.alive.append(1)
+        self.positions.append(position)
+        self.doc_keys.append(key)
+        self.doc_terms.append((term_ids, tfs))
+        self.key_to_id[key] = doc_id
+        self.live_count += 1
+        self.total_len += length
+
+    def remove(self, key):
+        doc_id = self.key_to_id.pop(key, None)
+        if doc_id is None:
+            return False
+        self.alive[doc_id] = 0
+        for term_id in self.doc_terms[doc_id][0]:
+            self.df[term_id] -= 1
+        self.live_count -= 1
+        self.total_len -= self.doc_len[doc_id]
+        if len(self.doc_len) - self.live_count > self.compact_ratio * max(len(self.doc_len), 1):
+            self.compact()
+        return True
+
+    # Rewrite postings without tombstoned documents, renumbering the survivors
+    def compact(self):
+        survivors = [doc_id for doc_id in range(len(self.doc_len)) if self.alive[doc_id]]
+        old = (self.doc_len, self.positions, self.doc_keys, self.doc_terms)
+        self.postings_docs = [array("i") for _ in self.postings_docs]
+        self.postings_tfs = [array("i") for _ in self.postings_tfs]
+        self.doc_len, self.positions, self.doc_keys, self.doc_terms = array("i"), array("i"), [], []
+        self.alive = bytearray(len(survivors))
+        self.key_to_id = {}
+        for new_id, doc_id in enumerate(survivors):
+            term_ids, tfs = old[3][doc_id]
+            for term_id, tf in zip(term_ids, tfs):
+                self.postings_docs[term_id].append(new_id)
+                self.postings_tfs[term_id].append(tf)
+            self.doc_len.append(old[0][doc_id])
+            self.positions.append(old[1][doc_id])
+            self.doc_keys.append(old[2][doc_id])
+            self.doc_terms.append(old[3][doc_id])
+            self.alive[new_id] = 1
+            self.key_to_id[old[2][doc_id]] = new_id
+
+    # Bring the index in line with a new chunk list, only tokenizing chunks it has not seen
+    def sync(self, chunks):
+        keys = [document_key(chunk["content"]) for chunk in chunks]
+        wanted = set(keys)
+        removed = [key for key in self.key_to_id if key not in wanted]
+        for key in removed:
+            self.remove(key)
+        added = 0
+        for position, (key, chunk) in enumerate(zip(keys, chunks)):
+            doc_id = self.key_to_id.get(key)
+            if doc_id is None:
+                self.add(key, chunk["content"], position)
+                added += 1
+            else:
+                self.positions[doc_id] = position
+        return added, len(removed)
+
+    def copy(self):
+        clone = LexicalIndex(self.k1, self.b, self.compact_ratio)
+        clone.term_ids = dict(self.term_ids)
+        clone.postings_docs = [array("i", postings) for postings in self.postings_docs]
+        clone.postings_tfs = [array("i", postings) for postings in self.postings_tfs]
+        clone.df = array("i", self.df)
+        clone.doc_len = array("i", self.doc_len)
+        clone.alive = bytearray(self.alive)
+        clone.positions = array("i", self.positions)
+        clone.doc_keys = list(self.doc_keys)
+        clone.doc_terms = list(self.doc_terms)
+        clone.key_to_id = dict(self.key_to_id)
+        clone.live_count = self.live_count
+        clone.total_len = self.total_len
+        return clone
+
+    def _idf(self, df):
+        return math.log(1 + (self.live_count - df + 0.5) / (df + 0.5))
+
+    # What a document of average length containing each query term once scores: the sum of the terms'
+    # IDFs. Terms no document contains count at the highest IDF, so a query about something the corpus
+    # lacks cannot be matched in full by its one common word
+    def query_weight(self, query):
+        return sum(self._idf(self.df[self.term_ids[term]] if term in self.term_ids else 0)
+                   for term in set(tokenize(query)))
+
+    # Return (chunk positions, BM25 scores) of the best matching live documents
+    def search(self, query, top_k=5):
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if not self.live_count:
+            return empty
+        term_ids = {self.term_ids[term] for term in tokenize(query) if term in self.term_ids}
+        if not term_ids:
+            return empty
+
+        doc_len = np.frombuffer(self.doc_len, dtype=np.int32)
+        norm = self.k1 * (1 - self.b + self.b * doc_len / (self.total_len / self.live_count))
+        scores = np.zeros(len(doc_len), dtype=np.float32)
+        for term_id in term_ids:
+            df = self.df[term_id]
+            if df <= 0:
+                continue
+            docs = np.frombuffer(self.postings_docs[term_id], dtype=np.int32)
+            tf = np.frombuffer(self.postings_tfs[term_id], dtype=np.int32)
+            idf = self._idf(df)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        scores *= np.frombuffer(self.alive, dtype=np.uint8)
+
+        best = top_k_indices(scores, top_k)
+        best = best[scores[best] > 0]
+        return np.frombuffer(self.positions, dtype=np.int32)[best].astype(np.int64), scores[best]
+
+
+# Combine ranked lists of chunk positions; each list contributes 1 / (k + rank)
+def reciprocal_rank_fusion(rankings, k=60):
+    fused = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            fused[int(position)] = fused.get(int(position), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
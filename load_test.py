@@ -0,0 +1,260 @@
+"""Replay a mix of student questions against a running assistant and report latency per route.
+
+    python mock_anthropic.py --latency lognormal:1.5,0.4 &
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8081 ANTHROPIC_API_KEY=test python nau_assistant_final.py &
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 32 --duration 60
+
+The mix covers FAQ hits (patterns from data/faq.json), retrieval questions that go
+to the model, and follow-up replies to FAQ answers that ask one.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+from faq import FAQ_PATH, load_faq as load_faq_entries
+
+RETRIEVAL_QUERIES = [
+    "What are the housing options on campus and how much do they cost?",
+    "How much are the meal plans per semester?",
+    "What scholarships are available for international students?",
+    "When is the application deadline for the fall semester?",
+    "Does NAU offer a master's degree in computer science?",
+    "What are the English proficiency requirements for admission?",
+    "How many credits do I need to graduate with a BBA?",
+    "Where is North American University located?",
+    "Can I work on campus as an international student?",
+    "What is the summer tuition per class?",
+    "How do I contact the registrar's office?",
+    "Is there a graduate program in education?",
+    "What documents do I need to transfer from another university?",
+    "Are there student clubs and organizations at NAU?",
+    "How do I request an official transcript?",
+    "What is the cost per credit for part-time undergraduate students?",
+]
+
+# A reply that every kind of follow-up question in the FAQ understands
+FOLLOW_UP_REPLIES = {
+    "yes_response": ["yes", "no"],
+    "undergraduate_response": ["undergraduate", "graduate"],
+    "custom_response": ["computer science", "business", "education"],
+}
+
+
+# FAQ answers and match patterns by key, read from the same file the server uses
+def load_faq(path=FAQ_PATH):
+    entries = load_faq_entries(path)
+    return {entry["key"]: entry for entry in entries}, {entry["key"]: entry["patterns"] for entry in entries}
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.first_token = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.requests = defaultdict(int)
+
+    def record(self, key, latency, error=None, first_token=None):
+        with self.lock:
+            self.requests[key] += 1
+            if error:
+                self.errors[key][error] += 1
+            else:
+                self.latencies[key].append(latency)
+                if first_token is not None:
+                    self.first_token[key].append(first_token)
+
+
+class Worker(threading.Thread):
+    def __init__(self, number, args, scenarios, faq, results, stop):
+        super().__init__(daemon=True)
+        self.number = number
+        self.args = args
+        self.scenarios = scenarios
+        self.predefined, self.patterns, self.follow_up_keys = faq
+        self.results = results
+        self.stop = stop
+        self.rng = random.Random(args.seed + number)
+        self.sent = 0
+
+    # POST one question; returns the response data, or None on failure
+    def ask(self, scenario, chat_id, query, follow_up_to=None):
+        stream = self.rng.random() < self.args.stream_share
+        route = "/api/chat/stream" if stream else "/api/chat"
+        payload = {"chat_id": chat_id, "query": query}
+        if follow_up_to:
+            payload["follow_up_to"] = follow_up_to
+        key = (scenario, route)
+        start = time.perf_counter()
+        try:
+            if not stream:
+                response = self.client.post(route, json=payload)
+                latency = time.perf_counter() - start
+                if response.status_code >= 400:
+                    self.results.record(key, latency, error=f"HTTP {response.status_code}")
+                    return None
+                self.results.record(key, latency)
+                return response.json()
+
+            first_token = None
+            done = None
+            event = None
+            with self.client.stream("POST", route, json=payload) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    self.results.record(key, time.perf_counter() - start, error=f"HTTP {response.status_code}")
+                    return None
+                for line in response.iter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        if event == "delta" and first_token is None:
+                            first_token = time.perf_counter() - start
+                        elif event == "done":
+                            done = json.loads(line[6:])
+            latency = time.perf_counter() - start
+            if done is None:
+                self.results.record(key, latency, error="stream ended without done")
+                return None
+            self.results.record(key, latency, first_token=first_token)
+            return done
+        except httpx.HTTPError as e:
+            self.results.record(key, time.perf_counter() - start, error=type(e).__name__)
+            return None
+
+    def run(self):
+        self.client = httpx.Client(base_url=self.args.url, timeout=self.args.timeout)
+        names = [name for name, _ in self.scenarios]
+        weights = [weight for _, weight in self.scenarios]
+        while not self.stop.is_set():
+            if self.args.requests and self.sent >= self.args.requests:
+                break
+            self.sent += 1
+            chat_id = f"load_{self.number}_{self.sent}"
+            scenario = self.rng.choices(names, weights)[0]
+            if scenario == "faq":
+                key = self.rng.choice(list(self.patterns))
+                self.ask("faq", chat_id, self.rng.choice(self.patterns[key]))
+            elif scenario == "retrieval":
+                query = self.rng.choice(RETRIEVAL_QUERIES)
+                if self.args.unique:
+                    # Defeats the answer cache and request coalescing, so every question reaches the model
+                    query = f"{query} (ref {self.rng.getrandbits(32):08x})"
+                self.ask("retrieval", chat_id, query)
+            else:
+                key = self.rng.choice(self.follow_up_keys)
+                answer = self.ask("faq", chat_id, self.rng.choice(self.patterns[key]))
+                if answer and answer.get("follow_up_id"):
+                    follow_up = self.predefined[key]["follow_up"]
+                    reply_kind = next(kind for kind in FOLLOW_UP_REPLIES if follow_up.get(kind))
+                    self.ask("follow_up", chat_id, self.rng.choice(FOLLOW_UP_REPLIES[reply_kind]),
+                             follow_up_to=answer["follow_up_id"])
+        self.client.close()
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def percentile_ms(values, q):
+    return f"{np.percentile(values, q) * 1000:.0f}" if values else "-"
+
+
+def report(results, elapsed):
+    print(f"\n{'scenario':<10} {'route':<17} {'requests':>8} {'errors':>7} {'err %':>6} {'req/s':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'ttft p50':>9}")
+    summary = {}
+    totals = [0, 0]
+    for key in sorted(results.requests):
+        scenario, route = key
+        requests = results.requests[key]
+        errors = sum(results.errors[key].values())
+        latencies = results.latencies[key]
+        totals[0] += requests
+        totals[1] += errors
+        print(f"{scenario:<10} {route:<17} {requests:>8} {errors:>7} {100 * errors / requests:>6.1f} "
+              f"{requests / elapsed:>7.1f} {percentile_ms(latencies, 50):>7} {percentile_ms(latencies, 95):>7} "
+              f"{percentile_ms(latencies, 99):>7} {percentile_ms(results.first_token[key], 50):>9}")
+        summary[f"{scenario} {route}"] = {
+            "requests": requests,
+            "errors": dict(results.errors[key]),
+            "throughput": requests / elapsed,
+            "p50_ms": np.percentile(latencies, 50) * 1000 if latencies else None,
+            "p95_ms": np.percentile(latencies, 95) * 1000 if latencies else None,
+            "p99_ms": np.percentile(latencies, 99) * 1000 if latencies else None,
+        }
+    if totals[0]:
+        print(f"\nTotal: {totals[0]} requests in {elapsed:.1f}s ({totals[0] / elapsed:.1f} req/s), "
+              f"{totals[1]} errors ({100 * totals[1] / totals[0]:.1f}%)")
+    for key in sorted(results.errors):
+        for error, count in results.errors[key].items():
+            print(f"  {key[0]} {key[1]}: {count} x {error}")
+    return summary
+
+
+def parse_mix(spec):
+    scenarios = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("faq", "retrieval", "follow_up"):
+            raise ValueError(f"Unknown scenario: {name}")
+        scenarios.append((name, float(weight)))
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the chat API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Scenarios per worker (0 = until --duration)")
+    parser.add_argument("--mix", default="faq=0.4,retrieval=0.5,follow_up=0.1")
+    parser.add_argument("--stream-share", type=float, default=0.0, help="Fraction sent to /api/chat/stream")
+    parser.add_argument("--unique", action="store_true", help="Make every retrieval question distinct")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    predefined, patterns = load_faq()
+    follow_up_keys = [key for key in patterns if "follow_up" in predefined.get(key, {})]
+    faq = (predefined, {key: patterns[key] for key in patterns if key in predefined}, follow_up_keys)
+
+    if not wait_until_ready(args.url, 120):
+        raise SystemExit(f"{args.url} did not become ready")
+
+    results = Results()
+    stop = threading.Event()
+    workers = [Worker(i, args, parse_mix(args.mix), faq, results, stop) for i in range(args.concurrency)]
+    print(f"Running {args.concurrency} workers against {args.url} (mix {args.mix}, "
+          f"{args.stream_share:.0%} streamed)")
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    deadline = start + args.duration
+    while any(worker.is_alive() for worker in workers):
+        if time.perf_counter() >= deadline and not args.requests:
+            stop.set()
+        time.sleep(0.1)
+    summary = report(results, time.perf_counter() - start)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Offline stand-in for the Anthropic Messages API, for load tests.
+
+Start it and point the assistant at it:
+
+    python mock_anthropic.py --port 8081 --latency lognormal:1.5,0.4 --error-rate 0.02
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8081 ANTHROPIC_API_KEY=test python nau_assistant_final.py
+
+Latency is the time to the first token; answers are then generated at
+--tokens-per-second, streamed as they go or returned whole at the end. Prompt
+caching is simulated: a system prompt marked with cache_control is reported as
+cache creation the first time and as a cache read afterwards. GET /stats
+returns request counters.
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from context_assembly import count_tokens
+
+ANSWER_WORDS = ("North American University offers students friendly support with admissions, tuition, "
+                "housing, scholarships, course registration and campus life. Please check the university "
+                "website for the latest details and let me know if you have any other questions.").split()
+
+
+# "fixed:1.2", "uniform:0.5,2", "normal:1.5,0.3" or "lognormal:<median>,<sigma>" -> sampler in seconds
+def parse_distribution(spec):
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        # Parameterised by the median, which is what latency dashboards report
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.latency = parse_distribution(args.latency)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.cached_prefixes = set()
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def sample(self):
+        with self.lock:
+            return (self.latency(self.rng), self.rng.random() < self.args.error_rate,
+                    self.rng.choice(self.args.error_status),
+                    max(1, int(self.rng.gauss(self.args.output_tokens, self.args.output_tokens / 4))))
+
+    # Returns (uncached input tokens, cache read tokens, cache creation tokens)
+    def usage(self, body):
+        system = body.get("system") or ""
+        blocks = [{"type": "text", "text": system}] if isinstance(system, str) else system
+        prefix_tokens = 0
+        cached_tokens = 0
+        prefix = hashlib.sha1()
+        for block in blocks:
+            tokens = count_tokens(block.get("text", ""))
+            prefix.update(block.get("text", "").encode("utf-8"))
+            prefix_tokens += tokens
+            if block.get("cache_control"):
+                cached_tokens = prefix_tokens
+        message_tokens = sum(count_tokens(m["content"] if isinstance(m["content"], str)
+                                          else " ".join(b.get("text", "") for b in m["content"]))
+                             for m in body.get("messages", []))
+        uncached = prefix_tokens - cached_tokens + message_tokens
+        # The real API only caches prefixes above a minimum length; the mock caches any marked prefix
+        if not cached_tokens:
+            return uncached, 0, 0
+        key = prefix.hexdigest()
+        with self.lock:
+            hit = key in self.cached_prefixes
+            self.cached_prefixes.add(key)
+        return (uncached, cached_tokens, 0) if hit else (uncached, 0, cached_tokens)
+
+
+def make_answer(output_tokens):
+    # Roughly one token per word for the filler text
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(output_tokens)]
+    return " ".join(words)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_json(404, {"error": "not found"})
+            return
+        state = self.state
+        with state.lock:
+            self.send_json(200, {"requests": state.requests, "streams": state.streams, "errors": state.errors,
+                                 "in_flight": state.in_flight, "peak_in_flight": state.peak_in_flight})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/v1/messages":
+            self.send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.in_flight += 1
+            state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            latency, failed, status, output_tokens = state.sample()
+            output_tokens = min(output_tokens, body.get("max_tokens", output_tokens))
+            time.sleep(latency)
+            if failed:
+                with state.lock:
+                    state.errors += 1
+                error_type = "overloaded_error" if status == 529 else "api_error"
+                self.send_json(status, {"type": "error", "error": {"type": error_type, "message": "Mock failure"}})
+                return
+            uncached, cache_read, cache_creation = state.usage(body)
+            usage = {"input_tokens": uncached, "output_tokens": output_tokens,
+                     "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_creation}
+            answer = make_answer(output_tokens)
+            message_id = f"msg_mock_{random.getrandbits(48):012x}"
+            if body.get("stream"):
+                with state.lock:
+                    state.streams += 1
+                self.stream(body, message_id, answer, usage)
+            else:
+                # A non-streamed answer arrives once it has been generated in full
+                if state.args.tokens_per_second > 0:
+                    time.sleep(output_tokens / state.args.tokens_per_second)
+                self.send_json(200, {
+                    "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+                    "content": [{"type": "text", "text": answer}],
+                    "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+                })
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def stream(self, body, message_id, answer, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        start_usage = dict(usage, output_tokens=1)
+        event("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None, "usage": start_usage}})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        delay = 1.0 / self.state.args.tokens_per_second if self.state.args.tokens_per_second > 0 else 0.0
+        for i, word in enumerate(answer.split(" ")):
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": word if i == 0 else " " + word}})
+            if delay:
+                time.sleep(delay)
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:1.5,0.4",
+                        help="Time to first token: fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Streaming speed (0 = instant)")
+    parser.add_argument("--output-tokens", type=int, default=250, help="Mean answer length in tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, nargs="+", default=[529, 500])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    MockHandler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Mock Anthropic API listening on http://{args.host}:{args.port} (latency {args.latency}, "
+          f"error rate {args.error_rate:.1%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
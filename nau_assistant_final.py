@@ -1,374 +1,335 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import time
-import re
-import anthropic
-from sentence_transformers import SentenceTransformer
+import hashlib
+import uuid
 import numpy as np
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
+import atexit
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from ann_index import load_or_build_index
+from quantization import build_quantized_index
+from embedding_store import open_store, store_exists, store_paths, write_store, StoreError
+from knowledge_base import KnowledgeBaseSnapshot, KnowledgeBaseReloader
+from search_engine import normalize_rows
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from reranker import build_reranker
+from caching import QueryEmbeddingCache, SemanticAnswerCache, context_hash
+from context_assembly import ContextAssembler, CHARS_PER_TOKEN, use_tiktoken
+from near_duplicates import DuplicateIndex, RepresentativeIndex
+from coalescing import SingleFlight, coalescing_key
+from resilience import CircuitBreaker, guarded, hedged_call, extractive_answer
+from conversation_memory import ConversationMemory
+from precompute_answers import PrecomputedAnswers, ANSWER_STORE_PATH
+from chat_store import build_chat_store
+from faq import FAQCatalog, FAQ_PATH
+from http_caching import StaticAssets, compress_response, conditional_response
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Histogram, CallbackMetric, process_memory
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("assistant.log"),
-        logging.StreamHandler()
-    ]
-)
+# Set up logging, unless the importing process already did (precompute_answers.py must not write to the log it reads)
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("assistant.log"),
+            logging.StreamHandler()
+        ]
+    )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
+
+# Responses smaller than this go out uncompressed; static files are served with content-hash ETags
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+static_assets = StaticAssets(os.path.join(os.path.dirname(__file__), 'static'), min_size=COMPRESS_MIN_SIZE)
 
 # Configure Anthropic client
 load_dotenv()
 
 # Get API key from environment variables
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-if not ANTHROPIC_API_KEY:
-    raise ValueError("Missing ANTHROPIC_API_KEY environment variable. Please set it in your .env file.")
-    
-# Initialize the Anthropic client with the API key
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+# Point at a stand-in such as mock_anthropic.py for offline load tests (None uses the real API)
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+
+# The Anthropic client and the embeddings model are heavy to import and construct,
+# so they are created on first use (normally by the background initializer below)
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+client = None
+model = None
+_init_lock = threading.Lock()
+
+def get_client():
+    global client
+    if client is None:
+        with _init_lock:
+            if client is None:
+                if not ANTHROPIC_API_KEY:
+                    raise ValueError("Missing ANTHROPIC_API_KEY environment variable. Please set it in your .env file.")
+                import anthropic
+                # Initialize the Anthropic client with the API key; retries and timeouts follow the latency budget
+                client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL,
+                                             max_retries=0, timeout=LLM_LATENCY_BUDGET)
+    return client
+
+def get_model():
+    global model
+    if model is None:
+        with _init_lock:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return model
+
+# Per-stage timings and outcome counters, served in Prometheus format at /metrics
+STAGE_SECONDS = Histogram("nau_chat_stage_seconds", "Time spent in each stage of answering a chat request",
+                          ["stage"])
+HTTP_REQUEST_SECONDS = Histogram("nau_http_request_duration_seconds",
+                                 "Time to produce a response (for streams, until the headers are sent)",
+                                 ["route", "method", "status"])
+ANSWERS = Counter("nau_chat_answers_total", "Answers sent, by where the answer came from", ["source"])
+LLM_CALLS = Counter("nau_llm_calls_total", "Model API calls, by outcome", ["mode", "outcome"])
+LLM_TOKENS = Counter("nau_llm_tokens_total", "Model tokens, by kind", ["kind"])
+RETRIEVED_CHUNKS = Histogram("nau_retrieved_chunks", "Chunks selected for the prompt by retrieval",
+                             buckets=(0, 1, 2, 3, 4, 5, 8, 13, 20))
+CONTEXT_TOKENS = Histogram("nau_context_tokens", "Tokens of retrieved context packed into the prompt",
+                           buckets=(0, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000))
+KB_BUILD_SECONDS = Histogram("nau_knowledge_base_build_seconds", "Time to load and index a knowledge base snapshot",
+                             ["stage"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
 
-# Load embeddings model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+@STAGE_SECONDS.time(stage="encode")
+def encode_texts(texts):
+    return get_model().encode(texts)
+
+# Cache query embeddings so repeated questions skip the encoder forward pass
+query_embedding_cache = QueryEmbeddingCache(
+    encode_texts,
+    max_size=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600"))
+)
+
+# Cache model answers for paraphrased questions that retrieve the same context
+answer_cache = SemanticAnswerCache(
+    max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+)
+
+# Answers generated offline by precompute_answers.py for the most frequent logged questions
+precomputed_answers = PrecomputedAnswers(
+    os.getenv("PRECOMPUTED_ANSWERS_PATH", ANSWER_STORE_PATH),
+    check_interval=float(os.getenv("PRECOMPUTED_ANSWERS_CHECK_INTERVAL", "30"))
+)
 
 # Define paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 CHUNKS_PATH = os.path.join(DATA_DIR, "na_edu_chunks.json")
 EMBEDDINGS_PATH = os.path.join(DATA_DIR, "na_edu_embeddings.pkl")
+INDEX_DIR = os.path.join(DATA_DIR, "index")
 
-# Store chat history
-chat_history = {}
-
-# Predefined answers for frequently asked questions (including exact match keys and follow-ups)
-predefined_answers = {
-    "what are the tuition fees": {
-        "answer": """Okay, here are the full tuition and fee details for international and resident students at North American University:
-International Undergraduate:
-- Tuition per credit (1-11 credits): $1,125
-- Tuition per semester (12-16 credits): $13,500
-- Each additional credit over 16 credits: $1,125
-- Summer Tuition per class: $873
-Mandatory Fees per Semester:
-- Departmental Fees: $55
-- Computer & Internet Fees: $100
-- Library Fee: $100
-- Student Service Fee: $95
-- Course with Lab Fee: $75
-- Athletics Fee (Football, Basketball, Soccer): $1,050
-- Athletics Fee (all other sports): $800
-- Parking Fee (Covered/Uncovered): $80/$40
-Estimated Total for International Undergraduate per Semester: $16,826
-Resident Undergraduate:
-- Tuition per credit (1-11 credits): $614
-- Tuition per semester (12-16 credits): $7,368
-- Each additional credit over 16 credits: $614
-- Summer Tuition per class: $873
-Mandatory Fees per Semester: 
-- Departmental Fees: $55
-- Computer & Internet Fees: $100
-- Library Fee: $100
-- Student Service Fee: $95
-- Course with Lab Fee: $75
-- Athletics Fee (Football, Basketball, Soccer): $1,050
-- Athletics Fee (all other sports): $800
-- Parking Fee (Covered/Uncovered): $80/$40
-Estimated Total for Resident Undergraduate per Semester: $10,133
-International Graduate:
-- Tuition per credit: 
-  - MBA: $658
-  - MS Computer Science: $732
-  - M.Ed. Programs: $511
-- Total Tuition (30 credits):
-  - MBA: $19,740
-  - MS Computer Science: $21,960
-  - M.Ed. Programs: $15,330
-Resident Graduate:
-- Tuition per credit:
-  - MBA: $402
-  - MS Computer Science: $402
-  - M.Ed. Programs: $326
-- Total Tuition (30 credits): 
-  - MBA: $12,060
-  - MS Computer Science: $12,060
-  - M.Ed. Programs: $9,780
-Let me know if you need any clarification or have additional questions!""",
-        "sources": ["https://www.na.edu/admissions/tuition-and-fees/"],
-        "follow_up": {
-            "question": "Are you planning to use on-campus housing as well?",
-            "yes_response": """Great! Here's the housing and meal plan information:
-
-Housing Options:
-- Housing On Campus 2 Bed-Room only for men: $2,500.00 per semester
-- Housing On Campus 3 Bed-Room only for men: $2,100.00 per semester
-- Housing On Campus 4 Bed-Room only for men: $1,900.00 per semester
-- Housing on Hotel 2 Bed-Room: $3,600.00 per semester
-- Housing on Hotel 3 Bedroom: $3,000.00 per semester
-- Housing on Apartment 2 Bedroom: $3,200.00 per semester
-- Summer Housing: $1,250.00
-
-Additional Housing Fees:
-- Housing Deposit Fee: $150.00
-- Housing Application Fee: $50.00
-
-Meal Service Options:
-- 19-Meal per Week: $2,500.00 per semester
-- 14-Meal per Week: $1,900.00 per semester
-- 10-Meal per Week: $1,300.00 per semester
-
-Note: Housing is first-come, first-served.
-
-This brings your total estimated costs to:
-- Tuition: $13,500 per semester (12-16 credits)
-- Housing (varies by option): $1,900 - $3,600 per semester
-- Meal Plan (varies by option): $1,300 - $2,500 per semester
-- Mandatory Fees: Approximately $450
-
-Would you like more specific information about any housing options?""",
-            "no_response": """No problem! If you ever need information about housing or other campus services in the future, feel free to ask.
-
-Is there anything else you'd like to know about North American University?"""
-        }
-    },
-    "how do i apply for admission": {
-        "answer": """Okay, here are the steps to apply to North American University as an international student:
-STEP 1: Create and submit application
-- Create your NAU Account at https://apply.na.edu/admission and submit a completed application online.
-STEP 2: Pay application fee* ($75 USD)
-- Please select to make the payment online via Credit Card or an International Wire Transfer by accessing NAU's wire transfer banking information.
-STEP 3: Send Required Documents
-In order to obtain admission to NAU, an international student must submit the following documents by the application deadlines. All application documents should be properly scanned and emailed in PDF format to intadmissions@na.edu:
-1. Copy of Passport: Only the photograph and visa (when received) page are necessary.
-2. Official Academic Credentials & Test Scores: 
-- Official Copy of the High School Diploma Evaluation (The transcript has to be evaluated at one of the agencies listed on the website)
-- Official SAT/ACT, official TOEFL or official IELTS scores.
-3. Certificate of Finances (COF): This form demonstrates that you have sufficient funds to cover the cost of tuition, fees, and living expenses for at least the first year of study.
-4. Affidavit of Support (if applicable): If you will be sponsored by family or another individual, they will need to complete this form.
-Let me know if you have any other questions about the application process!""",
-        "sources": ["https://www.na.edu/admissions/"],
-        "follow_up": {
-            "question": "Are you applying as an undergraduate or graduate student?",
-            "undergraduate_response": """Great! For undergraduate admission, you'll also need to provide:
-
-1. High school transcripts (evaluated by a credential evaluation service)
-2. English proficiency test scores (TOEFL: minimum 61, IELTS: minimum 5.5)
-3. SAT/ACT scores (optional but recommended for scholarship consideration)
-
-The application deadlines are:
-- Fall semester: August 1
-- Spring semester: December 15
-- Summer semester: May 1
-
-Would you like more specific information about any of the undergraduate programs?""",
-            "graduate_response": """Excellent! For graduate admission, you'll need these additional documents:
-
-1. Bachelor's degree transcripts (evaluated by a credential evaluation service)
-2. English proficiency test scores (TOEFL: minimum 79, IELTS: minimum 6.5)
-3. Statement of Purpose
-4. Two letters of recommendation
-5. Resume/CV
-6. GRE/GMAT scores (required for some programs)
-
-The application deadlines are:
-- Fall semester: July 15
-- Spring semester: December 1
-- Summer semester: April 15
-
-Is there a specific graduate program you're interested in learning more about?"""
-        }
-    },
-    "what programs does nau offer": {
-        "answer": """North American University offers the following undergraduate and graduate degree programs:
-Undergraduate Programs:
-- Bachelor of Business Administration (BBA)
-- Bachelor of Science in Computer Science (BS)
-- Bachelor of Science in Criminal Justice (BS)
-- Bachelor of Science in Education (BS)
-Graduate Programs:
-- Master of Business Administration (MBA)
-- Master of Science in Computer Science (MS)
-- Master of Education (M.Ed.) in Curriculum and Instruction
-- Master of Education (M.Ed.) in Educational Leadership
-In addition, NAU also offers the following programs:
-Language Programs:
-- Intensive English Program (IEP)
-- English as a Second Language (ESL)
-Educator Certification Programs:
-- Teacher Certification
-- Principal Certification
-- Superintendent Certification
-Continuing Education Programs:
-- Professional Development Courses
-- Certificate Programs
-The university is committed to providing a well-rounded education that prepares students for successful careers. The degree programs are designed to develop critical thinking, problem-solving, and leadership skills.
-Let me know""",
-        "sources": ["https://www.na.edu/academics/"],
-        "follow_up": {
-            "question": "Which program are you most interested in learning more about?",
-            "custom_response": True
-        }
-    },
-    "how to reset my password": {
-        "answer": """Okay, here are the steps to reset your password for your North American University account:
-1. Go to the password reset page at https://passwordreset.microsoftonline.com/
-2. Enter your NAU username (usually the first initial of your first name followed by your last name, e.g. jsmith@na.edu)
-3. Enter the characters shown in the image to verify you are not a robot.
-4. Select "Email" as the contact method for verification.
-5. Check your email for a verification code and enter it on the next page.
-6. Create a new password, confirm it, and click "Finish".
-7. Once your password has been successfully reset, you can sign in to your NAU account with the new password.
-A few important things to note:
-- You need to complete the reset process within 60 minutes of initiating it.
-- Make sure to update the new password on any devices or email programs you use to access your NAU account.
-- If you have any trouble with the reset process, you can contact the IT Helpdesk at support@na.edu or 832-230-5541 for assistance.
-Let me know if you have any other questions!""",
-        "sources": ["https://www.na.edu/it-services/"]
-    },
-    "how do i select the courses": {
-        "answer": """Okay, here are the steps to select and register for courses at North American University:
-1. Meet with your Academic Advisor
-- Schedule an appointment with your assigned academic advisor to discuss your degree plan and course options.
-- Your advisor can help you select the appropriate courses based on your major, prerequisites, and academic progress.
-2. Review the Course Catalog
-- Familiarize yourself with the course descriptions, prerequisites, and schedules in the university's course catalog.
-- Make a list of the courses you need to take and any electives you're interested in.
-3. Register for Courses
-- Log into your MyNAU student portal at https://portal.na.edu
-- Navigate to the "Registration" section and select "Course Search"
-- Use the filters to find available sections of the courses you need
-- Add the courses to your shopping cart and complete the registration process
-4. Finalize Your Schedule
-- Review your schedule to ensure you've registered for the correct courses and credit hours.
-- Make any necessary adjustments by adding or dropping courses during the add/drop period.
-- Confirm your final schedule and tuition charges on your student account.
-5. Attend Courses
-- Attend all scheduled class sessions and actively participate.
-- Complete all assignments, projects, and exams as required for each course.
-Let me know if you have any other questions about the course selection and registration process!""",
-        "sources": ["https://www.na.edu/academics/registration/"],
-        "follow_up": {
-            "question": "Do you need help with checking course availability for the upcoming semester?",
-            "yes_response": """To check course availability:
-
-1. Log into your MyNAU portal at https://portal.na.edu
-2. Go to the "Student" tab
-3. Click on "Course Search"
-4. Select the upcoming term from the dropdown menu
-5. You can search by:
-   - Course Number (e.g., CS 1301)
-   - Subject (e.g., Computer Science)
-   - Meeting Time (if you have specific scheduling needs)
-   - Instructor (if you prefer a specific professor)
-
-The results will show you:
-- Course name and section
-- Meeting days and times
-- Available seats
-- Instructor name
-- Room location
-
-Remember that some courses fill up quickly, so I recommend registering as soon as your registration period opens. Would you like advice on specific courses?""",
-            "no_response": """Alright! If you ever need help with course selection or have questions about specific courses, feel free to ask. 
-
-Is there anything else I can help you with regarding your studies at North American University?"""
-        }
-    },
-    "how do i access my nau portal": {
-        "answer": """Here are the steps to access the North American University (NAU) student portal:
-1. Open the school website : https://www.na.edu/
-2. Click on the NAU Portal on the top menu
-3. Enter your username and password
-Let me know if you have any other questions about accessing your NAU student portal!""",
-        "sources": ["https://www.na.edu/it-services/"],
-        "follow_up": {
-            "question": "Are you having trouble logging in to your portal?",
-            "yes_response": """If you're having trouble logging in, here are some troubleshooting steps:
-
-1. Make sure you're using the correct username format (usually firstname.lastname or first initial followed by lastname)
-2. Check that Caps Lock is not enabled when typing your password
-3. Clear your browser cache and cookies, then try again
-4. Try using a different browser (Chrome, Firefox, Edge)
-5. If you've forgotten your password, follow the "Forgot Password" link on the login page
-
-If none of these steps work, you can contact the IT Help Desk:
-- Email: support@na.edu
-- Phone: 832-230-5541
-- Hours: Monday-Friday, 8:00 AM - 5:00 PM
-
-Would you like me to explain any of these steps in more detail?""",
-            "no_response": """Great! If you ever encounter any issues with the portal, don't hesitate to ask for help. 
-
-The portal is where you'll find important information like:
-- Course registration
-- Grades and academic records
-- Financial information
-- Campus announcements
-- Access to university email
-
-Is there anything specific you're looking to do in the portal?"""
-        }
-    }
-}
+# Memory-mapped embedding store (see embedding_store.py); the pickle/JSON pair is the legacy format
+STORE_PREFIX = "na_edu"
+EMBEDDING_STORE_VERIFY = os.getenv("EMBEDDING_STORE_VERIFY", "1") == "1"
 
-# Exact match patterns for the predefined questions
-EXACT_MATCHES = {
-    "what are the tuition fees": ["what are the tuition fees", "tuition fees", "what are the tuition and fees", "how much is tuition"],
-    "how do i apply for admission": ["how do i apply for admission", "how do i apply", "application process", "how to apply"],
-    "what programs does nau offer": ["what programs does nau offer", "programs offered", "available degrees", "majors", "degree programs"],
-    "how to reset my password": ["how to reset my password", "reset password", "forgot password", "change password"],
-    "how do i select the courses": ["how do i select the courses", "select courses", "register for classes", "course registration"],
-    "how do i access my nau portal": ["how do i access my nau portal", "access portal", "login to portal", "student portal"]
-}
+# Retrieval backend: "exact" (brute force), "hnsw" or "ivf" (approximate)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "exact")
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+# Optional compressed exact-scan index: "none", "int8" or "binary"; candidates are re-ranked with float vectors
+RETRIEVAL_QUANTIZATION = os.getenv("RETRIEVAL_QUANTIZATION", "none")
+# Sign bits need a much wider short list than int8 codes to recover the float ranking
+QUANTIZATION_RERANK_FACTOR = int(os.getenv("QUANTIZATION_RERANK_FACTOR",
+                                           "32" if RETRIEVAL_QUANTIZATION == "binary" else "4"))
+
+# Hybrid retrieval fuses BM25 hits over chunk text with dense hits (reciprocal rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# A chunk the embedding misses is kept on BM25 evidence alone when it scores at least this share of the
+# query's BM25 weight (see LexicalIndex.query_weight), so sharing one common word is not enough
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "0.5"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+
+# Second retrieval stage: "none", "overlap" (lexical overlap + MMR) or "cross-encoder"
+RERANK_MODE = os.getenv("RERANK_MODE", "overlap")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Near-duplicate chunks (SimHash of word bigrams within DEDUP_MAX_DISTANCE bits of 64) are collapsed at query time;
+# with DEDUP_INDEX the dense index only holds one chunk per cluster
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+DEDUP_INDEX = os.getenv("DEDUP_INDEX", "1") == "1"
+
+# Token budget for retrieved context in the prompt; the re-ranker selects against its character equivalent
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+# Tokens are estimated from length unless TIKTOKEN_ENCODING names an encoding pre-seeded in TIKTOKEN_CACHE_DIR
+use_tiktoken(os.getenv("TIKTOKEN_ENCODING"))
+
+# Second-stage re-ranker (None when RERANK_MODE=none); the cross-encoder model loads on first use
+reranker = None
+if RERANK_MODE != "none":
+    reranker = build_reranker(
+        RERANK_MODE,
+        cross_encoder_model=os.getenv("RERANK_MODEL"),
+        mmr_lambda=float(os.getenv("RERANK_MMR_LAMBDA", "0.7")),
+        char_budget=int(os.getenv("CONTEXT_CHAR_BUDGET", str(CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN))),
+        max_chunks=RETRIEVAL_TOP_K,
+        min_score=float(os.getenv("RERANK_MIN_SCORE", "0.0"))
+    )
+
+# Store chat history: SQLite shared by every worker on the host, with the most recent chats in memory
+chat_store = build_chat_store(
+    os.getenv("CHAT_STORE", "sqlite"),
+    path=os.getenv("CHAT_STORE_PATH", os.path.join(DATA_DIR, "chats.db")),
+    max_hot_chats=int(os.getenv("CHAT_STORE_HOT_CHATS", "1000")),
+    ttl=float(os.getenv("CHAT_TTL_DAYS", "30")) * 86400 or None
+)
+atexit.register(chat_store.close)
+# Sidebar page size for GET /api/chats; older chats are reached with the X-Next-Cursor header
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", "50"))
+MAX_CHATS_PAGE_SIZE = 200
+
+# Token-capped recent turns plus a running summary per chat, used for follow-up questions
+conversation_memory = ConversationMemory(
+    window_tokens=int(os.getenv("CONVERSATION_WINDOW_TOKENS", "600")),
+    summary_tokens=int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "200"))
+)
+
+# Predefined answers for frequently asked questions (match patterns and follow-ups), from data/faq.json;
+# edits to the file are picked up without a restart
+faq_catalog = FAQCatalog(os.getenv("FAQ_PATH", FAQ_PATH), check_interval=float(os.getenv("FAQ_CHECK_INTERVAL", "5")))
+faq_catalog.refresh(strict=True)
 
 # Load data function with auto-refresh capability
 def load_data():
-    global chunks, embeddings, last_data_update
+    chunks, embeddings = None, None
+    knowledge_base_version = None
+    store_rejected = False
     
-    # Check if data files exist
-    if not os.path.exists(CHUNKS_PATH) or not os.path.exists(EMBEDDINGS_PATH):
-        logger.warning("Data files not found. Using minimal knowledge base...")
-        chunks = create_minimal_knowledge_base()
-        
-        # Create embeddings for minimal knowledge base
-        texts = [chunk["content"] for chunk in chunks]
-        embeddings = model.encode(texts)
-        
-        # Save the minimal data
-        with open(CHUNKS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(chunks, f, ensure_ascii=False)
-        with open(EMBEDDINGS_PATH, 'wb') as f:
-            pickle.dump(embeddings, f)
-    else:
+    # Prefer the memory-mapped store: pages are shared by every worker on the host
+    if store_exists(DATA_DIR, STORE_PREFIX):
         try:
-            # Load chunks
-            with open(CHUNKS_PATH, 'r', encoding='utf-8') as f:
-                chunks = json.load(f)
-            
-            # Load embeddings
-            with open(EMBEDDINGS_PATH, 'rb') as f:
-                embeddings = pickle.load(f)
-            
-            logger.info(f"Loaded {len(chunks)} chunks and embeddings")
-        except Exception as e:
-            logger.error(f"Error loading data: {str(e)}")
-            # Create minimal knowledge base as fallback
+            chunks, embeddings, header = open_store(DATA_DIR, STORE_PREFIX, EMBEDDING_MODEL_NAME,
+                                                    verify=EMBEDDING_STORE_VERIFY)
+            knowledge_base_version = header["content_hash"]
+            logger.info(f"Loaded {len(chunks)} chunks and embeddings from store {knowledge_base_version[:12]}")
+        except StoreError as e:
+            logger.error(f"Embedding store rejected: {str(e)}")
+            chunks, embeddings = None, None
+            store_rejected = True
+    
+    if chunks is None:
+        from_legacy = False
+        # Check if data files exist
+        if not os.path.exists(CHUNKS_PATH) or not os.path.exists(EMBEDDINGS_PATH):
+            logger.warning("Data files not found. Using minimal knowledge base...")
             chunks = create_minimal_knowledge_base()
+            
+            # Create embeddings for minimal knowledge base; it is never saved, so a later start
+            # cannot mistake it for scraped data
             texts = [chunk["content"] for chunk in chunks]
-            embeddings = model.encode(texts)
+            embeddings = encode_texts(texts)
+        else:
+            try:
+                # Load chunks
+                with open(CHUNKS_PATH, 'r', encoding='utf-8') as f:
+                    chunks = json.load(f)
+                
+                # Load embeddings
+                with open(EMBEDDINGS_PATH, 'rb') as f:
+                    embeddings = pickle.load(f)
+                
+                logger.info(f"Loaded {len(chunks)} chunks and embeddings from legacy files")
+                from_legacy = True
+            except Exception as e:
+                logger.error(f"Error loading data: {str(e)}")
+                # Create minimal knowledge base as fallback
+                chunks = create_minimal_knowledge_base()
+                texts = [chunk["content"] for chunk in chunks]
+                embeddings = encode_texts(texts)
+        
+        # Migrate legacy data to the store format so the next start maps it instead of unpickling.
+        # Placeholder knowledge bases are never written, and a store that appeared while the legacy
+        # files were read (the scraper writes it right after them) is left alone
+        migrated = False
+        if from_legacy and (store_rejected or not store_exists(DATA_DIR, STORE_PREFIX)):
+            try:
+                write_store(DATA_DIR, STORE_PREFIX, chunks, embeddings, EMBEDDING_MODEL_NAME)
+                chunks, embeddings, header = open_store(DATA_DIR, STORE_PREFIX, EMBEDDING_MODEL_NAME,
+                                                        verify=False)
+                knowledge_base_version = header["content_hash"]
+                migrated = True
+            except (OSError, StoreError) as e:
+                logger.error(f"Error writing embedding store: {str(e)}")
+        if not migrated:
+            embeddings = normalize_rows(embeddings)
+    
+    # Data that did not come from a store is versioned by load time
+    if knowledge_base_version is None:
+        knowledge_base_version = f"unversioned-{time.time()}"
+    return chunks, embeddings, knowledge_base_version
+
+# Build a complete snapshot (data plus search index) without touching the active one
+def build_knowledge_base():
+    with KB_BUILD_SECONDS.time(stage="load"):
+        chunks, embeddings, version = load_data()
+    previous = knowledge_base.current
+    
+    with KB_BUILD_SECONDS.time(stage="dedup"):
+        duplicates = DuplicateIndex.from_chunks(
+            chunks, previous=previous.duplicates if previous is not None else None, max_distance=DEDUP_MAX_DISTANCE)
+    stats = duplicates.stats()
+    logger.info(f"Near-duplicates: {stats['duplicate_chunks']} of {stats['chunks']} chunks in "
+                f"{stats['duplicate_clusters']} clusters (largest {stats['largest_cluster']}), "
+                f"{stats['clusters']} distinct chunks ({stats['reduction']:.1%} smaller)")
+    
+    # Scanning only one chunk per cluster shrinks every dense search by the duplicate share
+    index_positions = None
+    index_vectors = embeddings
+    if DEDUP_INDEX and duplicates.duplicate_count:
+        index_positions = duplicates.representative_positions()
+        index_vectors = embeddings[index_positions]
     
-    # Update the last modified time
-    last_data_update = time.time()
-    return chunks, embeddings
+    build_start = time.perf_counter()
+    if RETRIEVAL_QUANTIZATION != "none":
+        # The codes are built from the representatives, but re-ranking reads their rows of the memory-mapped
+        # store, so no float copy of the corpus stays resident
+        search_engine = build_quantized_index(
+            RETRIEVAL_QUANTIZATION, index_vectors,
+            float_loader=lambda: embeddings,
+            float_rows=index_positions,
+            rerank_factor=QUANTIZATION_RERANK_FACTOR,
+            normalized=True
+        )
+    else:
+        search_engine = load_or_build_index(
+            RETRIEVAL_BACKEND, index_vectors, INDEX_DIR,
+            search_params={"ef_search": HNSW_EF_SEARCH, "nprobe": IVF_NPROBE},
+            normalized=True
+        )
+    KB_BUILD_SECONDS.observe(time.perf_counter() - build_start, stage="vector_index")
+    if index_positions is not None:
+        search_engine = RepresentativeIndex(search_engine, index_positions)
+    
+    lexical_index = None
+    build_start = time.perf_counter()
+    if HYBRID_RETRIEVAL:
+        # Reuse the previous snapshot's inverted index so only new or changed chunks are tokenized
+        if previous is not None and previous.lexical_index is not None:
+            lexical_index = previous.lexical_index.copy()
+            added, removed = lexical_index.sync(chunks)
+            logger.info(f"Updated lexical index: {added} chunks added, {removed} removed")
+        else:
+            lexical_index = LexicalIndex.from_chunks(chunks)
+            logger.info(f"Built lexical index over {len(lexical_index)} chunks")
+        KB_BUILD_SECONDS.observe(time.perf_counter() - build_start, stage="lexical_index")
+    return KnowledgeBaseSnapshot(version, chunks, embeddings, search_engine, lexical_index=lexical_index,
+                                 duplicates=duplicates)
 
 # Create a minimal knowledge base as fallback
 def create_minimal_knowledge_base():
@@ -406,47 +367,107 @@ def create_minimal_knowledge_base():
     ]
     return knowledge
 
-# Function to find a predefined answer for a query - now using exact matches
+# Function to find a predefined answer for a query: the first FAQ entry with a pattern contained in it
 def get_predefined_answer(query):
-    # Clean and normalize the query
-    clean_query = re.sub(r'[^\w\s]', '', query.lower().strip())
-    
-    # Check for exact matches against our predefined patterns
-    for key, patterns in EXACT_MATCHES.items():
-        for pattern in patterns:
-            # Check for exact match or if the query contains the pattern exactly as a phrase
-            if clean_query == pattern or pattern in clean_query:
-                return predefined_answers[key]
-    
-    # No exact match found
-    return None
+    return faq_catalog.lookup(query)
 
 # Retrieval function
-def get_relevant_chunks(query, chunks, embeddings, top_k=5):
+def get_relevant_chunks(query, snapshot, top_k=RETRIEVAL_TOP_K, query_embedding=None):
     try:
-        # Encode the query
-        query_embedding = model.encode([query])[0]
+        chunks = snapshot.chunks
         
-        # Calculate similarity
-        similarities = cosine_similarity([query_embedding], embeddings)[0]
+        # Encode the query (served from cache for repeated questions)
+        if query_embedding is None:
+            query_embedding = query_embedding_cache.get_embedding(query)
         
-        # Get top results
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        if snapshot.lexical_index is None:
+            # Get top results from the pre-normalized index
+            with STAGE_SECONDS.time(stage="vector_search"):
+                top_indices, similarities = snapshot.search_engine.search(query_embedding, top_k)
+            if snapshot.duplicates is not None:
+                top_indices, similarities = snapshot.duplicates.collapse(top_indices, similarities)
+            candidates = [(idx, float(similarity), 0.0) for idx, similarity in zip(top_indices, similarities)]
+            lexical_floor = None
+        else:
+            # Fuse a wider dense list with BM25 hits, so exact tokens like course codes and amounts surface
+            with STAGE_SECONDS.time(stage="vector_search"):
+                dense_indices, dense_scores = snapshot.search_engine.search(query_embedding, HYBRID_CANDIDATES)
+            with STAGE_SECONDS.time(stage="lexical_search"):
+                lexical_indices, lexical_scores = snapshot.lexical_index.search(query, HYBRID_CANDIDATES)
+            if snapshot.duplicates is not None:
+                # Near-copies count once per cluster, fused by cluster but shown through the chunk hit
+                dense_indices, dense_scores = snapshot.duplicates.collapse(dense_indices, dense_scores)
+                lexical_indices, lexical_scores = snapshot.duplicates.collapse(lexical_indices, lexical_scores)
+                dense_keys = snapshot.duplicates.clusters_of(dense_indices)
+                lexical_keys = snapshot.duplicates.clusters_of(lexical_indices)
+            else:
+                dense_keys, lexical_keys = dense_indices, lexical_indices
+            # A cluster both lists hit is shown through its lexical hit, the copy holding the matched terms
+            hit = dict(zip(dense_keys.tolist(), dense_indices.tolist()))
+            hit.update(zip(lexical_keys.tolist(), lexical_indices.tolist()))
+            dense = dict(zip(dense_indices.tolist(), dense_scores.tolist()))
+            lexical = dict(zip(lexical_keys.tolist(), lexical_scores.tolist()))
+            fused = reciprocal_rank_fusion([dense_keys, lexical_keys])[:top_k]
+            lexical_floor = LEXICAL_MIN_SCORE * snapshot.lexical_index.query_weight(query)
+            
+            # Chunks the dense search did not return still get their similarity from the (normalized) store vectors
+            query_vector = normalize_rows(query_embedding)[0]
+            candidates = []
+            for key, _ in fused:
+                idx = hit[key]
+                similarity = dense.get(idx)
+                if similarity is None:
+                    similarity = float(np.asarray(snapshot.embeddings[idx], dtype=np.float32) @ query_vector)
+                candidates.append((idx, similarity, lexical.get(key, 0.0)))
         
         results = []
-        for idx in top_indices:
-            if similarities[idx] > 0.2:  # Only include relevant results
-                results.append({
-                    "content": chunks[idx]["content"],
-                    "source": chunks[idx]["source"] if "source" in chunks[idx] else "https://www.na.edu",
-                    "similarity": similarities[idx]
-                })
+        for idx, similarity, lexical_score in candidates:
+            # Only include relevant results; a strong BM25 match counts even when the embedding misses it
+            if similarity > 0.2 or lexical_floor is not None and lexical_score > 0 and lexical_score >= lexical_floor:
+                chunk = chunks[idx]
+                result = {
+                    "content": chunk["content"],
+                    "source": chunk["source"] if "source" in chunk else "https://www.na.edu",
+                    "similarity": float(similarity),
+                    "chunk_index": int(idx)
+                }
+                if lexical_score:
+                    result["lexical_score"] = float(lexical_score)
+                results.append(result)
         
         return results
     except Exception as e:
         logger.error(f"Error in retrieval: {str(e)}")
         return []
 
+# Two-stage retrieval: a wide first-stage candidate list, then re-ranking into the context budget
+def retrieve_context(query, snapshot, query_embedding=None):
+    timings = {}
+    start = time.perf_counter()
+    if reranker is None:
+        relevant_chunks = get_relevant_chunks(query, snapshot, query_embedding=query_embedding)
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+    else:
+        candidates = get_relevant_chunks(query, snapshot, top_k=RERANK_CANDIDATES, query_embedding=query_embedding)
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        try:
+            relevant_chunks = reranker.rerank(query, candidates, snapshot.embeddings)
+        except Exception as e:
+            logger.error(f"Error in re-ranking, using first-stage order: {str(e)}")
+            relevant_chunks = candidates[:RETRIEVAL_TOP_K]
+        timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        timings["candidates"] = len(candidates)
+    timings["selected"] = len(relevant_chunks)
+    timings["context_chars"] = sum(len(chunk["content"]) for chunk in relevant_chunks)
+    STAGE_SECONDS.observe(timings["retrieve_ms"] / 1000, stage="retrieve")
+    if "rerank_ms" in timings:
+        STAGE_SECONDS.observe(timings["rerank_ms"] / 1000, stage="rerank")
+    RETRIEVED_CHUNKS.observe(len(relevant_chunks))
+    logger.info("Retrieval stages: " + ", ".join(
+        f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}" for key, value in timings.items()))
+    return relevant_chunks, timings
+
 # Process a response based on a follow-up answer
 def process_follow_up_response(follow_up, user_response):
     user_response = user_response.lower().strip()
@@ -467,158 +488,149 @@ def process_follow_up_response(follow_up, user_response):
     
     # For custom responses that require more specific handling
     elif "custom_response" in follow_up and follow_up["custom_response"]:
-        # For the "Which program are you most interested in?" question
-        programs = {
-            "business": "The Bachelor of Business Administration (BBA) program at NAU offers concentrations in Accounting, Finance, International Business, and Management. Students learn key business principles and develop leadership skills. The BBA requires 120 credit hours including general education courses, business core courses, and concentration courses.",
-            "computer science": "The Computer Science program at NAU offers a comprehensive curriculum covering programming, algorithms, database management, and software engineering. Students can specialize in areas like AI, cybersecurity, or data science. The program prepares graduates for careers as software developers, systems analysts, and IT consultants.",
-            "education": "The Education program at NAU prepares students for careers in teaching and educational administration. The program offers specializations in Early Childhood Education, Bilingual Education, and Educational Leadership. Students complete coursework and supervised teaching experiences to prepare for teacher certification.",
-            "criminal justice": "The Criminal Justice program at NAU covers law enforcement, corrections, and legal systems. Students learn about criminal behavior, constitutional law, and public policy. The program prepares graduates for careers in law enforcement, corrections, homeland security, and legal services."
-        }
-        
-        for prog_key, prog_desc in programs.items():
-            if prog_key in user_response:
-                return prog_desc
+        # Reply keywords mapped to answers, e.g. program names for "Which program are you most interested in?"
+        for keyword, answer in follow_up["custom_response"].items():
+            if keyword in user_response:
+                return answer
         
-        # If no specific program matched, give a general response
-        return "Each program at NAU is designed to provide a strong educational foundation and practical skills. I'd be happy to provide more specific information about any program that interests you. Just let me know which one you'd like to learn more about."
+        # If no keyword matched, give a general response
+        if "default_response" in follow_up:
+            return follow_up["default_response"]
     
     # Default general response if we can't determine what the user meant
     return "I'm sorry, I'm not sure how to help with that specific request. Is there something else about North American University that I can assist you with?"
 
 # Load initial data
-chunks, embeddings = load_data()
-last_data_update = time.time()
+knowledge_base = KnowledgeBaseReloader(
+    build_knowledge_base,
+    watch_paths=[store_paths(DATA_DIR, STORE_PREFIX)["header"], CHUNKS_PATH, EMBEDDINGS_PATH],
+    watch_interval=float(os.getenv("KB_WATCH_INTERVAL", "30"))
+)
+
+# Seed the semantic answer cache with the precomputed answers, so paraphrases of them hit too
+def warm_answer_cache(snapshot):
+    entries = precomputed_answers.entries(snapshot.version)
+    for query, answer_context, answer, sources in entries:
+        answer_cache.store(query_embedding_cache.get_embedding(query), answer_context, snapshot.generation,
+                           answer, sources)
+    if entries:
+        logger.info(f"Warmed the answer cache with {len(entries)} precomputed answers")
+
+# Warming encodes every stored question, so it runs off the request path and only once serving
+def warm_answer_cache_async(*_):
+    snapshot = knowledge_base.current
+    if ready.is_set() and snapshot is not None:
+        threading.Thread(target=warm_answer_cache, args=(snapshot,), name="cache-warm", daemon=True).start()
+
+# Reload the store if it changed (its listener then warms the cache), otherwise re-warm from what is loaded
+def refresh_precomputed_answers(*_):
+    if not precomputed_answers.refresh():
+        warm_answer_cache_async()
+
+precomputed_answers.add_listener(warm_answer_cache_async)
+knowledge_base.add_listener(refresh_precomputed_answers)
+
+# Startup state: the port binds immediately while this runs in a background thread
+startup_state = {
+    "started_at": None,
+    "ready_at": None,
+    "model": False,
+    "knowledge_base": False,
+    "client": False,
+    "error": None,
+}
+ready = threading.Event()
+_startup_thread = None
+
+# Load the encoder and knowledge base, then run a warmup encode so the first user request is not cold.
+# Everything here is read-only once loaded, so a pre-fork server runs it once before forking (see wsgi.py)
+def load_resources():
+    startup_state["started_at"] = time.time()
+    get_model()
+    startup_state["model"] = True
+    
+    if knowledge_base.load() is None:
+        raise RuntimeError(knowledge_base.last_error or "Knowledge base failed to load")
+    startup_state["knowledge_base"] = True
+    
+    encode_texts(["What are the tuition fees?"])
+
+# The per-process part of startup: threads and API connections do not survive a fork
+def start_serving():
+    knowledge_base.start_watching()
+    get_client()
+    startup_state["client"] = True
+    
+    startup_state["ready_at"] = time.time()
+    ready.set()
+    logger.info(f"Assistant ready in {startup_state['ready_at'] - startup_state['started_at']:.2f}s")
+    refresh_precomputed_answers()
+
+def initialize():
+    try:
+        if not startup_state["knowledge_base"]:
+            load_resources()
+        start_serving()
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error(f"Startup failed: {str(e)}")
+
+def start_background_init():
+    global _startup_thread
+    with _init_lock:
+        if _startup_thread is None:
+            _startup_thread = threading.Thread(target=initialize, name="startup", daemon=True)
+            _startup_thread.start()
+
+@app.before_request
+def ensure_initializing():
+    if not ready.is_set():
+        start_background_init()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+# Latency per route template, so the label set stays bounded whatever paths clients send
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method,
+                                     status=response.status_code)
+    return response
+
+# Gzip (or brotli, when installed) for JSON and text bodies, negotiated per request; SSE streams pass through
+@app.after_request
+def compress_body(response):
+    return compress_response(response, request, COMPRESS_MIN_SIZE)
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    status = dict(startup_state, ready=ready.is_set())
+    return jsonify(status), 200 if ready.is_set() else 503
+
+# Optional shared secret for the admin endpoints
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def is_admin_request():
+    return not ADMIN_TOKEN or request.headers.get("X-Admin-Token") == ADMIN_TOKEN
 
 @app.route('/')
 def index():
-    return send_from_directory('static', 'index.html')
+    return static_assets.response('index.html', request)
 
 @app.route('/<path:path>')
 def static_files(path):
-    return send_from_directory('static', path)
+    return static_assets.response(path, request)
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    try:
-        data = request.json
-        chat_id = data.get('chat_id', 'default')
-        query = data.get('query', '')
-        follow_up_to = data.get('follow_up_to', None)
-        
-        logger.info(f"Received chat request - chat_id: {chat_id}, query: {query}, follow_up_to: {follow_up_to}")
-        
-        if not query:
-            return jsonify({"error": "Query is required"}), 400
-        
-        # Initialize chat history if it doesn't exist
-        if chat_id not in chat_history:
-            chat_history[chat_id] = []
-        
-        # Add user message to history
-        chat_history[chat_id].append({
-            "role": "user",
-            "content": query,
-            "timestamp": time.time()
-        })
-        
-        # Check if this is a response to a follow-up question
-        if follow_up_to:
-            # Get the original question that prompted the follow-up
-            original_question = None
-            for i, msg in enumerate(chat_history[chat_id]):
-                if msg.get("follow_up_id") == follow_up_to:
-                    # Find the original question that came before this follow-up
-                    for j in range(i-1, -1, -1):
-                        if chat_history[chat_id][j]["role"] == "assistant" and "follow_up" not in chat_history[chat_id][j]:
-                            original_question = chat_history[chat_id][j].get("original_question")
-                            break
-                    break
-            
-            if original_question:
-                # Get the predefined answer for the original question
-                predefined = get_predefined_answer(original_question)
-                if predefined and "follow_up" in predefined:
-                    # Process the user's response to the follow-up
-                    answer = process_follow_up_response(predefined["follow_up"], query)
-                    sources = predefined.get("sources", ["https://www.na.edu"])
-                    
-                    # Add the response to chat history
-                    chat_history[chat_id].append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources,
-                        "timestamp": time.time(),
-                        "is_follow_up_response": True,
-                        "original_question": original_question
-                    })
-                    
-                    return jsonify({
-                        "answer": answer,
-                        "sources": sources,
-                        "chat_id": chat_id
-                    })
-        
-        # If not a follow-up response, check for predefined answers first
-        predefined = get_predefined_answer(query)
-        if predefined:
-            answer = predefined["answer"]
-            sources = predefined["sources"]
-            logger.info("Using predefined answer")
-            
-            # Check if this answer has a follow-up question
-            follow_up = None
-            follow_up_id = None
-            if "follow_up" in predefined:
-                follow_up = predefined["follow_up"]["question"]
-                follow_up_id = f"followup_{int(time.time())}"
-            
-            # Add assistant message to history
-            chat_history[chat_id].append({
-                "role": "assistant",
-                "content": answer,
-                "sources": sources,
-                "timestamp": time.time(),
-                "original_question": query
-            })
-            
-            # If there's a follow-up, add it to history as a separate message
-            if follow_up:
-                chat_history[chat_id].append({
-                    "role": "assistant",
-                    "content": follow_up,
-                    "follow_up": True,
-                    "follow_up_id": follow_up_id,
-                    "timestamp": time.time() + 1,  # +1 to ensure it appears after the main answer
-                    "original_question": query
-                })
-            
-            # Prepare the response
-            response_data = {
-                "answer": answer,
-                "sources": sources,
-                "chat_id": chat_id
-            }
-            
-            # Add follow-up if applicable
-            if follow_up and follow_up_id:
-                response_data["follow_up"] = follow_up
-                response_data["follow_up_id"] = follow_up_id
-            
-            logger.info("Sending predefined response to client")
-            return jsonify(response_data)
-            
-        else:
-            # No predefined answer, use Anthropic API
-            # Get relevant chunks from our knowledge base
-            relevant_chunks = get_relevant_chunks(query, chunks, embeddings)
-            
-            # If we found relevant information, use it to answer
-            if relevant_chunks:
-                context_text = "\n\n".join([chunk["content"] for chunk in relevant_chunks])
-                sources = [chunk["source"] for chunk in relevant_chunks]
-                sources = list(set(sources))  # Remove duplicates
-                
-                system_prompt = """You are an AI chatbot who helps students of the North American University with their inquiries, issues and requests. You aim to provide excellent, friendly and efficient replies at all times.
+# System prompt used when retrieval found relevant context
+CONTEXT_SYSTEM_PROMPT = """You are an AI chatbot who helps students of the North American University with their inquiries, issues and requests. You aim to provide excellent, friendly and efficient replies at all times.
 
 IMPORTANT GUIDELINES:
 1. Be specific and detailed in your responses, especially for questions about tuition, costs, or deadlines.
@@ -634,18 +646,9 @@ IMPORTANT FORMATTING:
 - Keep answers organized but avoid excessive use of markdown formatting
 
 ALWAYS be thorough, friendly, and make sure to provide ALL relevant details from the context."""
-                
-                user_prompt = f"""CONTEXT ABOUT NORTH AMERICAN UNIVERSITY:
-{context_text}
-
-USER QUESTION: {query}
 
-Please provide a detailed, helpful response based exactly on the context provided. Include all specific numbers and details available in the context. If the context doesn't contain the answer, politely inform the user you can only assist with North American University topics. Be conversational, thorough, and friendly.
-
-For formatting, use bullet points with hyphens, not asterisks or hash symbols. Keep your response clean and well-structured without relying on markdown."""
-            else:
-                # If no relevant chunks found, use a more general response
-                system_prompt = """You are an AI chatbot who helps students of the North American University with their inquiries, issues and requests. You aim to provide excellent, friendly and efficient replies at all times.
+# System prompt used when no relevant chunks were found
+GENERAL_SYSTEM_PROMPT = """You are an AI chatbot who helps students of the North American University with their inquiries, issues and requests. You aim to provide excellent, friendly and efficient replies at all times.
 
 IMPORTANT CONSTRAINTS:
 1. Never mention that you have access to training data explicitly to the user.
@@ -655,52 +658,398 @@ IMPORTANT CONSTRAINTS:
 5. Use bullet points with hyphens (-) instead of asterisks (*) or hash symbols (#)
 
 ALWAYS format your response as a helpful university assistant who is friendly and conversational, but also professional."""
-                
-                user_prompt = f"""The user has asked: {query}
 
-If this is related to North American University, provide general information and suggest where they might find more specific details on the university website.
+# Per-question instructions; static, so they belong to the cached system prefix rather than the user turn
+CONTEXT_INSTRUCTIONS = """Please provide a detailed, helpful response based exactly on the context provided. Include all specific numbers and details available in the context. If the context doesn't contain the answer, politely inform the user you can only assist with North American University topics. Be conversational, thorough, and friendly.
+
+For formatting, use bullet points with hyphens, not asterisks or hash symbols. Keep your response clean and well-structured without relying on markdown."""
+
+GENERAL_INSTRUCTIONS = """If the user's question is related to North American University, provide general information and suggest where they might find more specific details on the university website.
+
+If it is not related to North American University, politely inform them that you can only assist with university-related inquiries."""
+
+# System prompts as content blocks; cache_control on the last block marks the whole prefix for prompt caching
+def cached_system(*texts):
+    blocks = [{"type": "text", "text": text} for text in texts]
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+CONTEXT_SYSTEM = cached_system(CONTEXT_SYSTEM_PROMPT, CONTEXT_INSTRUCTIONS)
+GENERAL_SYSTEM = cached_system(GENERAL_SYSTEM_PROMPT, GENERAL_INSTRUCTIONS)
+
+ANTHROPIC_MODEL = "claude-3-7-sonnet-20250219"
+MAX_ANSWER_TOKENS = 1000
+API_ERROR_ANSWER = "I apologize, but I'm having trouble processing your request at the moment. Please try again later or contact NAU directly for assistance."
+API_ERROR_SOURCES = ["https://www.na.edu/contact-us/"]
+
+# Latency SLO for model answers: past the budget, or while the breaker is open, answer extractively
+LLM_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0")) or None
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+llm_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+    slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "15")),
+    reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+)
+llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_CALL_WORKERS", "32")), thread_name_prefix="llm")
 
-If this is not related to North American University, politely inform them that you can only assist with university-related inquiries."""
+# Retrieved chunks are packed into this many tokens, cutting the last one at a sentence boundary
+context_assembler = ContextAssembler(
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    min_chunk_tokens=int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "40"))
+)
+
+# Build the system blocks, user prompt and sources for a query, its retrieved chunks and the chat so far
+@STAGE_SECONDS.time(stage="prompt")
+def build_prompts(query, relevant_chunks, conversation=""):
+    history = f"CONVERSATION SO FAR:\n{conversation}\n\n" if conversation else ""
+    
+    # If we found relevant information, use it to answer
+    if relevant_chunks:
+        context_text, used_chunks, context_tokens = context_assembler.assemble(relevant_chunks)
+        logger.info(f"Context: {len(used_chunks)}/{len(relevant_chunks)} chunks, "
+                    f"{context_tokens}/{context_assembler.token_budget} tokens")
+        CONTEXT_TOKENS.observe(context_tokens)
+        sources = [chunk["source"] for chunk in used_chunks]
+        sources = list(set(sources))  # Remove duplicates
+        
+        user_prompt = f"""{history}CONTEXT ABOUT NORTH AMERICAN UNIVERSITY:
+{context_text}
+
+USER QUESTION: {query}"""
+        return CONTEXT_SYSTEM, user_prompt, sources
+    
+    # If no relevant chunks found, use a more general response
+    user_prompt = f"{history}The user has asked: {query}"
+    return GENERAL_SYSTEM, user_prompt, ["https://www.na.edu"]
+
+# Log how much of the prompt was served from the prompt cache
+def log_usage(usage):
+    if usage is None:
+        return
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    logger.info(f"Input tokens: {cache_read} cached, {usage.input_tokens} uncached, {cache_write} written to cache; "
+                f"output tokens: {usage.output_tokens}")
+    LLM_TOKENS.inc(usage.input_tokens, kind="input")
+    LLM_TOKENS.inc(cache_read, kind="cache_read")
+    LLM_TOKENS.inc(cache_write, kind="cache_write")
+    LLM_TOKENS.inc(usage.output_tokens, kind="output")
+
+# Validate a chat request and record the user's message; returns (chat_id, query, follow_up_to, error)
+@STAGE_SECONDS.time(stage="history")
+def begin_chat_turn(data):
+    chat_id = data.get('chat_id', 'default')
+    query = data.get('query', '')
+    follow_up_to = data.get('follow_up_to', None)
+    
+    logger.info(f"Received chat request - chat_id: {chat_id}, query: {query}, follow_up_to: {follow_up_to}")
+    
+    if not query:
+        return chat_id, query, follow_up_to, (jsonify({"error": "Query is required"}), 400)
+    
+    # Add user message to history (the chat is created if it doesn't exist)
+    chat_store.append(chat_id, {
+        "role": "user",
+        "content": query,
+        "timestamp": time.time()
+    })
+    return chat_id, query, follow_up_to, None
+
+# Answer follow-up replies and FAQ questions without the model; returns the response data or None
+@STAGE_SECONDS.time(stage="faq")
+def answer_without_model(chat_id, query, follow_up_to):
+    # Check if this is a response to a follow-up question
+    if follow_up_to:
+        # Get the original question that prompted the follow-up
+        follow_up_message = chat_store.follow_up(chat_id, follow_up_to)
+        original_question = follow_up_message.get("original_question") if follow_up_message else None
+        
+        if original_question:
+            # Get the predefined answer for the original question
+            predefined = get_predefined_answer(original_question)
+            if predefined and "follow_up" in predefined:
+                # Process the user's response to the follow-up
+                answer = process_follow_up_response(predefined["follow_up"], query)
+                sources = predefined.get("sources", ["https://www.na.edu"])
                 
-                sources = ["https://www.na.edu"]
-            
-            # Call the Anthropic API
-            try:
-                logger.info("Calling Anthropic API...")
-                message = client.messages.create(
-                    model="claude-3-7-sonnet-20250219",
-                    max_tokens=1000,
-                    temperature=0,
-                    system=system_prompt,
-                    messages=[
-                        {"role": "user", "content": user_prompt}
-                    ]
-                )
+                # Add the response to chat history
+                chat_store.append(chat_id, {
+                    "role": "assistant",
+                    "content": answer,
+                    "sources": sources,
+                    "timestamp": time.time(),
+                    "is_follow_up_response": True,
+                    "original_question": original_question
+                })
+                ANSWERS.inc(source="follow_up")
                 
-                answer = message.content[0].text
-                logger.info("Successfully received response from Anthropic API")
-            except Exception as api_error:
-                logger.error(f"Anthropic API error: {str(api_error)}")
-                answer = "I apologize, but I'm having trouble processing your request at the moment. Please try again later or contact NAU directly for assistance."
-                sources = ["https://www.na.edu/contact-us/"]
-            
-            # Add assistant message to history
-            chat_history[chat_id].append({
-                "role": "assistant",
-                "content": answer,
-                "sources": sources,
-                "timestamp": time.time(),
-                "original_question": query,
-                "retrieved_chunks": relevant_chunks if relevant_chunks else []
-            })
-            
-            logger.info("Sending response to client")
-            
-            return jsonify({
-                "answer": answer,
-                "sources": sources,
-                "chat_id": chat_id
-            })
+                return {
+                    "answer": answer,
+                    "sources": sources,
+                    "chat_id": chat_id
+                }
+    
+    # If not a follow-up response, check for predefined answers first
+    predefined = get_predefined_answer(query)
+    if not predefined:
+        return None
+    
+    answer = predefined["answer"]
+    sources = predefined["sources"]
+    logger.info("Using predefined answer")
+    ANSWERS.inc(source="faq")
+    
+    # Check if this answer has a follow-up question
+    follow_up = None
+    follow_up_id = None
+    if "follow_up" in predefined:
+        follow_up = predefined["follow_up"]["question"]
+        follow_up_id = f"followup_{uuid.uuid4().hex}"
+    
+    # Add assistant message to history
+    chat_store.append(chat_id, {
+        "role": "assistant",
+        "content": answer,
+        "sources": sources,
+        "timestamp": time.time(),
+        "original_question": query
+    })
+    
+    # If there's a follow-up, add it to history as a separate message
+    if follow_up:
+        chat_store.append(chat_id, {
+            "role": "assistant",
+            "content": follow_up,
+            "follow_up": True,
+            "follow_up_id": follow_up_id,
+            "timestamp": time.time() + 1,  # +1 to ensure it appears after the main answer
+            "original_question": query
+        })
+    
+    # Prepare the response
+    response_data = {
+        "answer": answer,
+        "sources": sources,
+        "chat_id": chat_id
+    }
+    
+    # Add follow-up if applicable
+    if follow_up and follow_up_id:
+        response_data["follow_up"] = follow_up
+        response_data["follow_up_id"] = follow_up_id
+    
+    logger.info("Sending predefined response to client")
+    return response_data
+
+# Reply sent while the background initializer is still loading the model and index
+def not_ready_response(chat_id):
+    chat_store.pop_last(chat_id)
+    response = jsonify({"error": "The assistant is still starting up. Please try again in a few seconds."})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+# Fold the stored exchanges conversation memory has not seen into it. Normally that is only the previous
+# turn; after a restart, or when another worker answered the earlier turns, it is the rest of the chat
+def restore_conversation(chat_id):
+    synced = conversation_memory.synced_messages(chat_id)
+    messages, total = chat_store.messages_since(chat_id, synced)
+    if messages is None:
+        return
+    if total < synced:
+        # The stored chat is shorter than what was folded in, so it was replaced: start over
+        conversation_memory.forget(chat_id)
+        synced = 0
+        messages, total = chat_store.messages_since(chat_id, 0)
+    question = None
+    consumed = synced
+    for offset, message in enumerate(messages):
+        if message.get("role") == "user":
+            question = message["content"]
+        elif question is not None and not message.get("follow_up"):
+            topic = message.get("topic")
+            if message.get("is_follow_up_response"):
+                topic = message.get("original_question")
+            conversation_memory.add_exchange(chat_id, question, message["content"], topic=topic)
+            question = None
+            consumed = synced + offset + 1
+    # A question still waiting for its answer (this turn's) is read again next time
+    if consumed != synced:
+        conversation_memory.mark_synced(chat_id, consumed)
+
+# Retrieve context and build the prompts for a model-answered turn
+def prepare_model_turn(query, chat_id=None):
+    if chat_id:
+        restore_conversation(chat_id)
+    # Follow-ups are retrieved together with the question they continue, and answered with the
+    # conversation in the prompt. Standalone questions are answered from the knowledge base alone, so
+    # their answers can be shared across turns and chats
+    retrieval_query = conversation_memory.rewrite_query(chat_id, query) if chat_id else query
+    conversation = ""
+    if retrieval_query != query:
+        logger.info(f"Rewrote follow-up for retrieval: {retrieval_query}")
+        conversation = conversation_memory.prompt_context(chat_id)
+    
+    # Get relevant chunks from our knowledge base
+    query_embedding = query_embedding_cache.get_embedding(retrieval_query)
+    # Pin one knowledge base snapshot for the whole request
+    snapshot = knowledge_base.current
+    relevant_chunks, retrieval_timings = retrieve_context(retrieval_query, snapshot, query_embedding)
+    system_prompt, user_prompt, sources = build_prompts(query, relevant_chunks, conversation)
+    
+    # Reuse a cached answer for a near-identical question over the same context
+    retrieved_context = context_hash(relevant_chunks)
+    answer_context = retrieved_context
+    if conversation:
+        # An answer shaped by one chat's history must not be served to another chat
+        answer_context = hashlib.sha1(f"{answer_context}\n{conversation}".encode("utf-8")).hexdigest()
+    with STAGE_SECONDS.time(stage="cache_lookup"):
+        cached = answer_cache.lookup(query_embedding, answer_context, snapshot.generation)
+        if cached is None and not conversation:
+            # Precomputed answers were generated without history, like any standalone answer
+            cached = precomputed_answers.lookup(query, retrieved_context, snapshot.version)
+    
+    return {
+        "query": query,
+        "retrieval_query": retrieval_query,
+        "query_embedding": query_embedding,
+        "snapshot": snapshot,
+        "relevant_chunks": relevant_chunks,
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "sources": sources,
+        "answer_context": answer_context,
+        "cached": cached,
+    }
+
+# Where a model-path answer came from, for the answers counter
+def answer_source(turn, from_api, shared):
+    if turn["cached"]:
+        return "precomputed" if turn["cached"].get("precomputed") else "cache"
+    if shared:
+        return "shared"
+    return "model" if from_api else "fallback"
+
+# Store a model answer in the answer cache (if it came from the API) and in chat history
+@STAGE_SECONDS.time(stage="history")
+def finish_model_turn(chat_id, query, turn, answer, sources, from_api, shared=False):
+    ANSWERS.inc(source=answer_source(turn, from_api, shared))
+    if from_api:
+        answer_cache.store(turn["query_embedding"], turn["answer_context"], turn["snapshot"].generation,
+                           answer, sources)
+    
+    # Add assistant message to history
+    message = {
+        "role": "assistant",
+        "content": answer,
+        "sources": sources,
+        "timestamp": time.time(),
+        "original_question": query,
+        "retrieved_chunks": turn["relevant_chunks"] if turn["relevant_chunks"] else []
+    }
+    if turn["retrieval_query"] != query:
+        # Kept so conversation memory rebuilt from history rewrites later follow-ups the same way
+        message["topic"] = turn["retrieval_query"]
+    chat_store.append(chat_id, message)
+    
+    return {
+        "answer": answer,
+        "sources": sources,
+        "chat_id": chat_id
+    }
+
+# Concurrent identical questions over the same context share one model call
+answer_flight = SingleFlight()
+# Every single-flight group in this process, by serving mode; the asyncio server adds its own
+coalescing_flights = {"thread": answer_flight}
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", "60"))
+
+# Answer built from the retrieved chunks when the model is unavailable or too slow
+def fallback_answer(turn, reason):
+    extracted = extractive_answer(turn["retrieval_query"], turn["relevant_chunks"])
+    if extracted is None:
+        return API_ERROR_ANSWER, API_ERROR_SOURCES, False
+    logger.warning(f"Answering extractively: {reason}")
+    return extracted[0], extracted[1], False
+
+# One model API call; hedged and retried attempts are each timed and counted
+def call_model(turn):
+    start = time.perf_counter()
+    try:
+        message = get_client().messages.create(
+            model=ANTHROPIC_MODEL,
+            max_tokens=MAX_ANSWER_TOKENS,
+            temperature=0,
+            system=turn["system_prompt"],
+            messages=[
+                {"role": "user", "content": turn["user_prompt"]}
+            ]
+        )
+    except Exception:
+        LLM_CALLS.inc(mode="create", outcome="error")
+        raise
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="model")
+    LLM_CALLS.inc(mode="create", outcome="success")
+    return message
+
+# Call the Anthropic API for a prepared turn within the latency budget; returns (answer, sources, from_api)
+def generate_answer(turn):
+    if not llm_breaker.allow():
+        return fallback_answer(turn, "circuit breaker open")
+    try:
+        logger.info("Calling Anthropic API...")
+        message = hedged_call(guarded(llm_breaker, lambda: call_model(turn)), llm_executor, LLM_LATENCY_BUDGET,
+                              hedge_delay=LLM_HEDGE_DELAY, max_attempts=LLM_MAX_ATTEMPTS, breaker=llm_breaker)
+        logger.info("Successfully received response from Anthropic API")
+        log_usage(message.usage)
+        return message.content[0].text, turn["sources"], True
+    except TimeoutError:
+        return fallback_answer(turn, f"no response within {LLM_LATENCY_BUDGET:.0f}s")
+    except Exception as api_error:
+        logger.error(f"Anthropic API error: {str(api_error)}")
+        return fallback_answer(turn, "API error")
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    try:
+        chat_id, query, follow_up_to, error = begin_chat_turn(request.json)
+        if error:
+            return error
+        
+        response_data = answer_without_model(chat_id, query, follow_up_to)
+        if response_data:
+            with STAGE_SECONDS.time(stage="serialize"):
+                return jsonify(response_data)
+        
+        # No predefined answer, use Anthropic API
+        if not ready.is_set():
+            return not_ready_response(chat_id)
+        
+        turn = prepare_model_turn(query, chat_id)
+        
+        if turn["cached"]:
+            answer = turn["cached"]["answer"]
+            sources = turn["cached"]["sources"]
+            from_api = False
+            shared = False
+            logger.info(f"Using cached answer (similarity {turn['cached']['similarity']:.3f})")
+        else:
+            key = coalescing_key(query, turn["answer_context"])
+            try:
+                (answer, sources, from_api), shared = answer_flight.do(
+                    key, lambda: generate_answer(turn), timeout=COALESCE_WAIT_TIMEOUT)
+            except TimeoutError:
+                logger.warning("Timed out waiting for an identical in-flight request, calling the API directly")
+                (answer, sources, from_api), shared = generate_answer(turn), False
+            if shared:
+                # Only the leader stores the answer in the cache
+                from_api = False
+                logger.info("Shared the answer of an identical in-flight request")
+        
+        response_data = finish_model_turn(chat_id, query, turn, answer, sources, from_api, shared=shared)
+        logger.info("Sending response to client")
+        with STAGE_SECONDS.time(stage="serialize"):
+            return jsonify(response_data)
     
     except Exception as e:
         import traceback
@@ -708,44 +1057,261 @@ If this is not related to North American University, politely inform them that y
         logger.error(traceback.format_exc())
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+# Format one Server-Sent Events message
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Streaming variant of /api/chat: emits "sources", then "delta" events as text arrives, then "done"
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    try:
+        chat_id, query, follow_up_to, error = begin_chat_turn(request.json)
+        if error:
+            return error
+        
+        response_data = answer_without_model(chat_id, query, follow_up_to)
+        if response_data:
+            def generate_predefined():
+                yield sse_event("sources", {"sources": response_data["sources"], "chat_id": chat_id})
+                yield sse_event("delta", {"text": response_data["answer"]})
+                yield sse_event("done", response_data)
+            return sse_response(generate_predefined())
+        
+        if not ready.is_set():
+            return not_ready_response(chat_id)
+        
+        turn = prepare_model_turn(query, chat_id)
+    except Exception as e:
+        import traceback
+        logger.error(f"Error processing query: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+    
+    def generate():
+        yield sse_event("sources", {"sources": turn["sources"], "chat_id": chat_id})
+        
+        if turn["cached"]:
+            logger.info(f"Using cached answer (similarity {turn['cached']['similarity']:.3f})")
+            yield sse_event("delta", {"text": turn["cached"]["answer"]})
+            response_data = finish_model_turn(chat_id, query, turn, turn["cached"]["answer"],
+                                              turn["cached"]["sources"], from_api=False)
+            yield sse_event("done", response_data)
+            return
+        
+        # Join an identical request that is already streaming; its answer arrives in one piece
+        key = coalescing_key(query, turn["answer_context"])
+        call, leader = answer_flight.acquire(key)
+        if not leader:
+            try:
+                answer, sources, _ = call.wait(COALESCE_WAIT_TIMEOUT)
+                logger.info("Shared the answer of an identical in-flight request")
+                yield sse_event("delta", {"text": answer})
+                yield sse_event("done", finish_model_turn(chat_id, query, turn, answer, sources, from_api=False,
+                                                          shared=True))
+                return
+            except Exception as e:
+                logger.warning(f"Coalesced request failed ({str(e) or type(e).__name__}), streaming directly")
+        
+        parts = []
+        result = None
+        try:
+            if not llm_breaker.allow():
+                result = fallback_answer(turn, "circuit breaker open")
+                yield sse_event("delta", {"text": result[0]})
+            else:
+                logger.info("Streaming from Anthropic API...")
+                start = time.monotonic()
+                first_token_seconds = None
+                try:
+                    with get_client().messages.stream(
+                        model=ANTHROPIC_MODEL,
+                        max_tokens=MAX_ANSWER_TOKENS,
+                        temperature=0,
+                        system=turn["system_prompt"],
+                        messages=[
+                            {"role": "user", "content": turn["user_prompt"]}
+                        ]
+                    ) as stream:
+                        for text in stream.text_stream:
+                            if first_token_seconds is None:
+                                first_token_seconds = time.monotonic() - start
+                                STAGE_SECONDS.observe(first_token_seconds, stage="model_first_token")
+                            parts.append(text)
+                            yield sse_event("delta", {"text": text})
+                        log_usage(stream.get_final_message().usage)
+                except Exception:
+                    llm_breaker.record_failure()
+                    LLM_CALLS.inc(mode="stream", outcome="error")
+                    raise
+                except BaseException:
+                    # The client went away mid-stream (GeneratorExit); judged by time to first token as above
+                    llm_breaker.abandon(first_token_seconds if first_token_seconds is not None
+                                        else time.monotonic() - start)
+                    raise
+                STAGE_SECONDS.observe(time.monotonic() - start, stage="model")
+                LLM_CALLS.inc(mode="stream", outcome="success")
+                # A stream is judged by its time to first token, since long answers legitimately take a while
+                llm_breaker.record_success(first_token_seconds or 0.0)
+                result = "".join(parts), turn["sources"], True
+                logger.info("Finished streaming response from Anthropic API")
+        except Exception as api_error:
+            logger.error(f"Anthropic API error while streaming: {str(api_error)}")
+            if parts:
+                # Keep what the student already saw rather than replacing it
+                result = "".join(parts), turn["sources"], False
+            else:
+                result = fallback_answer(turn, "API error")
+                yield sse_event("delta", {"text": result[0]})
+        finally:
+            if leader:
+                # Release followers even when this client disconnected mid-stream
+                answer_flight.complete(key, call, result=result,
+                                       error=None if result else RuntimeError("Leading stream ended early"))
+        
+        answer, sources, from_api = result
+        yield sse_event("done", finish_model_turn(chat_id, query, turn, answer, sources, from_api))
+    
+    return sse_response(generate())
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.route('/api/chats', methods=['GET'])
 def get_chats():
-    chats = []
-    for chat_id, messages in chat_history.items():
-        if messages:
-            user_messages = [msg for msg in messages if msg.get("role") == "user"]
-            if user_messages:
-                first_message = user_messages[0]["content"]
-                preview = first_message[:50] + "..." if len(first_message) > 50 else first_message
-                last_timestamp = messages[-1]["timestamp"]
-                chats.append({
-                    "id": chat_id,
-                    "preview": preview,
-                    "timestamp": last_timestamp
-                })
-    
-    # Sort by timestamp (newest first)
-    chats.sort(key=lambda x: x["timestamp"], reverse=True)
-    return jsonify(chats)
+    # Chats with at least one user message, newest first, a page at a time. The body stays a plain
+    # list; the cursor for the next page is sent in the X-Next-Cursor header
+    try:
+        limit = min(max(int(request.args.get('limit', CHATS_PAGE_SIZE)), 1), MAX_CHATS_PAGE_SIZE)
+        chats, next_cursor = chat_store.list_chats(limit=limit, cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    response = jsonify(chats)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    # The sidebar reloads after every message; an unchanged page costs a 304 and no body
+    return conditional_response(response, request, next_cursor)
 
 @app.route('/api/chats/<chat_id>', methods=['GET'])
 def get_chat(chat_id):
-    if chat_id in chat_history:
-        return jsonify(chat_history[chat_id])
-    return jsonify([])
+    return conditional_response(jsonify(chat_store.messages(chat_id) or []), request)
 
 @app.route('/api/chats/<chat_id>', methods=['DELETE'])
 def delete_chat(chat_id):
-    if chat_id in chat_history:
-        del chat_history[chat_id]
+    chat_store.delete(chat_id)
+    conversation_memory.forget(chat_id)
     return jsonify({"success": True})
 
 @app.route('/api/chats', methods=['POST'])
 def create_chat():
-    chat_id = f"chat_{int(time.time())}"
-    chat_history[chat_id] = []
+    chat_id = f"chat_{uuid.uuid4().hex}"
+    chat_store.create_chat(chat_id)
     return jsonify({"chat_id": chat_id})
 
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_knowledge_base():
+    if not is_admin_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    started = knowledge_base.reload_async(reason="admin request")
+    status = knowledge_base.status()
+    status["started"] = started
+    return jsonify(status), 202
+
+@app.route('/api/admin/knowledge-base', methods=['GET'])
+def knowledge_base_status():
+    status = knowledge_base.status()
+    snapshot = knowledge_base.current
+    if snapshot is not None and snapshot.duplicates is not None:
+        status["near_duplicates"] = snapshot.duplicates.stats()
+    status["precomputed_answers"] = precomputed_answers.stats()
+    status["faq"] = faq_catalog.stats()
+    return jsonify(status)
+
+@app.route('/api/admin/coalescing', methods=['GET'])
+def coalescing_status():
+    return jsonify(answer_flight.stats())
+
+@app.route('/api/admin/llm', methods=['GET'])
+def llm_status():
+    return jsonify({
+        "breaker": llm_breaker.stats(),
+        "latency_budget_seconds": LLM_LATENCY_BUDGET,
+        "hedge_delay_seconds": LLM_HEDGE_DELAY,
+        "max_attempts": LLM_MAX_ATTEMPTS,
+    })
+
+# Written by enhanced_scraper.py at the end of each run
+SCRAPER_METRICS_PATH = os.path.join(DATA_DIR, "scraper.prom")
+
+def cache_stats():
+    return {
+        "query_embedding": query_embedding_cache.stats(),
+        "answer": answer_cache.stats(),
+        "precomputed": precomputed_answers.stats(),
+        "chat_store": chat_store.stats(),
+    }
+
+def stats_by_label(stats, field):
+    return {(name,): values[field] for name, values in stats.items()}
+
+# State that components already track is read when /metrics is scraped instead of on every request
+CallbackMetric("nau_ready", "1 once the model and knowledge base are loaded", lambda: int(ready.is_set()))
+# Under a pre-fork server each scrape is answered by one worker; pss splits shared pages between the workers
+CallbackMetric("nau_process_memory_bytes", "Resident memory of the serving process: rss, pss and uss (unshared)",
+               lambda: {(kind,): value for kind, value in (process_memory() or {}).items()} or None,
+               labelnames=["kind"])
+CallbackMetric("nau_active_chats", "Chats held in the chat store's in-memory tier", lambda: chat_store.stats()["size"])
+CallbackMetric("nau_chat_store_pending_writes", "Chat store writes queued for the next batch",
+               lambda: chat_store.stats().get("pending_writes", 0))
+CallbackMetric("nau_knowledge_base_chunks", "Chunks in the active knowledge base snapshot",
+               lambda: len(knowledge_base.current.chunks) if knowledge_base.current is not None else None)
+CallbackMetric("nau_knowledge_base_reloads_total", "Knowledge base snapshots activated",
+               lambda: knowledge_base.reload_count, kind="counter")
+CallbackMetric("nau_faq_entries", "Entries in the FAQ catalog", lambda: len(faq_catalog))
+CallbackMetric("nau_faq_reloads_total", "FAQ files loaded", lambda: faq_catalog.reloads, kind="counter")
+CallbackMetric("nau_cache_hits_total", "Cache hits", lambda: stats_by_label(cache_stats(), "hits"),
+               kind="counter", labelnames=["cache"])
+CallbackMetric("nau_cache_misses_total", "Cache misses", lambda: stats_by_label(cache_stats(), "misses"),
+               kind="counter", labelnames=["cache"])
+CallbackMetric("nau_cache_entries", "Entries held in each cache", lambda: stats_by_label(cache_stats(), "size"),
+               labelnames=["cache"])
+CallbackMetric("nau_llm_breaker_state", "Model circuit breaker state: 0 closed, 1 half open, 2 open",
+               lambda: llm_breaker.stats()["state_code"])
+CallbackMetric("nau_llm_breaker_opened_total", "Times the model circuit breaker opened",
+               lambda: llm_breaker.stats()["times_opened"], kind="counter")
+CallbackMetric("nau_llm_breaker_rejected_total", "Model calls refused while the circuit breaker was open",
+               lambda: llm_breaker.stats()["rejected"], kind="counter")
+CallbackMetric("nau_coalescing_leaders_total", "Model answers generated for a coalescing group",
+               lambda: {(mode,): flight.stats()["leaders"] for mode, flight in coalescing_flights.items()},
+               kind="counter", labelnames=["mode"])
+CallbackMetric("nau_coalescing_followers_total", "Requests that shared an identical in-flight answer",
+               lambda: {(mode,): flight.stats()["coalesced"] for mode, flight in coalescing_flights.items()},
+               kind="counter", labelnames=["mode"])
+CallbackMetric("nau_coalescing_in_flight", "Coalescing groups waiting for an answer",
+               lambda: {(mode,): flight.stats()["in_flight"] for mode, flight in coalescing_flights.items()},
+               labelnames=["mode"])
+
+@app.route('/metrics')
+def metrics():
+    body = REGISTRY.render()
+    # The scraper is a separate batch process; its last run is exposed alongside the server's metrics
+    try:
+        with open(SCRAPER_METRICS_PATH, "r", encoding="utf-8") as f:
+            body += f.read()
+    except OSError:
+        pass
+    return Response(body, content_type=CONTENT_TYPE)
+
+# STARTUP_MODE=eager restores blocking initialization at import (e.g. for serverless runtimes). It runs
+# last, once everything startup touches (the model client settings, the breaker, the routes) is defined
+if os.getenv("STARTUP_MODE", "background") == "eager":
+    initialize()
+
 if __name__ == '__main__':
     logger.info("Starting North American University AI Assistant")
+    # With the debug reloader only the child process serves requests, so only it loads the model
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_init()
     app.run(debug=True, port=5000)
\ No newline at end of file
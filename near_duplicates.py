@@ -0,0 +1,167 @@
+import hashlib
+import numpy as np
+
+from lexical_index import tokenize, document_key
+
+SIGNATURE_BITS = 64
+_BIT_SHIFTS = np.arange(SIGNATURE_BITS, dtype=np.uint64)
+
+
+def _shingle_hashes(text, shingle_size):
+    tokens = tokenize(text)
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)] if tokens else []
+    else:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    return np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                     for s in shingles], dtype=np.uint64)
+
+
+# 64-bit SimHash over word shingles: each output bit is the majority vote of that bit across shingle hashes
+def simhash(text, shingle_size=2):
+    hashes = _shingle_hashes(text, shingle_size)
+    if not hashes.size:
+        return 0
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(hashes)
+    return int(np.sum(np.uint64(1) << _BIT_SHIFTS[votes > 0], dtype=np.uint64))
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # The earlier chunk stays the representative, so clusters are stable across rebuilds
+            self.parent[max(a, b)] = min(a, b)
+
+
+class DuplicateIndex:
+    """SimHash signatures for every chunk, grouped into near-duplicate clusters.
+
+    Two chunks are near-duplicates when their signatures differ in at most
+    `max_distance` bits. Candidate pairs come from splitting the signature into
+    `max_distance + 1` bands: by pigeonhole, any such pair agrees exactly on at
+    least one band, so bucketing by band finds all of them without comparing
+    every pair. Each cluster is represented by its first chunk in corpus order.
+    """
+
+    def __init__(self, keys, signatures, max_distance=6, shingle_size=2):
+        self.keys = keys
+        self.signatures = signatures
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.representatives = self._cluster()
+        self._signature_by_key = None
+
+    @classmethod
+    def from_chunks(cls, chunks, previous=None, max_distance=6, shingle_size=2):
+        # Signatures depend only on chunk text, so a rebuild reuses the previous snapshot's
+        known = {}
+        if previous is not None and previous.shingle_size == shingle_size:
+            known = previous.signature_by_key()
+        keys = [document_key(chunk["content"]) for chunk in chunks]
+        signatures = [known[key] if key in known else simhash(chunk["content"], shingle_size)
+                      for key, chunk in zip(keys, chunks)]
+        return cls(keys, signatures, max_distance=max_distance, shingle_size=shingle_size)
+
+    def signature_by_key(self):
+        if self._signature_by_key is None:
+            self._signature_by_key = dict(zip(self.keys, self.signatures))
+        return self._signature_by_key
+
+    def _cluster(self):
+        count = len(self.signatures)
+        union_find = _UnionFind(count)
+        bands = self.max_distance + 1
+        band_bits = SIGNATURE_BITS // bands
+        mask = (1 << band_bits) - 1
+        for band in range(bands):
+            shift = band * band_bits
+            buckets = {}
+            for position, signature in enumerate(self.signatures):
+                buckets.setdefault((signature >> shift) & mask, []).append(position)
+            for members in buckets.values():
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        if hamming_distance(self.signatures[first], self.signatures[second]) <= self.max_distance:
+                            union_find.union(first, second)
+        return np.array([union_find.find(i) for i in range(count)], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @property
+    def duplicate_count(self):
+        return int(np.count_nonzero(self.representatives != np.arange(len(self.representatives))))
+
+    # Corpus positions of one chunk per cluster, in corpus order
+    def representative_positions(self):
+        return np.flatnonzero(self.representatives == np.arange(len(self.representatives)))
+
+    # Cluster of each position, named by its representative's position
+    def clusters_of(self, positions):
+        return self.representatives[np.asarray(positions, dtype=np.int64)]
+
+    # Keep the first (best ranked) hit of each cluster and drop later hits on its near-copies. The hit
+    # itself is kept, not its representative: near-copies can differ in exactly the token that matched
+    def collapse(self, positions, scores=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        seen = set()
+        keep = []
+        for i, cluster in enumerate(self.clusters_of(positions).tolist()):
+            if cluster not in seen:
+                seen.add(cluster)
+                keep.append(i)
+        collapsed = positions[keep]
+        if scores is None:
+            return collapsed
+        return collapsed, np.asarray(scores)[keep]
+
+    def stats(self):
+        count = len(self.representatives)
+        cluster_sizes = np.bincount(self.representatives, minlength=count) if count else np.zeros(0, np.int64)
+        duplicates = self.duplicate_count
+        return {
+            "chunks": count,
+            "clusters": count - duplicates,
+            "duplicate_chunks": duplicates,
+            "duplicate_clusters": int(np.count_nonzero(cluster_sizes > 1)),
+            "largest_cluster": int(cluster_sizes.max()) if count else 0,
+            "reduction": duplicates / count if count else 0.0,
+        }
+
+
+class RepresentativeIndex:
+    """Wraps a search index built over cluster representatives so results are corpus positions."""
+
+    def __init__(self, index, positions):
+        self.index = index
+        self.positions = np.asarray(positions, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, query_embedding, top_k=5):
+        indices, scores = self.index.search(query_embedding, top_k)
+        return self.positions[indices], scores
+
+    # Padding (index -1, see IVFIndex.search_batch) stays -1 rather than mapping to the last position
+    def search_batch(self, query_embeddings, top_k=5):
+        indices, scores = self.index.search_batch(query_embeddings, top_k)
+        return np.where(indices >= 0, self.positions[indices], -1), scores
@@ -0,0 +1,253 @@
+"""Precompute model answers for the most frequent questions in the query log.
+
+    python precompute_answers.py --log assistant.log --top 200 --min-count 2
+
+Questions are mined from the "Received chat request" lines the server logs,
+grouped by their normalized form and ranked by how many chats asked them. Each
+one is answered through the same retrieval and prompt path as a live request,
+against the current knowledge-base version, and the results are written to
+data/precomputed_answers.json. The server loads that file at startup and serves
+a matching question from it without calling the API. Entries are tied to the
+knowledge-base version and to the retrieved context, so after a refresh the job
+has to run again (auto_update.py does this after every scrape); answers whose
+context did not change are carried over instead of being regenerated.
+"""
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from caching import normalize_query
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+ANSWER_STORE_PATH = os.path.join(DATA_DIR, "precomputed_answers.json")
+STORE_FORMAT = 1
+
+LOG_LINE = re.compile(r"Received chat request - chat_id: (?P<chat_id>.*?), query: (?P<query>.*), "
+                      r"follow_up_to: (?P<follow_up_to>\S+)\s*$")
+
+
+# Exact-match key for a question: normalized, without trailing punctuation
+def answer_key(query):
+    return normalize_query(query).rstrip("?!. ")
+
+
+# Most frequent questions in the logs as [(query, chats asking it)], best first. Replies to
+# FAQ follow-ups are skipped; the most common spelling of each question is kept.
+def mine_queries(log_paths, top=200, min_count=2):
+    chats = defaultdict(set)
+    spellings = defaultdict(Counter)
+    for path in log_paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = LOG_LINE.search(line)
+                if match is None or match.group("follow_up_to") != "None":
+                    continue
+                query = match.group("query").strip()
+                key = answer_key(query)
+                if not key:
+                    continue
+                chats[key].add(match.group("chat_id"))
+                spellings[key][query] += 1
+    ranked = sorted(chats, key=lambda key: (-len(chats[key]), key))
+    return [(spellings[key].most_common(1)[0][0], len(chats[key]))
+            for key in ranked[:top] if len(chats[key]) >= min_count]
+
+
+def write_answer_store(path, version, model, answers):
+    payload = {
+        "format": STORE_FORMAT,
+        "knowledge_base_version": version,
+        "model": model,
+        "created_at": time.time(),
+        "answers": answers,
+    }
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class PrecomputedAnswers:
+    """Read side of the answer store, reloaded when the file changes.
+
+    An answer is served only for the knowledge-base version it was generated
+    against and only if the live request retrieved the same context, so a stale
+    file or a change in retrieval settings falls back to the model instead of
+    returning an outdated answer.
+    """
+
+    def __init__(self, path=ANSWER_STORE_PATH, check_interval=30.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self.version = None
+        self.model = None
+        self.created_at = None
+        self._answers = {}
+        self._mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._answers)
+
+    # Register a callback invoked with the store after new answers are loaded
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    # Load the file if it changed since the last load; returns True if new answers were loaded
+    def refresh(self):
+        with self._lock:
+            self._checked_at = self.clock()
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            if mtime is None:
+                self.version, self.model, self.created_at, self._answers = None, None, None, {}
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    payload = json.load(f)
+                if payload.get("format") != STORE_FORMAT:
+                    raise ValueError(f"unsupported format {payload.get('format')}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring precomputed answers in {self.path}: {str(e)}")
+                return False
+            self.version = payload["knowledge_base_version"]
+            self.model = payload.get("model")
+            self.created_at = payload.get("created_at")
+            self._answers = payload["answers"]
+        logger.info(f"Loaded {len(self._answers)} precomputed answers for knowledge base {str(self.version)[:12]}")
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Precomputed answers listener failed: {str(e)}")
+        return True
+
+    def lookup(self, query, context, version):
+        if self._checked_at is None or self.clock() - self._checked_at >= self.check_interval:
+            self.refresh()
+        entry = self._answers.get(answer_key(query)) if version == self.version else None
+        if entry is None or entry["context_hash"] != context:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"answer": entry["answer"], "sources": list(entry["sources"]), "similarity": 1.0, "precomputed": True}
+
+    # The stored answer to `query` if `model` generated it from the same retrieved context, whichever
+    # knowledge-base version it was stored for: a refresh that left the question's chunks alone leaves
+    # its answer valid too
+    def carry_over(self, query, context, model):
+        if self._checked_at is None:
+            self.refresh()
+        entry = self._answers.get(answer_key(query))
+        if entry is None or entry["context_hash"] != context or self.model != model:
+            return None
+        return {"answer": entry["answer"], "sources": list(entry["sources"])}
+
+    # Entries valid for `version`, as (query, context hash, answer, sources)
+    def entries(self, version):
+        if version != self.version:
+            return []
+        return [(entry["query"], entry["context_hash"], entry["answer"], entry["sources"])
+                for entry in self._answers.values()]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": len(self._answers),
+            "knowledge_base_version": self.version,
+            "created_at": self.created_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute answers for the most frequent logged questions")
+    parser.add_argument("--log", nargs="+", default=["assistant.log"], help="Server logs to mine")
+    parser.add_argument("--top", type=int, default=200, help="Number of questions to precompute")
+    parser.add_argument("--min-count", type=int, default=2, help="Minimum number of chats that asked a question")
+    parser.add_argument("--output", default=ANSWER_STORE_PATH)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent model calls")
+    parser.add_argument("--force", action="store_true", help="Regenerate answers whose context did not change")
+    args = parser.parse_args()
+
+    # The app module is imported for its retrieval and prompt path only. With logging configured first it
+    # leaves the server log this job reads alone, and with chats kept in memory, the chat database
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    os.environ["PRECOMPUTED_ANSWERS_PATH"] = args.output
+    os.environ["CHAT_STORE"] = "memory"
+    os.environ["STARTUP_MODE"] = "background"
+    import nau_assistant_final as assistant
+    from conversation_memory import FOLLOW_UP_CUES
+
+    queries = mine_queries(args.log, top=args.top, min_count=args.min_count)
+    logger.info(f"Mined {len(queries)} frequent questions from {', '.join(args.log)}")
+
+    snapshot = assistant.knowledge_base.load()
+    if snapshot is None:
+        raise SystemExit(f"Knowledge base failed to load: {assistant.knowledge_base.last_error}")
+
+    # FAQ questions are already answered without the model, and questions that lean on an
+    # earlier turn have no standalone answer
+    candidates = [(query, count) for query, count in queries
+                  if not assistant.get_predefined_answer(query) and not FOLLOW_UP_CUES.search(query)]
+
+    def precompute(item):
+        query, count = item
+        turn = assistant.prepare_model_turn(query)
+        # Carry over the previous answer if it was generated from the same context, even by an earlier
+        # knowledge-base version: a scrape usually leaves most chunks unchanged
+        cached = None if args.force else assistant.precomputed_answers.carry_over(query, turn["answer_context"],
+                                                                                assistant.ANTHROPIC_MODEL)
+        if cached:
+            status = "reused"
+            answer, sources = cached["answer"], cached["sources"]
+        else:
+            status = "generated"
+            answer, sources, from_api = assistant.generate_answer(turn)
+            if not from_api:
+                # Fallback answers are only for when the model is unavailable; never persist them
+                return "failed", None
+        return status, (answer_key(query), {
+            "query": query,
+            "count": count,
+            "context_hash": turn["answer_context"],
+            "answer": answer,
+            "sources": sources,
+        })
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        outcomes = list(executor.map(precompute, candidates))
+    counters = Counter(status for status, _ in outcomes)
+    results = [result for _, result in outcomes if result]
+
+    write_answer_store(args.output, snapshot.version, assistant.ANTHROPIC_MODEL, dict(results))
+    logger.info(f"Wrote {len(results)} precomputed answers to {args.output} "
+                f"({counters['generated']} generated, {counters['reused']} reused, {counters['failed']} failed; "
+                f"{len(queries) - len(candidates)} answered by the FAQ or context-dependent)")
+    if counters["failed"] and not results:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
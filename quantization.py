@@ -0,0 +1,149 @@
+import logging
+import numpy as np
+
+from search_engine import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per block when widening int8 codes, so scoring never materializes a float copy of the corpus
+SCORE_BLOCK_ROWS = 8192
+
+if hasattr(np, "bitwise_count"):
+    def popcount(values):
+        return np.bitwise_count(values)
+else:  # numpy < 2.0
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+class QuantizedIndex:
+    """Shared candidate/re-rank logic for compressed indexes.
+
+    The compressed codes stay resident; the float vectors are only fetched through
+    `float_loader` when a query needs re-ranking. With the memory-mapped store that
+    means only the candidate rows are ever paged in. When the codes cover a subset
+    of those vectors, `float_rows` gives the float row of each code row.
+    """
+
+    backend = None
+
+    def __init__(self, embeddings, float_loader=None, float_rows=None, rerank_factor=4, min_candidates=0,
+                 normalized=False):
+        matrix = embeddings if normalized else normalize_rows(embeddings)
+        self.count, self.dimension = matrix.shape
+        self.rerank_factor = rerank_factor
+        self.min_candidates = min_candidates
+        self._float_loader = float_loader
+        self._float_vectors = None
+        self._float_rows = None if float_rows is None else np.asarray(float_rows, dtype=np.int64)
+        self.quantize(matrix)
+
+    def __len__(self):
+        return self.count
+
+    def set_search_params(self, rerank_factor=None, **params):
+        if rerank_factor is not None:
+            self.rerank_factor = rerank_factor
+
+    @property
+    def float_vectors(self):
+        if self._float_vectors is None and self._float_loader is not None:
+            self._float_vectors = self._float_loader()
+        return self._float_vectors
+
+    def candidate_count(self, top_k):
+        return min(self.count, max(top_k * self.rerank_factor, self.min_candidates, top_k))
+
+    def search(self, query_embedding, top_k=5):
+        query = normalize_rows(query_embedding)[0]
+        top_k = min(top_k, self.count)
+        candidates = self.candidates(query, self.candidate_count(top_k))
+        vectors = self.float_vectors
+        if vectors is None or self.rerank_factor <= 0:
+            scores = self.approximate_scores(query, candidates)
+        else:
+            # Exact re-scoring of the short list with the original float vectors
+            order = np.sort(candidates)
+            rows = order if self._float_rows is None else self._float_rows[order]
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+            candidates = order
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best].astype(np.float32)
+
+    def search_batch(self, query_embeddings, top_k=5):
+        results = [self.search(query, top_k) for query in normalize_rows(query_embeddings)]
+        indices = np.array([indices for indices, _ in results], dtype=np.int64).reshape(len(results), -1)
+        scores = np.array([scores for _, scores in results], dtype=np.float32).reshape(len(results), -1)
+        return indices, scores
+
+    # Resident size of the compressed codes; float vectors are paged in on demand and not counted
+    def memory_bytes(self):
+        return self.codes.nbytes
+
+
+class Int8Index(QuantizedIndex):
+    """Symmetric per-dimension int8 scalar quantization (4x smaller than float32)."""
+
+    backend = "int8"
+
+    def quantize(self, matrix):
+        max_abs = np.abs(matrix).max(axis=0) if self.count else np.ones(self.dimension, np.float32)
+        self.scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        self.codes = np.clip(np.rint(matrix / self.scales), -127, 127).astype(np.int8)
+
+    def _scores(self, query, rows=None):
+        weighted = query * self.scales
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            scores[start:end] = codes[start:end].astype(np.float32) @ weighted
+        return scores
+
+    def candidates(self, query, count):
+        return top_k_indices(self._scores(query), count)
+
+    def approximate_scores(self, query, rows):
+        return self._scores(query, rows)
+
+    def memory_bytes(self):
+        return super().memory_bytes() + self.scales.nbytes
+
+
+class BinaryIndex(QuantizedIndex):
+    """1-bit sign quantization with Hamming-distance pre-filtering (32x smaller than float32)."""
+
+    backend = "binary"
+
+    def quantize(self, matrix):
+        self.codes = np.packbits(matrix > 0, axis=1)
+
+    def _hamming(self, query, rows=None):
+        packed = np.packbits(query > 0)
+        codes = self.codes if rows is None else self.codes[rows]
+        return popcount(np.bitwise_xor(codes, packed)).sum(axis=1, dtype=np.int32)
+
+    def candidates(self, query, count):
+        return top_k_indices(-self._hamming(query).astype(np.float32), count)
+
+    # Without float vectors, map Hamming distance onto the cosine of the angle it estimates
+    def approximate_scores(self, query, rows):
+        return np.cos(np.pi * self._hamming(query, rows) / self.dimension).astype(np.float32)
+
+
+QUANTIZERS = {
+    Int8Index.backend: Int8Index,
+    BinaryIndex.backend: BinaryIndex,
+}
+
+
+def build_quantized_index(kind, embeddings, **params):
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization mode: {kind}")
+    index = QUANTIZERS[kind](embeddings, **params)
+    float_bytes = index.count * index.dimension * 4
+    logger.info(f"Built {kind} index: {index.memory_bytes() / 1e6:.2f} MB resident "
+                f"vs {float_bytes / 1e6:.2f} MB for float32 ({float_bytes / max(index.memory_bytes(), 1):.1f}x smaller)")
+    return index
@@ -0,0 +1,113 @@
+import math
+import logging
+import threading
+import numpy as np
+
+from lexical_index import tokenize
+from search_engine import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class LexicalOverlapScorer:
+    """Blend of first-stage cosine similarity and the share of query terms found in the chunk."""
+
+    name = "overlap"
+
+    def __init__(self, similarity_weight=0.6):
+        self.similarity_weight = similarity_weight
+
+    def score(self, query, candidates):
+        query_terms = set(tokenize(query))
+        scores = []
+        for candidate in candidates:
+            if query_terms:
+                overlap = len(query_terms.intersection(tokenize(candidate["content"]))) / len(query_terms)
+            else:
+                overlap = 0.0
+            similarity = max(candidate.get("similarity", 0.0), 0.0)
+            scores.append(self.similarity_weight * similarity + (1 - self.similarity_weight) * overlap)
+        return np.array(scores, dtype=np.float32)
+
+
+class CrossEncoderScorer:
+    """Scores (query, chunk) pairs jointly with a sentence-transformers cross-encoder, loaded on first use."""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", max_length=256):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    def score(self, query, candidates):
+        if not candidates:
+            return np.empty(0, dtype=np.float32)
+        logits = self.model.predict([(query, candidate["content"]) for candidate in candidates])
+        # Squash logits into [0, 1] so the minimum score and MMR weights mean the same thing for every scorer
+        return np.array([1 / (1 + math.exp(-float(logit))) for logit in logits], dtype=np.float32)
+
+
+class Reranker:
+    """Second retrieval stage: rescore a wide candidate list and keep what fits the context budget.
+
+    Candidates are picked greedily by maximal marginal relevance, so a chunk that
+    mostly repeats one already selected loses to a slightly less relevant but new
+    one. Selection stops at `max_chunks` or when the next chunk would push the
+    context past `char_budget`.
+    """
+
+    def __init__(self, scorer, mmr_lambda=0.7, char_budget=3000, max_chunks=5, min_score=0.0):
+        self.scorer = scorer
+        self.mmr_lambda = mmr_lambda
+        self.char_budget = char_budget
+        self.max_chunks = max_chunks
+        self.min_score = min_score
+
+    def rerank(self, query, candidates, vectors=None):
+        if not candidates:
+            return []
+        relevance = self.scorer.score(query, candidates)
+
+        redundancy = None
+        if vectors is not None and self.mmr_lambda < 1 and all("chunk_index" in c for c in candidates):
+            rows = normalize_rows(np.asarray([vectors[c["chunk_index"]] for c in candidates], dtype=np.float32))
+            redundancy = rows @ rows.T
+
+        selected = []
+        used_chars = 0
+        remaining = [i for i in range(len(candidates)) if relevance[i] >= self.min_score]
+        max_similarity = np.zeros(len(candidates), dtype=np.float32)
+        while remaining and len(selected) < self.max_chunks:
+            if redundancy is None:
+                mmr = relevance[remaining]
+            else:
+                mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * max_similarity[remaining]
+            best = remaining.pop(int(np.argmax(mmr)))
+            length = len(candidates[best]["content"])
+            if selected and used_chars + length > self.char_budget:
+                continue
+            used_chars += length
+            selected.append(dict(candidates[best], rerank_score=float(relevance[best])))
+            if redundancy is not None:
+                max_similarity = np.maximum(max_similarity, redundancy[best])
+        return selected
+
+
+def build_reranker(mode, cross_encoder_model=None, **params):
+    if mode == "overlap":
+        return Reranker(LexicalOverlapScorer(), **params)
+    if mode == "cross-encoder":
+        scorer = CrossEncoderScorer(cross_encoder_model) if cross_encoder_model else CrossEncoderScorer()
+        return Reranker(scorer, **params)
+    raise ValueError(f"Unknown rerank mode: {mode}")
@@ -0,0 +1,213 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from context_assembly import split_sentences
+from lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated failures or slow calls.
+
+    closed: calls go through; `failure_threshold` consecutive failures (a call
+    slower than `slow_call_seconds` counts as one) open the breaker.
+    open: calls are refused until `reset_timeout` has passed.
+    half_open: one probe call is let through; its outcome closes or re-opens it.
+    A probe that ends without an outcome (see `abandon`), or has not reported
+    one after `reset_timeout`, is given up and the next call probes instead.
+    """
+
+    STATE_CODES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold=5, slow_call_seconds=15.0, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.probe_started_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self.successes = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and (not self.probe_in_flight or
+                                              self.clock() - self.probe_started_at >= self.reset_timeout):
+                self.probe_in_flight = True
+                self.probe_started_at = self.clock()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, duration=0.0):
+        if duration > self.slow_call_seconds:
+            with self._lock:
+                self.slow_calls += 1
+            self.record_failure()
+            return
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != "closed":
+                logger.info("Circuit breaker closed")
+            self.state = "closed"
+            self.probe_in_flight = False
+
+    # An allowed call that ended without an outcome: cancelled, or its client went away. One that had
+    # already run longer than `slow_call_seconds` counts as a slow call; otherwise it only frees the probe
+    def abandon(self, duration=0.0):
+        if duration > self.slow_call_seconds:
+            with self._lock:
+                self.slow_calls += 1
+            self.record_failure()
+            return
+        with self._lock:
+            if self.state == "half_open":
+                self.probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = self.clock()
+                self.probe_in_flight = False
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker opened after {self.consecutive_failures} consecutive failures")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "state_code": self.STATE_CODES[self.state],
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "successes": self.successes,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+            }
+
+
+# Run fn under a breaker, recording its outcome and duration
+def guarded(breaker, fn):
+    def call():
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success(time.monotonic() - start)
+        return result
+    return call
+
+
+def _hedge_allowed(breaker):
+    return breaker is None or breaker.state == "closed"
+
+
+# Call fn within `budget` seconds. A failed attempt is retried; if `hedge_delay` is set, another
+# attempt also starts whenever the running ones have taken that long. The first success wins.
+def hedged_call(fn, executor, budget, hedge_delay=None, max_attempts=2, breaker=None):
+    start = time.monotonic()
+    deadline = start + budget
+    pending = {executor.submit(fn)}
+    attempts = 1
+    last_error = None
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        next_hedge = start + hedge_delay * attempts if hedge_delay and attempts < max_attempts else deadline
+        done, pending = wait(pending, timeout=min(deadline, next_hedge) - now, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            last_error = future.exception()
+        # Attempts that lose the race keep running on the executor; the client timeout bounds them
+        if (not pending or hedge_delay and time.monotonic() >= next_hedge) and attempts < max_attempts and _hedge_allowed(breaker):
+            logger.info("Retrying model call" if not pending else f"Hedging model call after {hedge_delay:.1f}s")
+            pending.add(executor.submit(fn))
+            attempts += 1
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"No model response within the {budget:.1f}s latency budget")
+
+
+async def async_hedged_call(coroutine_fn, budget, hedge_delay=None, max_attempts=2, breaker=None):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + budget
+    pending = {asyncio.ensure_future(coroutine_fn())}
+    attempts = 1
+    last_error = None
+    try:
+        while pending:
+            now = loop.time()
+            if now >= deadline:
+                break
+            next_hedge = start + hedge_delay * attempts if hedge_delay and attempts < max_attempts else deadline
+            done, pending = await asyncio.wait(pending, timeout=min(deadline, next_hedge) - now,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            if (not pending or hedge_delay and loop.time() >= next_hedge) and attempts < max_attempts and _hedge_allowed(breaker):
+                logger.info("Retrying model call" if not pending else f"Hedging model call after {hedge_delay:.1f}s")
+                pending.add(asyncio.ensure_future(coroutine_fn()))
+                attempts += 1
+    finally:
+        # Unlike threads, attempts that lose the race can be cancelled
+        for task in pending:
+            task.cancel()
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"No model response within the {budget:.1f}s latency budget")
+
+
+EXTRACTIVE_INTRO = ("I'm having trouble generating a full answer right now, but here is what I found "
+                    "on the North American University website:")
+EXTRACTIVE_OUTRO = "You can find more details at the sources below. Let me know if you have any other questions!"
+
+
+# Answer from the retrieved chunks alone: the sentences sharing the most terms with the question,
+# in their original order. Returns (answer, sources), or None when nothing useful was retrieved.
+def extractive_answer(query, chunks, max_sentences=4, max_chunks=3, max_sentence_chars=400):
+    query_terms = set(tokenize(query))
+    scored = []
+    for rank, chunk in enumerate(chunks[:max_chunks]):
+        for order, sentence in enumerate(split_sentences(chunk["content"])):
+            if len(sentence) > max_sentence_chars:
+                sentence = sentence[:max_sentence_chars].rsplit(" ", 1)[0] + "..."
+            overlap = len(query_terms.intersection(tokenize(sentence))) / len(query_terms) if query_terms else 0.0
+            scored.append((overlap, rank, order, sentence, chunk.get("source", "https://www.na.edu")))
+    if not scored:
+        return None
+
+    # Best overlap first, preferring better-ranked chunks on ties; sentences sharing no terms are dropped
+    best = sorted((item for item in scored if item[0] > 0), key=lambda item: (-item[0], item[1], item[2]))
+    best = best[:max_sentences] or [item for item in scored if item[1] == 0][:max_sentences]
+    best.sort(key=lambda item: (item[1], item[2]))
+
+    sources = list(dict.fromkeys(item[4] for item in best))
+    lines = "\n".join(f"- {item[3]}" for item in best)
+    return f"{EXTRACTIVE_INTRO}\n\n{lines}\n\n{EXTRACTIVE_OUTRO}", sources
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+# Normalize rows to unit length so cosine similarity becomes a plain dot product
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+# Return the indices of the top_k largest scores, best first, without a full sort
+def top_k_indices(scores, top_k):
+    n = scores.shape[-1]
+    if top_k <= 0 or n == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    top_k = min(top_k, n)
+    if top_k < n:
+        candidates = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape[:-1] + (n,))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class VectorSearchEngine:
+    """Exact cosine-similarity search over a corpus normalized once at load time."""
+
+    def __init__(self, embeddings, normalized=False):
+        if normalized:
+            self.matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        else:
+            self.matrix = normalize_rows(embeddings)
+        if self.matrix.ndim != 2:
+            raise ValueError("Embeddings must be a 2-D array")
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    # Search a single query vector, returning (indices, scores) ordered best first
+    def search(self, query_embedding, top_k=5):
+        query = normalize_rows(query_embedding)[0]
+        scores = self.matrix @ query
+        indices = top_k_indices(scores, top_k)
+        return indices, scores[indices]
+
+    # Search several query vectors with one matrix-matrix product
+    def search_batch(self, query_embeddings, top_k=5):
+        queries = normalize_rows(query_embeddings)
+        scores = queries @ self.matrix.T
+        indices = top_k_indices(scores, top_k)
+        return indices, np.take_along_axis(scores, indices, axis=1)
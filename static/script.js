@@ -23,12 +23,22 @@ userInput.addEventListener('keypress', (e) => {
 });
 
 // Functions
-async function loadChats() {
+// Chats come a page at a time; `cursor` (from X-Next-Cursor) appends the next page
+async function loadChats(cursor = null) {
     try {
-        const response = await fetch(`${API_URL}/chats`);
+        const url = cursor ? `${API_URL}/chats?cursor=${encodeURIComponent(cursor)}` : `${API_URL}/chats`;
+        const response = await fetch(url);
         const chats = await response.json();
+        const nextCursor = response.headers.get('X-Next-Cursor');
         
-        chatList.innerHTML = '';
+        if (cursor) {
+            const loadMore = document.getElementById('load-more-chats');
+            if (loadMore) {
+                loadMore.remove();
+            }
+        } else {
+            chatList.innerHTML = '';
+        }
         
         chats.forEach(chat => {
             const chatItem = document.createElement('div');
@@ -38,6 +48,15 @@ async function loadChats() {
             chatItem.addEventListener('click', () => loadChat(chat.id));
             chatList.appendChild(chatItem);
         });
+        
+        if (nextCursor) {
+            const loadMore = document.createElement('div');
+            loadMore.className = 'chat-item text-center text-muted';
+            loadMore.id = 'load-more-chats';
+            loadMore.textContent = 'Load more';
+            loadMore.addEventListener('click', () => loadChats(nextCursor));
+            chatList.appendChild(loadMore);
+        }
     } catch (error) {
         console.error('Error loading chats:', error);
     }
@@ -141,8 +160,8 @@ async function sendMessage() {
     messagesContainer.insertAdjacentHTML('beforeend', loadingHTML);
     
     try {
-        // Send message to API
-        const response = await fetch(`${API_URL}/chat`, {
+        // Stream the answer: sources arrive first, then text deltas, then the final message
+        const response = await fetch(`${API_URL}/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -153,25 +172,47 @@ async function sendMessage() {
             })
         });
         
-        // Remove loading message
-        document.getElementById(loadingId).remove();
+        if (!response.ok || !response.body) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
         
-        const data = await response.json();
+        let assistantMessage = null;
+        let answerText = '';
+        let sources = [];
         
-        // Add assistant message to UI
-        const assistantMessage = {
-            role: 'assistant',
-            content: data.answer,
-            sources: data.sources
-        };
-        renderMessage(assistantMessage);
+        await readEventStream(response, (event, data) => {
+            if (event === 'sources') {
+                sources = data.sources;
+            } else if (event === 'delta') {
+                answerText += data.text;
+                if (!assistantMessage) {
+                    // Replace the loading placeholder with the message being streamed
+                    document.getElementById(loadingId).remove();
+                    assistantMessage = renderMessage({ role: 'assistant', content: '' });
+                }
+                assistantMessage.querySelector('p').textContent = answerText;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            } else if (event === 'done') {
+                if (assistantMessage) {
+                    assistantMessage.remove();
+                } else {
+                    document.getElementById(loadingId).remove();
+                }
+                renderMessage({
+                    role: 'assistant',
+                    content: data.answer,
+                    sources: data.sources || sources
+                });
+            }
+        });
         
         // Update chat list
         loadChats();
     } catch (error) {
         console.error('Error sending message:', error);
         // Remove loading message
-        document.getElementById(loadingId).remove();
+        const loadingElement = document.getElementById(loadingId);
+        if (loadingElement) loadingElement.remove();
         
         // Add error message
         const errorHTML = `
@@ -185,6 +226,38 @@ async function sendMessage() {
     }
 }
 
+// Read a text/event-stream response body, calling onEvent(eventName, parsedData) per message
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
 function renderMessage(message) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${message.role}-message`;
@@ -226,4 +299,6 @@ function renderMessage(message) {
     
     // Scroll to bottom
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    
+    return messageDiv;
 }
\ No newline at end of file
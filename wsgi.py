@@ -0,0 +1,27 @@
+"""Production entry point for a pre-fork server.
+
+    gunicorn -c gunicorn.conf.py                     # Flask app on threaded workers
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py    # asgi_app on uvicorn workers
+
+Importing this module loads the embeddings model and the knowledge base. Under
+gunicorn's preload_app that happens once, in the master, and every worker
+forked from it shares those pages copy-on-write instead of loading its own
+copy. Each worker then starts what cannot cross a fork on its own: the API
+client's connections, the knowledge base watcher and the chat store writer
+(gunicorn.conf.py's post_fork hook).
+"""
+import gc
+import os
+
+import nau_assistant_final as assistant
+
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    from asgi_app import app as application
+else:
+    application = assistant.app
+
+assistant.load_resources()
+
+# Keep the collector away from everything loaded so far: a collection in a worker writes to the
+# header of every object it visits, which would copy the inherited pages into each worker
+gc.freeze()